@@ -1,9 +1,22 @@
 from __future__ import absolute_import, unicode_literals
 import os
+import sys
 from django.conf import settings
 from celery import Celery
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+
+def default_settings_module() -> str:
+    """Profile of a process started without DJANGO_SETTINGS_MODULE."""
+    # Imported by the package before wsgi.py or asgi.py run, so their
+    # profile is picked here too. manage.py sets app.settings first.
+    command = sys.argv[0] if sys.argv else ''
+    if os.path.basename(command) == 'celery' or command.endswith(
+            os.path.join('celery', '__main__.py')):
+        return 'app.settings_worker'
+    return 'app.settings_web'
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', default_settings_module())
 app = Celery('app')
 app.config_from_object("django.conf:settings", namespace='CELERY')
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
@@ -40,7 +40,6 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'debug_toolbar',
     'rest_framework',
     'rest_framework.authtoken',
     'core',
@@ -53,26 +52,64 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20
 }
 
-# Django Debug Toolbar settings
-INTERNAL_IPS = [
-    "127.0.0.1",
-]
-
-DEBUG_TOOLBAR_CONFIG = {
-    "SHOW_TOOLBAR_CALLBACK": lambda request: True,
-}
-
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware', # debug middleware
 ]
 
+# Django Debug Toolbar, development only
+DEBUG_TOOLBAR = DEBUG and bool(int(os.environ.get('DEBUG_TOOLBAR', '1')))
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
+INTERNAL_IPS = [
+    "127.0.0.1",
+]
+
+DEBUG_TOOLBAR_CONFIG = {
+    "SHOW_TOOLBAR_CALLBACK": lambda request: True,
+}
+
+# Sampling profiler, for requests with a signed X-Profile header
+# (manage.py profile_token) or this share of all requests
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_INTERVAL = 0.005
+PROFILING_TOKEN_MAX_AGE = 24 * 3600
+# Queries a view may make before an error is logged, by URL name
+QUERY_BUDGETS = {
+    'thumbnail:list-image': 6,
+    'thumbnail:export-image': 4,
+    'thumbnail:upload-image': 8,
+    'thumbnail:async-upload-image': 8,
+    'thumbnail:batch-upload-image': 8,
+    'thumbnail:create-link': 8,
+    'thumbnail:async-create-link': 8,
+    'thumbnail:retrieve-link': 2,
+    'thumbnail:thumbnail-notifications': 2,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -104,15 +141,35 @@ DATABASES = {
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASSWORD'),
         'HOST': os.environ.get('DB_HOST'),
+        # Keep connections open between requests/tasks (0 closes them)
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': bool(
+            int(os.environ.get('DB_CONN_HEALTH_CHECKS', '1'))),
     }
 }
 
+# Redis connection pools
+# The cache and direct Redis use (core.redis) share one pool of
+# REDIS_MAX_CONNECTIONS per process. Celery's broker and result backend
+# keep pools of their own with the same bound, so a process can hold up to
+# 3 * REDIS_MAX_CONNECTIONS connections, plus the notifications pub/sub
+# connection of each event loop.
+
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', '20'))
+REDIS_POOL_TIMEOUT = int(os.environ.get('REDIS_POOL_TIMEOUT', '5'))
+REDIS_HEALTH_CHECK_INTERVAL = int(
+    os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', '30'))
+
 # Cache 
 
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
         'LOCATION': os.environ.get('CACHE_LOCATION'),
+        'OPTIONS': {
+            # Bounds and timeouts are set by core.redis.get_redis_pool
+            'pool_class': 'core.redis.SharedConnectionPool',
+        },
     }
 }
 
@@ -120,6 +177,111 @@ CACHES = {
 
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND')
+CELERY_BROKER_POOL_LIMIT = REDIS_MAX_CONNECTIONS
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'max_connections': REDIS_MAX_CONNECTIONS,
+    'health_check_interval': REDIS_HEALTH_CHECK_INTERVAL,
+}
+CELERY_REDIS_MAX_CONNECTIONS = REDIS_MAX_CONNECTIONS
+CELERY_REDIS_BACKEND_HEALTH_CHECK_INTERVAL = REDIS_HEALTH_CHECK_INTERVAL
+# Tasks are fire-and-forget unless they ask for a result
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_RESULT_EXPIRES = int(os.environ.get('CELERY_RESULT_EXPIRES', '600'))
+# Compact payloads, JSON still accepted from older producers
+CELERY_TASK_SERIALIZER = os.environ.get('CELERY_TASK_SERIALIZER', 'msgpack')
+CELERY_RESULT_SERIALIZER = CELERY_TASK_SERIALIZER
+CELERY_ACCEPT_CONTENT = ['msgpack', 'json']
+# Per node queues, jobs of one image always go to the same node
+WORKER_NODE_QUEUES = [
+    queue for queue in os.environ.get('WORKER_NODE_QUEUES', '').split(',')
+    if queue]
+CELERY_TASK_ROUTES = ('thumbnail.routing.route_by_image',)
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-image-counts': {
+        'task': 'core.tasks.reconcile_image_counts',
+        'schedule': int(os.environ.get(
+            'IMAGE_COUNT_RECONCILE_INTERVAL', '3600')),
+    },
+    'submit-deferred-thumbnails': {
+        'task': 'thumbnail.tasks.submit_deferred_thumbnails',
+        'schedule': 10,
+    },
+    # Picks up jobs whose flush task got lost
+    'flush-thumbnail-batch': {
+        'task': 'thumbnail.tasks.flush_thumbnail_batch',
+        'schedule': 5,
+    },
+}
+
+# How long a submitted job blocks identical submissions (seconds)
+JOB_IN_FLIGHT_TIMEOUT = int(os.environ.get('JOB_IN_FLIGHT_TIMEOUT', '600'))
+
+# Upload admission control, 0 queue depth disables it
+ADMISSION_MAX_QUEUE_DEPTH = int(
+    os.environ.get('ADMISSION_MAX_QUEUE_DEPTH', '1000'))
+# Seconds jobs may wait in the queue
+ADMISSION_MAX_LAG = float(os.environ.get('ADMISSION_MAX_LAG', '60'))
+# Waiting jobs per user admitted while overloaded, plans can override
+ADMISSION_PENDING_JOBS = int(os.environ.get('ADMISSION_PENDING_JOBS', '10'))
+# 'reject' answers 429, 'defer' stores the image and processes it later
+ADMISSION_OVERLOAD_ACTION = os.environ.get(
+    'ADMISSION_OVERLOAD_ACTION', 'reject')
+ADMISSION_RETRY_AFTER = 30
+ADMISSION_PROBE_TTL = 2
+ADMISSION_LAG_TTL = 60
+# Deferred images submitted per drain run
+ADMISSION_DRAIN_BATCH = 100
+
+# Plan backfill settings
+BACKFILL_CHUNK_SIZE = int(os.environ.get('BACKFILL_CHUNK_SIZE', '100'))
+BACKFILL_RATE_LIMIT = os.environ.get('BACKFILL_RATE_LIMIT', '30/m')
+
+# Image size limits, plans can override pixels and dimension
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', '40000000'))
+IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', '12000'))
+IMAGE_MAX_FRAMES = int(os.environ.get('IMAGE_MAX_FRAMES', '10'))
+# Hard ceiling for images decoded by workers
+WORKER_MAX_PIXELS = int(os.environ.get('WORKER_MAX_PIXELS', '100000000'))
+# Worker-local cache of originals from remote storage, empty disables it
+ORIGINALS_CACHE_DIR = os.environ.get('ORIGINALS_CACHE_DIR', '')
+ORIGINALS_CACHE_SIZE = int(
+    os.environ.get('ORIGINALS_CACHE_SIZE', str(2 * 1024 ** 3)))
+
+# Bigger images are binarized at reduced size, same aspect ratio (README)
+BINARY_MAX_PIXELS = int(os.environ.get('BINARY_MAX_PIXELS', '16000000'))
+
+# Image processing engine used by workers, Pillow or libvips
+THUMBNAIL_ENGINE = os.environ.get(
+    'THUMBNAIL_ENGINE', 'thumbnail.engines.pillow.PillowEngine')
+
+# How NumpyEngine binarizes, threshold, ordered or diffusion
+BINARY_METHOD = os.environ.get('BINARY_METHOD', 'ordered')
+
+# Longest side of the inline image placeholder
+PLACEHOLDER_SIZE = 16
+
+# Thumbnail jobs buffered into one task, 0 or 1 sends a task per image
+THUMBNAIL_BATCH_SIZE = int(os.environ.get('THUMBNAIL_BATCH_SIZE', '0'))
+# Milliseconds the first buffered job waits for the batch to fill up
+THUMBNAIL_BATCH_WAIT = int(os.environ.get('THUMBNAIL_BATCH_WAIT', '200'))
+
+# Maximum number of files in one batch upload
+IMAGE_BATCH_MAX_SIZE = int(os.environ.get('IMAGE_BATCH_MAX_SIZE', '100'))
+
+# ZIP export settings
+EXPORT_QUERY_CHUNK_SIZE = 500
+EXPORT_FILE_CHUNK_SIZE = 64 * 1024
+
+# Async views settings, results are awaited through Redis pub/sub, other
+# result backends are polled every ASYNC_RESULT_POLL_INTERVAL seconds
+ASYNC_RESULT_POLL_INTERVAL = 0.05
+ASYNC_RESULT_TIMEOUT = 30
+
+# Thumbnail ready notifications, longest long-poll wait in seconds
+NOTIFICATIONS_TIMEOUT = int(os.environ.get('NOTIFICATIONS_TIMEOUT', '25'))
+# Events kept per user and how long, for clients that reconnect
+NOTIFICATIONS_KEPT = 100
+NOTIFICATIONS_TTL = 600
 
 
 # Password validation
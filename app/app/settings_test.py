@@ -0,0 +1,26 @@
+"""
+Settings of a test run without Postgres and Redis.
+
+    python manage.py test --settings=app.settings_test
+
+SQLite and the local memory cache stand in for them, Celery brokers in
+memory. Tests of Redis itself mock the client or are skipped.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+    }
+}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # Still read as the Redis URL, e.g. by the notifications
+        'LOCATION': CACHES['default']['LOCATION']
+        or 'redis://localhost:6379/0',
+    }
+}
+CELERY_BROKER_URL = 'memory://'
+CELERY_RESULT_BACKEND = 'cache+memory://'
@@ -0,0 +1,16 @@
+"""
+Settings of web processes, served by gunicorn or an ASGI server.
+
+Static files are collected by manage.py and served by the proxy, and the
+debug toolbar is never loaded.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE
+
+DEBUG_TOOLBAR = False
+INSTALLED_APPS = [
+    app for app in INSTALLED_APPS
+    if app not in ('django.contrib.staticfiles', 'debug_toolbar')]
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE
+    if not middleware.startswith('debug_toolbar.')]
@@ -0,0 +1,23 @@
+"""
+Settings of Celery workers and beat.
+
+Workers serve no requests, so the admin, sessions, messages, static files
+and all middleware are left out. The admin's LogEntry and sessions'
+Session models go with them, so workers must not delete users, whose
+log entries would not cascade. Tasks never do.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS
+
+DEBUG_TOOLBAR = False
+INSTALLED_APPS = [
+    app for app in INSTALLED_APPS
+    if app not in (
+        'django.contrib.admin',
+        'django.contrib.sessions',
+        'django.contrib.messages',
+        'django.contrib.staticfiles',
+        'debug_toolbar',
+    )]
+MIDDLEWARE = []
+ROOT_URLCONF = 'app.worker_urls'
@@ -21,7 +21,6 @@ from django.views.generic import TemplateView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('__debug__/', include('debug_toolbar.urls')),
     path('api/images/', include('thumbnail.urls')),
     path(
         'api/docs/',
@@ -30,6 +29,9 @@ urlpatterns = [
     ),
 ]
 
+if settings.DEBUG_TOOLBAR:
+    urlpatterns.append(path('__debug__/', include('debug_toolbar.urls')))
+
 if settings.DEBUG:
     urlpatterns += static(
         settings.MEDIA_URL,
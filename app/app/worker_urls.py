@@ -0,0 +1,2 @@
+"""Workers serve no requests, Celery's start-up checks load this URLconf."""
+urlpatterns = []
@@ -0,0 +1,48 @@
+"""
+Binary image benchmark.
+
+Binarizes a stack of generated grayscale images with Pillow's
+Floyd-Steinberg convert('1'), image by image, and with every NumpyEngine
+method on the whole stack at once, including packing to 1 bit rows.
+
+Usage (from the app directory):
+    python -m benchmarks.binary [images] [side]
+"""
+import sys
+import time
+
+from PIL import Image as pill_image
+
+from thumbnail.engines import arrays
+
+
+def pillow(images):
+    for image in images:
+        image.convert('1')
+
+
+def main():
+    if arrays.np is None:
+        sys.exit('numpy is not installed.')
+    np = arrays.np
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    side = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    images = [
+        pill_image.effect_noise((side, side), 64) for _ in range(count)]
+    stack = np.stack([np.asarray(image) for image in images])
+    print(f'{count} images of {side}x{side}')
+    rows = [('Pillow convert', lambda: pillow(images))]
+    for name, binarize in arrays.METHODS.items():
+        rows.append(
+            (f'NumPy {name}',
+             lambda binarize=binarize: arrays.pack(binarize(stack))))
+    for name, run in rows:
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        print(f'{name:<20} {elapsed / count * 1000:8.2f} ms/image '
+              f'{count * side * side / elapsed / 1e6:8.1f} Mpx/s')
+
+
+if __name__ == '__main__':
+    main()
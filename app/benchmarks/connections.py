@@ -0,0 +1,69 @@
+"""
+Connection reuse benchmark.
+
+Simulates the request/task life cycle (a query per cycle followed by the
+`close_old_connections` hook Django and Celery run between requests and
+tasks) with and without CONN_MAX_AGE, and times Redis round trips over a
+fresh connection versus the shared pool.
+
+Usage (from the app directory, with the database and Redis running):
+    python -m benchmarks.connections [iterations]
+"""
+import os
+import sys
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+django.setup()
+
+import redis  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.db import connection, close_old_connections  # noqa: E402
+from core.redis import get_redis_client  # noqa: E402
+
+
+def bench_db(iterations, conn_max_age):
+    """Return mean seconds per cycle for the given CONN_MAX_AGE."""
+    connection.close()
+    connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        close_old_connections()
+    elapsed = time.perf_counter() - start
+    connection.close()
+    return elapsed / iterations
+
+
+def bench_redis(iterations, pooled):
+    """Return mean seconds per PING with or without the shared pool."""
+    location = settings.CACHES['default']['LOCATION']
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if pooled:
+            get_redis_client().ping()
+        else:
+            client = redis.Redis.from_url(location)
+            client.ping()
+            client.close()
+            client.connection_pool.disconnect()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rows = (
+        ('postgres, CONN_MAX_AGE=0', bench_db(iterations, 0)),
+        ('postgres, CONN_MAX_AGE=60', bench_db(iterations, 60)),
+        ('redis, new connection', bench_redis(iterations, False)),
+        ('redis, shared pool', bench_redis(iterations, True)),
+    )
+    for name, seconds in rows:
+        print(f'{name:<30} {seconds * 1000:8.3f} ms/cycle')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Image engine benchmark.
+
+Renders thumbnails and binary images of the same generated corpus with
+every engine that can be loaded, each in a fresh process, and reports
+throughput and peak RSS.
+
+Usage (from the app directory):
+    python -m benchmarks.engines [images] [side] [jpg|png]
+"""
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from PIL import Image as pill_image
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+ENGINES = (
+    'thumbnail.engines.pillow.PillowEngine',
+    'thumbnail.engines.tiled.TiledEngine',
+    'thumbnail.engines.vips.VipsEngine',
+)
+SIZES = (100, 200, 400)
+BINARY_MAX_PIXELS = 16_000_000
+
+
+def make_corpus(directory, count, side, fmt='jpg'):
+    """Write count noisy images of side x side pixels."""
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f'{i}.{fmt}')
+        pill_image.effect_noise((side, side), 64).convert('RGB').save(path)
+        paths.append(path)
+    return paths
+
+
+def run(engine_path, paths, queue):
+    """Process the corpus in this process and report the numbers."""
+    try:
+        engine = import_string(engine_path)()
+    except ImproperlyConfigured as e:
+        queue.put((engine_path, str(e)))
+        return
+    start = time.perf_counter()
+    for path in paths:
+        for value in SIZES:
+            with open(path, 'rb') as source:
+                engine.thumbnail(source, value)
+        with open(path, 'rb') as source:
+            engine.binary(source, BINARY_MAX_PIXELS)
+    elapsed = time.perf_counter() - start
+    # Kilobytes on Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((engine_path, (len(paths) / elapsed, rss)))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    side = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+    # TiledEngine reads PNGs in strips, JPEGs like PillowEngine
+    fmt = sys.argv[3] if len(sys.argv) > 3 else 'jpg'
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_corpus(directory, count, side, fmt)
+        print(f'{count} images of {side}x{side}, '
+              f'thumbnails {SIZES} and a binary image each')
+        for engine_path in ENGINES:
+            queue = context.Queue()
+            process = context.Process(
+                target=run, args=(engine_path, paths, queue))
+            process.start()
+            name, result = queue.get()
+            process.join()
+            name = name.rsplit('.', 1)[-1]
+            if isinstance(result, str):
+                print(f'{name:<15} skipped, {result}')
+            else:
+                images_per_second, rss = result
+                print(f'{name:<15} {images_per_second:8.2f} images/s '
+                      f'{rss:8.1f} MB peak RSS')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Image list serialization benchmark.
+
+Serializes one page of images with thumbnails the way the list view does,
+comparing the reflective per-row serializer the view used to have with
+the current one, which resolves the plan entitlement once per page.
+Rows are created inside a transaction that is rolled back at the end.
+
+Usage (from the app directory, with the database running):
+    python -m benchmarks.image_list [page size] [iterations]
+"""
+import os
+import sys
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import transaction  # noqa: E402
+from rest_framework import serializers  # noqa: E402
+from core.models import Image, Plan, Thumbnail, ThumbnailImage  # noqa: E402
+from thumbnail.serializers import ImageListSerializer  # noqa: E402
+
+
+class ReflectiveThumbnailSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ThumbnailImage
+        fields = ('thumbnailed_image',)
+
+    def to_representation(self, instance):
+        ret = super().to_representation(instance)
+        ret['value'] = instance.size
+        return ret
+
+
+class ReflectiveImageListSerializer(serializers.ModelSerializer):
+    """Per-row entitlement lookups, as before."""
+    thumbnails = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = Image
+        exclude = ('uuid', 'user', 'id')
+
+    def get_thumbnails(self, obj):
+        allowed = [thumb.value for thumb in obj.user.plan.thumbnails.all()]
+        query = filter(lambda x: x.size in allowed, obj.thumbnails.all())
+        return ReflectiveThumbnailSerializer(
+            query, many=True, context=self.context).data
+
+    def to_representation(self, instance):
+        ret = super().to_representation(instance)
+        if not instance.user.plan.original_image:
+            ret.pop('image')
+        return ret
+
+
+class Rollback(Exception):
+    pass
+
+
+def bench(serializer_class, images, iterations):
+    """Return mean seconds to serialize the page."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        serializer_class(images, many=True).data
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    page_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    try:
+        with transaction.atomic():
+            plan = Plan.objects.create(name='benchmark', original_image=True)
+            thumbnails = [
+                Thumbnail.objects.get_or_create(value=value)[0]
+                for value in (100, 200, 400)]
+            plan.thumbnails.add(*thumbnails[:2])
+            user = get_user_model().objects.create_user(
+                email='benchmark@example.com', password='benchmark',
+                name='benchmark', plan=plan)
+            images = Image.objects.bulk_create(
+                Image(user=user, image=f'uploads/{i}.png')
+                for i in range(page_size))
+            ThumbnailImage.objects.bulk_create(
+                ThumbnailImage(
+                    image=image, thumbnail_value=thumb, size=thumb.value,
+                    thumbnailed_image=f'uploads/{image.id}-{thumb.value}.png')
+                for image in images for thumb in thumbnails)
+            # Same page as the list view loads it
+            page = list(
+                Image.objects.filter(user=user)
+                .select_related('user__plan')
+                .prefetch_related('user__plan__thumbnails', 'thumbnails'))
+            rows = (
+                ('reflective serializer',
+                 bench(ReflectiveImageListSerializer, page, iterations)),
+                ('ImageListSerializer',
+                 bench(ImageListSerializer, page, iterations)),
+            )
+            raise Rollback
+    except Rollback:
+        pass
+    for name, seconds in rows:
+        print(f'{name:<30} {seconds * 1000:8.3f} ms/page of {page_size}')
+
+
+if __name__ == '__main__':
+    main()
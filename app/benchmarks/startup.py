@@ -0,0 +1,83 @@
+"""
+Cold start benchmark.
+
+Starts fresh interpreters the way each process role does, with its
+settings profile, and reports the median time to ready. The slowest
+top-level imports of the last run come from python -X importtime.
+Nothing connects to the database, Redis or the broker.
+
+Usage (from the app directory):
+    python -m benchmarks.startup [runs] [imports shown]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROLES = {
+    # Every manage.py command sets Django up first
+    'manage': ('app.settings', 'import django; django.setup()'),
+    # First request loads the URLconf, views and serializers
+    'web': ('app.settings_web', (
+        'from django.core.wsgi import get_wsgi_application; '
+        'get_wsgi_application(); '
+        'from django.urls import get_resolver; get_resolver().url_patterns')),
+    # Worker start-up imports the task modules and runs the checks
+    'worker': ('app.settings_worker', (
+        'from app.celery import app; '
+        'app.loader.import_default_modules()')),
+}
+# Modules that should only load when needed
+WATCHED = ('PIL', 'numpy', 'pyvips', 'debug_toolbar', 'django.contrib.admin')
+
+
+def start(settings_module: str, code: str) -> tuple[float, str]:
+    """Run code in a new interpreter, return seconds and import profile."""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    env.setdefault('SECRET_KEY', 'benchmark')
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        env=env, capture_output=True, text=True, check=True)
+    return time.perf_counter() - started, process.stderr
+
+
+def parse(profile: str) -> list[tuple[str, int, int]]:
+    """(module, depth, cumulative microseconds) of every import."""
+    imports = []
+    for line in profile.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), depth, int(cumulative)))
+    return imports
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    shown = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    for role, (settings_module, code) in ROLES.items():
+        timings = []
+        for _ in range(runs):
+            seconds, profile = start(settings_module, code)
+            timings.append(seconds)
+        imports = parse(profile)
+        loaded = {name for name, _depth, _cumulative in imports}
+        watched = [
+            name for name in WATCHED
+            if any(m == name or m.startswith(name + '.') for m in loaded)]
+        print(f'{role:7} {settings_module:20} '
+              f'{statistics.median(timings) * 1000:7.1f} ms median, '
+              f'{len(loaded)} modules, '
+              f'loaded: {", ".join(watched) or "none of " + str(WATCHED)}')
+        top_level = sorted(
+            (item for item in imports if item[1] == 0),
+            key=lambda item: item[2], reverse=True)
+        for name, _depth, cumulative in top_level[:shown]:
+            print(f'    {cumulative / 1000:7.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,7 @@ from django.contrib.auth import get_user_model
 from django.utils.translation import gettext as _
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Group
-from .models import Plan, Thumbnail, ThumbnailImage, Image
+from .models import Plan, Thumbnail, ThumbnailImage, Image, Backfill
 
 
 class UserAdmin(BaseUserAdmin):
@@ -34,10 +34,33 @@ class ThumbnailInline(admin.TabularInline):
     verbose_name = "thumbnail"
 
 
+def backfill_progress(backfill):
+    """Processed images out of total as text."""
+    if not backfill.total:
+        return '-'
+    percent = min(100, backfill.processed * 100 // backfill.total)
+    return f'{backfill.processed}/{backfill.total} ({percent}%)'
+
+
+class BackfillInline(admin.TabularInline):
+    model = Backfill
+    extra = 0
+    can_delete = False
+    fields = ('thumbnail_values', 'status', 'progress', 'date_updated')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description=_('Progress'))
+    def progress(self, obj):
+        return backfill_progress(obj)
+
+
 class PlanAdmin(admin.ModelAdmin):
     list_display = ('name', 'expired_link', 'original_image')
     list_filter = ("expired_link", 'original_image')
-    inlines = (ThumbnailInline,)
+    inlines = (ThumbnailInline, BackfillInline)
     exclude = ('thumbnails',)
     fieldsets = (
         (None, {"fields": ("name",)}),
@@ -49,8 +72,59 @@ class PlanAdmin(admin.ModelAdmin):
             _('Original image'),
             {'classes': ('collapse',), 'fields': ('original_image',)},
         ),
+        (
+            _('Upload limits'),
+            {
+                'classes': ('collapse',),
+                'fields': (
+                    'max_image_pixels', 'max_image_dimension',
+                    'max_pending_jobs'),
+            },
+        ),
     )
 
+    def save_formset(self, request, form, formset, change):
+        """Backfill sizes added through the thumbnail inline."""
+        super().save_formset(request, form, formset, change)
+        # Inline saves of the through model send no m2m_changed
+        if formset.model is Plan.thumbnails.through:
+            added = formset.new_objects + [
+                obj for obj, _fields in formset.changed_objects]
+            if added:
+                # Imported here, the admin loads in every web process
+                from thumbnail.tasks import start_backfill
+                start_backfill(
+                    form.instance.id,
+                    sorted(obj.thumbnail.value for obj in added))
+
+
+class BackfillAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'plan', 'thumbnail_values', 'status', 'progress',
+        'date_updated')
+    list_filter = ('status',)
+    readonly_fields = (
+        'plan', 'thumbnail_values', 'status', 'last_image_id',
+        'processed', 'failed', 'total', 'date_created', 'date_updated')
+    actions = ('resume',)
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description=_('Progress'))
+    def progress(self, obj):
+        return backfill_progress(obj)
+
+    @admin.action(description=_('Resume selected backfills'))
+    def resume(self, request, queryset):
+        """Continue unfinished backfills from their checkpoints."""
+        from thumbnail.tasks import resume_backfill
+        backfills = queryset.exclude(status=Backfill.Status.DONE)
+        for backfill in backfills:
+            resume_backfill(backfill)
+        self.message_user(
+            request, _('Resumed %d backfill(s).') % len(backfills))
+
 
 admin.site.unregister(Group)
 admin.site.register(get_user_model(), UserAdmin)
@@ -58,3 +132,4 @@ admin.site.register(Plan, PlanAdmin)
 admin.site.register(Thumbnail)
 admin.site.register(ThumbnailImage)
 admin.site.register(Image)
+admin.site.register(Backfill, BackfillAdmin)
@@ -0,0 +1,150 @@
+import heapq
+import time
+from datetime import timedelta
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Collate
+from django.utils import timezone
+from core.models import ThumbnailImage
+from .shard_media import FILE_FIELDS
+
+MEDIA_DIRECTORY = 'uploads'
+
+
+def walk_storage(storage, directory):
+    """Yield file names below directory in byte order, one level at a time."""
+    dirs, files = storage.listdir(directory)
+    # A directory sorts like its contents, 'a/...' comes after 'a.png'
+    entries = [(f'{name}/', True) for name in dirs] + \
+        [(name, False) for name in files]
+    for name, is_dir in sorted(entries):
+        path = f'{directory}/{name}'
+        if is_dir:
+            yield from walk_storage(storage, path.rstrip('/'))
+        else:
+            yield path
+
+
+def referenced_names(chunk_size):
+    """Yield file names referenced by the database in byte order."""
+    streams = []
+    for model, field_name in FILE_FIELDS:
+        order = F(field_name)
+        if connection.vendor == 'postgresql':
+            order = Collate(field_name, 'C')
+        streams.append(
+            model.objects
+            .filter(**{f'{field_name}__startswith': f'{MEDIA_DIRECTORY}/'})
+            .order_by(order)
+            .values_list(field_name, flat=True)
+            .iterator(chunk_size=chunk_size))
+    previous = None
+    for name in heapq.merge(*streams):
+        if name != previous:
+            yield name
+        previous = name
+
+
+def diff_sorted(stored, referenced):
+    """Merge two sorted streams, yield (name, in storage, in database)."""
+    stored_name = next(stored, None)
+    referenced_name = next(referenced, None)
+    while stored_name is not None or referenced_name is not None:
+        if referenced_name is None or (
+                stored_name is not None and stored_name < referenced_name):
+            yield stored_name, True, False
+            stored_name = next(stored, None)
+        elif stored_name is None or referenced_name < stored_name:
+            yield referenced_name, False, True
+            referenced_name = next(referenced, None)
+        else:
+            stored_name = next(stored, None)
+            referenced_name = next(referenced, None)
+
+
+class Command(BaseCommand):
+    """Delete media files without rows and report rows without files."""
+    help = 'Delete media files without rows and report rows without files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Files deleted per batch.')
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to wait between delete batches.')
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Keep orphaned files younger than this many seconds, '
+                 'their rows may not be committed yet.')
+        parser.add_argument(
+            '--delete-rows', action='store_true',
+            help='Also delete rows whose file is missing.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report what would be deleted.')
+
+    def delete_files(self, names, options):
+        """Delete a batch of files, return reclaimed bytes."""
+        reclaimed = 0
+        for name in names:
+            try:
+                reclaimed += default_storage.size(name)
+                if not options['dry_run']:
+                    default_storage.delete(name)
+            except FileNotFoundError:
+                pass
+        if not options['dry_run']:
+            time.sleep(options['sleep'])
+        return reclaimed
+
+    def delete_missing_rows(self, names):
+        """Delete rows pointing at the given missing files."""
+        for model, field_name in FILE_FIELDS:
+            model.objects.filter(**{f'{field_name}__in': names}).delete()
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # Thumbnail rows no image points at
+        dangling = ThumbnailImage.objects.filter(image__isnull=True)
+        dangling_count = dangling.count()
+        if not options['dry_run']:
+            dangling.delete()
+
+        cutoff = timezone.now() - timedelta(
+            seconds=options['min_age'])
+        orphans, missing = [], []
+        orphan_count = missing_count = reclaimed = 0
+        stored = walk_storage(default_storage, MEDIA_DIRECTORY) \
+            if default_storage.exists(MEDIA_DIRECTORY) else iter(())
+        for name, in_storage, in_database in diff_sorted(
+                stored, referenced_names(batch_size)):
+            if in_storage:
+                # Could be an upload in progress
+                if default_storage.get_modified_time(name) > cutoff:
+                    continue
+                orphans.append(name)
+                orphan_count += 1
+                if len(orphans) >= batch_size:
+                    reclaimed += self.delete_files(orphans, options)
+                    orphans = []
+            else:
+                missing_count += 1
+                self.stdout.write(f'Missing file {name}')
+                if options['delete_rows'] and not options['dry_run']:
+                    missing.append(name)
+                    if len(missing) >= batch_size:
+                        self.delete_missing_rows(missing)
+                        missing = []
+        reclaimed += self.delete_files(orphans, options)
+        if missing:
+            self.delete_missing_rows(missing)
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(
+            f'{verb} {dangling_count} dangling thumbnail rows and '
+            f'{orphan_count} orphaned files ({reclaimed} bytes), '
+            f'{missing_count} rows have no file.')
+        self.stdout.write(self.style.SUCCESS('Done.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from core.middleware import profile_token
+
+
+class Command(BaseCommand):
+    """Print a signed X-Profile header value."""
+    help = 'Print a signed X-Profile header value, valid for '\
+        'PROFILING_TOKEN_MAX_AGE seconds.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(profile_token())
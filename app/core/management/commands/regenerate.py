@@ -0,0 +1,191 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from core.models import Image, ThumbnailImage, ExpiredLinkImage
+from thumbnail.tasks import regenerate_image
+
+
+def regenerate(image_id, selection):
+    """
+    Regenerate one image, runs in the pool's worker processes.
+
+    Return the number of derivatives and the error, if any.
+    """
+    try:
+        return regenerate_image(
+            image_id,
+            thumbnail_values=selection['sizes'],
+            thumbnails=not selection['skip_thumbnails'],
+            binary=not selection['skip_binary']), None
+    except Exception as e:
+        # One unreadable original must not stop every resume
+        return 0, f'{type(e).__name__}: {e}'
+
+
+class Command(BaseCommand):
+    """Regenerate thumbnails and binary images of selected images."""
+    help = 'Regenerate thumbnails and binary images of selected images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', nargs='+', default=None, metavar='EMAIL',
+            help='Only images of these users.')
+        parser.add_argument(
+            '--plans', nargs='+', default=None, metavar='NAME',
+            help='Only images of users on these plans.')
+        parser.add_argument(
+            '--sizes', nargs='+', type=int, default=None, metavar='VALUE',
+            help='Only thumbnails of these sizes.')
+        parser.add_argument(
+            '--skip-thumbnails', action='store_true',
+            help='Do not regenerate thumbnails.')
+        parser.add_argument(
+            '--skip-binary', action='store_true',
+            help='Do not regenerate binary images.')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of local processes (default: 1, in process).')
+        parser.add_argument(
+            '--celery', action='store_true',
+            help='Enqueue work to Celery instead of running it locally.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=100,
+            help='Images per chunk and checkpoint.')
+        parser.add_argument(
+            '--rate', type=float, default=None,
+            help='Maximum images per second.')
+        parser.add_argument(
+            '--checkpoint', default=None, metavar='PATH',
+            help='File to save progress to and resume from.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report what would be regenerated.')
+
+    def get_queryset(self, options):
+        """Selected images in id order."""
+        images = Image.objects.all()
+        if options['users']:
+            images = images.filter(user__email__in=options['users'])
+        if options['plans']:
+            images = images.filter(user__plan__name__in=options['plans'])
+        return images.order_by('id')
+
+    def load_checkpoint(self, path, selection):
+        """Return the last processed image id and processed count."""
+        if not path or not os.path.exists(path):
+            return 0, 0
+        with open(path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        if checkpoint['selection'] != selection:
+            raise CommandError(
+                f'Checkpoint {path} was made for a different selection.')
+        return checkpoint['last_image_id'], checkpoint['processed']
+
+    def save_checkpoint(self, path, selection, last_image_id, processed):
+        """Atomically replace the checkpoint file."""
+        if not path:
+            return
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as checkpoint_file:
+            json.dump({
+                'selection': selection,
+                'last_image_id': last_image_id,
+                'processed': processed,
+            }, checkpoint_file)
+        os.replace(tmp_path, path)
+
+    def dry_run(self, images, options):
+        """Report the amount of work without doing it."""
+        thumbnails = ThumbnailImage.objects.filter(image__in=images)
+        if options['sizes']:
+            thumbnails = thumbnails.filter(size__in=options['sizes'])
+        thumbnail_count = 0 if options['skip_thumbnails'] \
+            else thumbnails.count()
+        binary_count = 0 if options['skip_binary'] \
+            else ExpiredLinkImage.objects.filter(image__in=images).count()
+        self.stdout.write(
+            f'Would regenerate {thumbnail_count} thumbnails and '
+            f'{binary_count} binary images of {images.count()} images.')
+
+    def handle(self, *args, **options):
+        images = self.get_queryset(options)
+        if options['dry_run']:
+            return self.dry_run(images, options)
+
+        selection = {
+            key: options[key] for key in (
+                'users', 'plans', 'sizes', 'skip_thumbnails', 'skip_binary')
+        }
+        checkpoint = options['checkpoint']
+        last_image_id, processed = self.load_checkpoint(
+            checkpoint, selection)
+        if last_image_id:
+            self.stdout.write(f'Resuming after image {last_image_id}.')
+
+        pool = None
+        if options['workers'] > 1 and not options['celery']:
+            pool = ProcessPoolExecutor(
+                options['workers'], mp_context=get_context('fork'))
+        start = time.monotonic()
+        done = derivatives = failed = 0
+        try:
+            while True:
+                chunk_start = time.monotonic()
+                # Next chunk in id order
+                image_ids = list(
+                    images.filter(id__gt=last_image_id)
+                    .values_list('id', flat=True)[:options['chunk_size']])
+                if not image_ids:
+                    break
+                if options['celery']:
+                    for image_id in image_ids:
+                        regenerate_image.delay(
+                            image_id,
+                            thumbnail_values=selection['sizes'],
+                            thumbnails=not selection['skip_thumbnails'],
+                            binary=not selection['skip_binary'])
+                else:
+                    if pool:
+                        # Children must not inherit open connections
+                        connections.close_all()
+                        results = pool.map(
+                            regenerate, image_ids,
+                            [selection] * len(image_ids))
+                    else:
+                        results = (
+                            regenerate(image_id, selection)
+                            for image_id in image_ids)
+                    for image_id, (count, error) in zip(image_ids, results):
+                        derivatives += count
+                        if error:
+                            failed += 1
+                            self.stderr.write(
+                                f'Image {image_id} failed: {error}')
+                last_image_id = image_ids[-1]
+                processed += len(image_ids)
+                done += len(image_ids)
+                self.save_checkpoint(
+                    checkpoint, selection, last_image_id, processed)
+                # Throughput
+                chunk_elapsed = time.monotonic() - chunk_start
+                self.stdout.write(
+                    f'{processed} images, {derivatives} derivatives, '
+                    f'{len(image_ids) / chunk_elapsed:.1f} images/s')
+                # Rate limit
+                if options['rate']:
+                    min_duration = len(image_ids) / options['rate']
+                    time.sleep(max(0, min_duration - chunk_elapsed))
+        finally:
+            if pool:
+                pool.shutdown()
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Done, {processed} images regenerated '
+            f'({done / elapsed if elapsed else 0:.1f} images/s).'))
+        if failed:
+            self.stdout.write(self.style.WARNING(
+                f'{failed} images failed, see above.'))
@@ -0,0 +1,107 @@
+import os
+import time
+from collections import deque
+from django.core.management.base import BaseCommand
+from core.models import Image, ThumbnailImage, ExpiredLinkImage, sharded_path
+
+# Every file field that points into the media volume
+FILE_FIELDS = (
+    (Image, 'image'),
+    (ThumbnailImage, 'thumbnailed_image'),
+    (ExpiredLinkImage, 'binary_image'),
+)
+
+
+def link_file(storage, old_name, new_name):
+    """Make the file available under new name, return the name used."""
+    try:
+        old_path, new_path = storage.path(old_name), storage.path(new_name)
+    except NotImplementedError:
+        # Remote storage, copy the file
+        with storage.open(old_name) as old_file:
+            return storage.save(new_name, old_file)
+    # Local storage, hard link without copying data
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    try:
+        os.link(old_path, new_path)
+    except FileExistsError:
+        # Linked by an interrupted run
+        pass
+    return new_name
+
+
+class Command(BaseCommand):
+    """Move flat uploads/ files into the hash-sharded layout."""
+    help = 'Move flat uploads/ files into the hash-sharded layout.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Rows per batch.')
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to wait between batches.')
+        parser.add_argument(
+            '--grace', type=float, default=15,
+            help='Seconds old files stay after their row was moved, '
+                 'so cached responses keep working.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count files that would be moved.')
+
+    def delete_due(self, storage, pending, force=False):
+        """Delete old files whose grace period is over."""
+        while pending and (force or pending[0][0] <= time.monotonic()):
+            due, name = pending.popleft()
+            if force:
+                time.sleep(max(0, due - time.monotonic()))
+            storage.delete(name)
+
+    def move_field(self, model, field_name, options):
+        """Move files of one field, return number of moved rows."""
+        storage = model._meta.get_field(field_name).storage
+        # Names still in the flat layout
+        rows = model.objects.filter(
+            **{f'{field_name}__regex': r'^uploads/[^/]+$'}).order_by('pk')
+        if options['dry_run']:
+            return rows.count()
+        pending = deque()
+        moved = 0
+        last_pk = None
+        while True:
+            batch = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+            batch = list(
+                batch.values_list('pk', field_name)[:options['batch_size']])
+            if not batch:
+                break
+            for pk, old_name in batch:
+                new_name = sharded_path(
+                    'uploads', os.path.basename(old_name))
+                try:
+                    new_name = link_file(storage, old_name, new_name)
+                except FileNotFoundError:
+                    self.stderr.write(f'Missing file {old_name}, skipped.')
+                    continue
+                # Only switch rows nobody changed meanwhile
+                updated = model.objects.filter(
+                    pk=pk, **{field_name: old_name}).update(
+                    **{field_name: new_name})
+                if updated:
+                    pending.append(
+                        (time.monotonic() + options['grace'], old_name))
+                    moved += 1
+                else:
+                    storage.delete(new_name)
+            last_pk = batch[-1][0]
+            self.delete_due(storage, pending)
+            time.sleep(options['sleep'])
+        self.delete_due(storage, pending, force=True)
+        return moved
+
+    def handle(self, *args, **options):
+        for model, field_name in FILE_FIELDS:
+            count = self.move_field(model, field_name, options)
+            verb = 'Would move' if options['dry_run'] else 'Moved'
+            self.stdout.write(
+                f'{verb} {count} {model.__name__}.{field_name} files.')
+        self.stdout.write(self.style.SUCCESS('Done.'))
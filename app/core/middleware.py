@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from celery.signals import task_prerun, task_postrun
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger('profiling')
+
+SIGNING_SALT = 'core.profiling'
+# Query count of the running request, copied into sync_to_async threads
+_queries = ContextVar('queries', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """Database execute wrapper counting queries of the running request."""
+    counter = _queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(connection) -> None:
+    """Count the connection's queries, first so nested wrappers pop fine."""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_queries)
+
+
+@receiver(connection_created)
+def connection_created_handler(sender, connection, **kwargs):
+    install_query_counter(connection)
+
+
+@task_prerun.connect
+def pause_query_count(task=None, **kwargs):
+    # Tasks run eagerly inside a request are not the view's queries
+    task.request.query_count_token = _queries.set(None)
+
+
+@task_postrun.connect
+def resume_query_count(task=None, **kwargs):
+    token = getattr(task.request, 'query_count_token', None)
+    if token is not None:
+        _queries.reset(token)
+
+
+def profile_token() -> str:
+    """Value of the X-Profile header that turns profiling on."""
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign('profile')
+
+
+def has_profile_token(request) -> bool:
+    value = request.headers.get('X-Profile')
+    if not value:
+        return False
+    try:
+        signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+            value, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def fold(frame) -> str:
+    """Stack of a frame in the folded format of flame graph tools."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{frame.f_globals.get("__name__")}.{code.co_qualname}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler:
+    """
+    One thread sampling the stacks of the profiled threads.
+
+    It sleeps while nothing is profiled, so unprofiled requests cost
+    nothing.
+    """
+
+    def __init__(self):
+        self.profiles = {}
+        self.lock = threading.Lock()
+        self.active = threading.Event()
+        self.thread = None
+
+    def start(self, thread_id: int) -> Counter:
+        """Begin sampling a thread, return its stack counts."""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name='profiling-sampler', daemon=True)
+                self.thread.start()
+            stacks = self.profiles[thread_id] = Counter()
+            self.active.set()
+        return stacks
+
+    def stop(self, thread_id: int) -> None:
+        with self.lock:
+            self.profiles.pop(thread_id, None)
+            if not self.profiles:
+                self.active.clear()
+
+    def run(self):
+        while True:
+            self.active.wait()
+            time.sleep(settings.PROFILING_INTERVAL)
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, stacks in self.profiles.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[fold(frame)] += 1
+            del frames
+
+
+sampler = Sampler()
+
+
+class ProfilingMiddleware:
+    """
+    Count queries of every request against QUERY_BUDGETS, and sample the
+    stacks of requests with a signed X-Profile header or picked by
+    PROFILING_SAMPLE_RATE.
+
+    Async views are sampled on the event loop thread, which also runs
+    other requests meanwhile.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Let Django call it as a coroutine
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profile = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.finish(request, *profile)
+        return response
+
+    async def __acall__(self, request):
+        profile = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.finish(request, *profile)
+        return response
+
+    def should_profile(self, request) -> bool:
+        rate = settings.PROFILING_SAMPLE_RATE
+        return (rate and random.random() < rate) or \
+            has_profile_token(request)
+
+    def start(self, request):
+        """Start counting and maybe sampling, return what finish() needs."""
+        # Connections opened before this middleware was loaded
+        for connection in connections.all():
+            install_query_counter(connection)
+        queries = [0]
+        token = _queries.set(queries)
+        thread_id = stacks = None
+        if self.should_profile(request):
+            thread_id = threading.get_ident()
+            stacks = sampler.start(thread_id)
+        return token, queries, thread_id, stacks, time.perf_counter()
+
+    def finish(self, request, token, queries, thread_id, stacks, started):
+        elapsed = (time.perf_counter() - started) * 1000
+        if stacks is not None:
+            sampler.stop(thread_id)
+        _queries.reset(token)
+        match = request.resolver_match
+        view_name = match.view_name if match else request.path
+        budget = settings.QUERY_BUDGETS.get(view_name)
+        if budget is not None and queries[0] > budget:
+            logger.error(
+                '%s %s made %d queries, budget is %d',
+                request.method, view_name, queries[0], budget)
+        if stacks is not None:
+            folded = '\n'.join(
+                f'{stack} {count}' for stack, count in stacks.items())
+            logger.info(
+                '%s %s %d queries %.1f ms\n%s',
+                request.method, view_name, queries[0], elapsed, folded)
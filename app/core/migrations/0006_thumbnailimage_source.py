@@ -0,0 +1,56 @@
+# Generated by Django 4.1.6 on 2026-10-19 18:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_source(apps, schema_editor):
+    """Point thumbnails at their image and drop duplicated sizes."""
+    Image = apps.get_model('core', 'Image')
+    ThumbnailImage = apps.get_model('core', 'ThumbnailImage')
+    links = Image.thumbnails.through.objects\
+        .order_by('image_id', 'thumbnailimage_id')\
+        .values_list(
+            'image_id', 'thumbnailimage_id',
+            'thumbnailimage__thumbnail_value_id')
+
+    def flush(image_id, thumb_ids):
+        ThumbnailImage.objects.filter(id__in=thumb_ids)\
+            .update(source_id=image_id)
+
+    current_image_id, thumb_ids, seen_values, duplicates = None, [], set(), []
+    for image_id, thumb_id, value_id in links.iterator():
+        if image_id != current_image_id:
+            if thumb_ids:
+                flush(current_image_id, thumb_ids)
+            current_image_id, thumb_ids, seen_values = image_id, [], set()
+        # Keep the oldest thumbnail of every size
+        if value_id is not None and value_id in seen_values:
+            duplicates.append(thumb_id)
+            continue
+        seen_values.add(value_id)
+        thumb_ids.append(thumb_id)
+    if thumb_ids:
+        flush(current_image_id, thumb_ids)
+    # Files of removed duplicates stay on the storage
+    ThumbnailImage.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_remove_thumbnailimage_original_image_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thumbnailimage',
+            name='source',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.image'),
+        ),
+        migrations.RunPython(backfill_source, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='thumbnailimage',
+            constraint=models.UniqueConstraint(fields=('source', 'thumbnail_value'), name='unique_thumbnail_image_size'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.6 on 2026-10-19 18:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_backfill'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expiredlinkimage',
+            name='image',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='core.image'),
+        ),
+    ]
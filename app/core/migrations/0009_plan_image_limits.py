@@ -0,0 +1,23 @@
+# Generated by Django 4.1.6 on 2026-10-19 18:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_expiredlinkimage_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='max_image_dimension',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='max_image_pixels',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 4.1.6 on 2026-10-19 18:40
+
+from django.db import migrations, models, transaction
+from django.db.models import Exists, OuterRef, Subquery
+
+BATCH_SIZE = 1000
+
+
+def link_legacy_rows(apps, schema_editor):
+    """Set source of rows made by old workers, only in the through table."""
+    Image = apps.get_model('core', 'Image')
+    ThumbnailImage = apps.get_model('core', 'ThumbnailImage')
+    through = Image.thumbnails.through
+    link = Subquery(
+        through.objects.filter(thumbnailimage_id=OuterRef('id'))
+        .order_by('id').values('image_id')[:1])
+    rows = ThumbnailImage.objects.filter(source__isnull=True)\
+        .annotate(link=link).filter(link__isnull=False)
+    # Sizes the image already has, or an older unlinked row has
+    taken = ThumbnailImage.objects.filter(
+        source_id=OuterRef('link'),
+        thumbnail_value_id=OuterRef('thumbnail_value_id'))
+    older = ThumbnailImage.objects.filter(
+        source__isnull=True, id__lt=OuterRef('id'),
+        thumbnail_value_id=OuterRef('thumbnail_value_id'))\
+        .annotate(link=link).filter(link=OuterRef('link'))
+    last_id = 0
+    while True:
+        ids = list(rows.filter(id__gt=last_id).order_by('id')
+                   .values_list('id', flat=True)[:BATCH_SIZE])
+        if not ids:
+            break
+        with transaction.atomic():
+            # Files of removed duplicates stay on the storage
+            rows.filter(id__in=ids, thumbnail_value__isnull=False)\
+                .filter(Exists(taken) | Exists(older)).delete()
+            ThumbnailImage.objects.filter(id__in=ids, source__isnull=True)\
+                .update(source_id=link)
+        last_id = ids[-1]
+
+
+def backfill_size(apps, schema_editor):
+    """Copy thumbnail values to size."""
+    Thumbnail = apps.get_model('core', 'Thumbnail')
+    ThumbnailImage = apps.get_model('core', 'ThumbnailImage')
+    value = Subquery(
+        Thumbnail.objects.filter(id=OuterRef('thumbnail_value_id'))
+        .values('value')[:1])
+    rows = ThumbnailImage.objects.filter(
+        size__isnull=True, thumbnail_value__isnull=False).order_by('id')
+    last_id = 0
+    while True:
+        ids = list(rows.filter(id__gt=last_id)
+                   .values_list('id', flat=True)[:BATCH_SIZE])
+        if not ids:
+            break
+        with transaction.atomic():
+            ThumbnailImage.objects.filter(id__in=ids).update(size=value)
+        last_id = ids[-1]
+
+
+def backfill(apps, schema_editor):
+    link_legacy_rows(apps, schema_editor)
+    backfill_size(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+    # Every batch commits on its own, so no update holds locks for long
+    atomic = False
+
+    dependencies = [
+        ('core', '0010_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thumbnailimage',
+            name='size',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
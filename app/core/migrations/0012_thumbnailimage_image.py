@@ -0,0 +1,53 @@
+# Generated by Django 4.1.6 on 2026-10-19 18:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    """
+    Expand only: the source column, the through table and the old
+    constraint stay, so old workers and web processes keep running while
+    the release rolls out. They are dropped in a later release.
+    """
+
+    dependencies = [
+        ('core', '0011_thumbnailimage_size'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.RemoveConstraint(
+                model_name='thumbnailimage',
+                name='unique_thumbnail_image_size',
+            ),
+            migrations.RenameField(
+                model_name='image',
+                old_name='thumbnails',
+                new_name='legacy_thumbnails',
+            ),
+            migrations.AlterField(
+                model_name='image',
+                name='legacy_thumbnails',
+                field=models.ManyToManyField(db_table='core_image_thumbnails', editable=False, related_name='+', to='core.thumbnailimage'),
+            ),
+            migrations.RenameField(
+                model_name='thumbnailimage',
+                old_name='source',
+                new_name='image',
+            ),
+            migrations.AlterField(
+                model_name='thumbnailimage',
+                name='image',
+                field=models.ForeignKey(db_column='source_id', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thumbnails', to='core.image'),
+            ),
+            migrations.AddConstraint(
+                model_name='thumbnailimage',
+                constraint=models.UniqueConstraint(fields=('image', 'thumbnail_value'), name='unique_thumbnail_image_size'),
+            ),
+        ]),
+        migrations.AddConstraint(
+            model_name='thumbnailimage',
+            constraint=models.UniqueConstraint(fields=('image', 'size'), name='unique_thumbnail_size'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.1.6 on 2026-10-19 18:50
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_images(apps, schema_editor):
+    """Set counters of existing users."""
+    User = apps.get_model('core', 'User')
+    Image = apps.get_model('core', 'Image')
+    User.objects.update(image_count=Coalesce(Subquery(
+        Image.objects.filter(user=OuterRef('pk'))
+        .order_by().values('user')
+        .annotate(count=Count('id')).values('count')), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_thumbnailimage_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='image_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.1.6 on 2026-10-19 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_user_image_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='deferred',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='max_pending_jobs',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(condition=models.Q(('deferred', True)), fields=['id'], name='image_deferred_idx'),
+        ),
+    ]
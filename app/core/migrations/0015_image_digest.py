@@ -0,0 +1,18 @@
+# Generated by Django 4.1.6 on 2026-10-19 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_upload_admission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='digest',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
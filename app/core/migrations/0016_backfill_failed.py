@@ -0,0 +1,18 @@
+# Generated by Django 4.1.6 on 2026-10-19 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_image_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backfill',
+            name='failed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import uuid
 from django.db import models
@@ -18,12 +19,19 @@ def image_ext_validator(value):
         raise ValidationError(_('JPEG and PNG extension are only allowed.'))
 
 
+def sharded_path(directory, filename):
+    """Put a file two hash-prefixed directory levels below directory."""
+    digest = hashlib.md5(filename.encode(), usedforsecurity=False).hexdigest()
+
+    return os.path.join(directory, digest[:2], digest[2:4], filename)
+
+
 def image_file_path(instance, filename):
     """Creating a path that prevent duplication of image name."""
     ext = os.path.splitext(filename)[1]
     filename = f'{uuid.uuid4()}{ext}'
 
-    return os.path.join('uploads', filename)
+    return sharded_path('uploads', filename)
 
 
 class UserManager(BaseUserManager):
@@ -59,6 +67,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_staff = models.BooleanField(default=False)
     plan = models.ForeignKey(
         'Plan', on_delete=models.CASCADE, null=True)
+    # Number of uploaded images, reconciled periodically
+    image_count = models.PositiveIntegerField(default=0, editable=False)
 
     objects = UserManager()
 
@@ -78,6 +88,11 @@ class Plan(models.Model):
         Thumbnail, related_query_name='thumbnail')
     original_image = models.BooleanField(default=False)
     expired_link = models.BooleanField(default=False)
+    # Upload limits, settings defaults when empty
+    max_image_pixels = models.PositiveBigIntegerField(null=True, blank=True)
+    max_image_dimension = models.PositiveIntegerField(null=True, blank=True)
+    # Waiting thumbnail jobs a user keeps when the queue is overloaded
+    max_pending_jobs = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return self.name
@@ -88,7 +103,25 @@ class Image(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     image = models.ImageField(
         upload_to=image_file_path, validators=[image_ext_validator])
-    thumbnails = models.ManyToManyField('ThumbnailImage')
+    # Tiny preview as a data URI, shown until thumbnails load
+    placeholder = models.TextField(blank=True, default='', editable=False)
+    # Thumbnails postponed until the queue has room
+    deferred = models.BooleanField(default=False, editable=False)
+    # SHA-256 of the original, filled in by the first worker reading it
+    digest = models.CharField(
+        max_length=64, blank=True, default='', editable=False)
+    # Links of workers before ThumbnailImage.image, kept until every
+    # process runs this release, then dropped
+    legacy_thumbnails = models.ManyToManyField(
+        'ThumbnailImage', db_table='core_image_thumbnails', related_name='+',
+        editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=('id',), condition=models.Q(deferred=True),
+                name='image_deferred_idx'),
+        ]
 
 
 class ThumbnailImage(models.Model):
@@ -96,13 +129,64 @@ class ThumbnailImage(models.Model):
         Thumbnail, on_delete=models.PROTECT, null=True)
     thumbnailed_image = models.ImageField(
         upload_to=image_file_path, validators=[image_ext_validator])
+    # Column keeps its old name until old workers are gone
+    image = models.ForeignKey(
+        Image, on_delete=models.CASCADE, null=True,
+        related_name='thumbnails', db_column='source_id')
+    # Copy of thumbnail_value.value, one thumbnail per size
+    size = models.PositiveIntegerField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('image', 'size'), name='unique_thumbnail_size'),
+            # Old workers rely on it, dropped with legacy_thumbnails
+            models.UniqueConstraint(
+                fields=('image', 'thumbnail_value'),
+                name='unique_thumbnail_image_size'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Keep size in sync with thumbnail value
+        if self.thumbnail_value_id and self.size is None:
+            self.size = self.thumbnail_value.value
+        super().save(*args, **kwargs)
 
 
 class ExpiredLinkImage(models.Model):
     uuid = models.UUIDField(
         primary_key=True, default=uuid.uuid4, editable=False)
+    image = models.ForeignKey(Image, on_delete=models.CASCADE, null=True)
     binary_image = models.ImageField(
         upload_to=image_file_path, validators=[image_ext_validator])
     duration = models.SmallIntegerField(
         validators=[MaxValueValidator(30000), MinValueValidator(300)])
     date_created = models.DateTimeField(default=timezone.now)
+
+
+class Backfill(models.Model):
+    """Thumbnail backfill, checkpointed after every chunk of images."""
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        RUNNING = 'running', _('Running')
+        DONE = 'done', _('Done')
+
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE)
+    thumbnail_values = models.JSONField(default=list)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.PENDING)
+    # Keyset checkpoint, images are processed in id order
+    last_image_id = models.BigIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    # Images skipped because their thumbnails could not be made
+    failed = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    date_created = models.DateTimeField(default=timezone.now)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    def images(self):
+        """Images the backfill goes through."""
+        return Image.objects.filter(user__plan=self.plan)
+
+    def __str__(self):
+        return f'{self.plan} {self.thumbnail_values}'
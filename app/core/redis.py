@@ -0,0 +1,34 @@
+import redis
+from django.conf import settings
+
+_pool = None
+
+
+def get_redis_pool() -> redis.BlockingConnectionPool:
+    """Return the process-wide, bounded Redis connection pool."""
+    global _pool
+    if _pool is None:
+        _pool = redis.BlockingConnectionPool.from_url(
+            settings.CACHES['default']['LOCATION'],
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL)
+    return _pool
+
+
+class SharedConnectionPool(redis.BlockingConnectionPool):
+    """
+    Pool class for CACHES, every cache instance gets the process pool.
+
+    Django creates a cache, with its own pools, per thread, so without it
+    a threaded process could open REDIS_MAX_CONNECTIONS per thread.
+    """
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        return get_redis_pool()
+
+
+def get_redis_client() -> redis.Redis:
+    """Return a Redis client that borrows connections from the shared pool."""
+    return redis.Redis(connection_pool=get_redis_pool())
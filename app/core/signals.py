@@ -1,11 +1,12 @@
 import functools
-from django.db.models.signals import post_save
+from collections import defaultdict
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.conf import settings
-from .models import Image
-from thumbnail.tasks import create_thumbnails
+from .models import Image, Plan, Thumbnail
 
 
 def suspendingreceiver(signal, **decorator_kwargs):
@@ -50,24 +51,58 @@ def update_thumbnails(sender, instance, created, **kwargs):
             current_set = set(current_thumbnails)
             cached_set = set(cached_thumbnails)
             difference = current_set - cached_set
-            difference_values = [thumb.value for thumb in difference]
+            difference_values = {thumb.value for thumb in difference}
             # If there is difference between
             if difference:
+                # Imported here, tasks load Celery and the workers' modules
+                from thumbnail.tasks import submit_thumbnails
                 # Get user images
                 images = Image.objects.filter(user=instance)\
-                    .prefetch_related('thumbnails')\
-                    .prefetch_related('thumbnails__thumbnail_value')
+                    .prefetch_related('thumbnails')
                 # Create new thumbnails
-                # I cant figure out how to make it faster
-                # so i ended up with O(n^2)
                 for image in images:
-                    # Check if thumbnail image with
-                    # value from difference exists
-                    for thumb_image in image.thumbnails.all():
-                        thumb_value = thumb_image.thumbnail_value.value
-                        if thumb_value in difference_values:
-                            difference_values.remove(thumb_value)
-                    # Create thumbnails for every value
-                    if difference_values:
-                        create_thumbnails(
-                            image.id, thumbnail_values=difference_values)
+                    # Skip values the image already has
+                    missing_values = difference_values - {
+                        thumb_image.size
+                        for thumb_image in image.thumbnails.all()
+                    }
+                    # Enqueue thumbnails for every missing value
+                    if missing_values:
+                        submit_thumbnails(
+                            image.id, thumbnail_values=sorted(missing_values))
+
+
+@suspendingreceiver(m2m_changed, sender=Plan.thumbnails.through)
+def backfill_added_plan_thumbnails(
+        sender, instance, action, reverse, pk_set, **kwargs):
+    """Create thumbnails of sizes added to a plan for users on that plan."""
+    if action != 'post_add' or not pk_set:
+        return
+    # Collect added values per plan
+    plan_values = defaultdict(list)
+    if reverse:
+        for plan_id in pk_set:
+            plan_values[plan_id].append(instance.value)
+    else:
+        values = Thumbnail.objects.filter(id__in=pk_set)\
+            .values_list('value', flat=True)
+        plan_values[instance.id].extend(values)
+    from thumbnail.tasks import start_backfill
+    for plan_id, values in plan_values.items():
+        start_backfill(plan_id, sorted(values))
+
+
+@receiver(post_save, sender=Image)
+def count_created_image(sender, instance, created, **kwargs):
+    """Increase owner's image counter."""
+    if created:
+        get_user_model().objects.filter(id=instance.user_id)\
+            .update(image_count=F('image_count') + 1)
+
+
+@receiver(post_delete, sender=Image)
+def count_deleted_image(sender, instance, **kwargs):
+    """Decrease owner's image counter."""
+    get_user_model().objects\
+        .filter(id=instance.user_id, image_count__gt=0)\
+        .update(image_count=F('image_count') - 1)
@@ -0,0 +1,26 @@
+from celery import shared_task
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Image
+
+
+def image_count_subquery():
+    """Actual number of images of the outer user."""
+    return Coalesce(Subquery(
+        Image.objects.filter(user=OuterRef('pk'))
+        .order_by().values('user')
+        .annotate(count=Count('id')).values('count')), Value(0))
+
+
+@shared_task
+def reconcile_image_counts() -> int:
+    """Fix image counters that drifted, return how many were fixed."""
+    users = get_user_model().objects\
+        .annotate(actual=image_count_subquery())\
+        .exclude(image_count=F('actual'))
+    user_ids = list(users.values_list('id', flat=True))
+    # Recount in the update itself, uploads may have happened meanwhile
+    get_user_model().objects.filter(id__in=user_ids)\
+        .update(image_count=image_count_subquery())
+    return len(user_ids)
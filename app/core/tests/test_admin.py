@@ -1,7 +1,8 @@
 from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from core.models import Plan, Thumbnail
+from unittest.mock import patch
+from core.models import Plan, Thumbnail, Backfill
 
 
 @override_settings(
@@ -94,3 +95,59 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+    def test_backfill_listed(self):
+        Backfill.objects.create(
+            plan=self.plan, thumbnail_values=[100], total=4, processed=1)
+        url = reverse('admin:core_backfill_changelist')
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, '1/4 (25%)')
+
+    def test_change_plan_page_shows_backfill(self):
+        Backfill.objects.create(
+            plan=self.plan, thumbnail_values=[100], total=4, processed=2)
+        url = reverse('admin:core_plan_change', args=[self.plan.id])
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, '2/4 (50%)')
+
+    @patch('thumbnail.tasks.resume_backfill')
+    def test_resume_backfill_action(self, patched_resume):
+        backfill = Backfill.objects.create(
+            plan=self.plan, thumbnail_values=[100], total=4)
+        Backfill.objects.create(
+            plan=self.plan, thumbnail_values=[100],
+            status=Backfill.Status.DONE)
+        url = reverse('admin:core_backfill_changelist')
+        res = self.client.post(url, {
+            'action': 'resume',
+            '_selected_action': Backfill.objects.values_list('id', flat=True)
+        })
+
+        self.assertEqual(res.status_code, 302)
+        patched_resume.assert_called_once_with(backfill)
+
+    @patch('thumbnail.tasks.start_backfill')
+    def test_add_plan_thumbnail_inline_starts_backfill(self, patched_start):
+        thumbnail = Thumbnail.objects.create(value=300)
+        through = Plan.thumbnails.through.objects.get(plan=self.plan)
+        url = reverse('admin:core_plan_change', args=[self.plan.id])
+        res = self.client.post(url, {
+            'name': self.plan.name,
+            'Plan_thumbnails-TOTAL_FORMS': 2,
+            'Plan_thumbnails-INITIAL_FORMS': 1,
+            'Plan_thumbnails-0-id': through.id,
+            'Plan_thumbnails-0-plan': self.plan.id,
+            'Plan_thumbnails-0-thumbnail': self.thumbnail.id,
+            'Plan_thumbnails-1-plan': self.plan.id,
+            'Plan_thumbnails-1-thumbnail': thumbnail.id,
+            'backfill_set-TOTAL_FORMS': 0,
+            'backfill_set-INITIAL_FORMS': 0,
+        })
+
+        self.assertEqual(res.status_code, 302)
+        self.assertIn(thumbnail, self.plan.thumbnails.all())
+        patched_start.assert_called_once_with(self.plan.id, [300])
@@ -1,8 +1,22 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
 from unittest.mock import patch
 from psycopg2 import OperationalError as psycopg2OperationalError
+from PIL import Image as pill_image
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase, override_settings
+from core.models import (
+    Image, ThumbnailImage, ExpiredLinkImage, Plan, Thumbnail, sharded_path)
+from thumbnail.tasks import create_thumbnails, create_binary_image
+from .test_models import sample_user, sample_thumbnail
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -21,3 +35,245 @@ class ComamndTests(SimpleTestCase):
         call_command('wait_for_db')
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True,
+    CELERY_TASK_EAGER_PROPAGATES=True,
+    SUSPEND_SIGNALS=True
+)
+class RegenerateCommandTests(TestCase):
+    def setUp(self):
+        sample_thumbnail(value=100)
+        sample_thumbnail(value=200)
+        self.user = sample_user(
+            email='test@email.com', name='test', password='testpassword')
+        self.images = []
+        for _ in range(2):
+            with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+                image = pill_image.new('RGB', (300, 300))
+                image.save(image_file, 'png')
+                image = InMemoryUploadedFile(
+                    image_file, 'image', 'image.png',
+                    'png', image_file.tell(), None)
+                image_model = Image.objects.create(
+                    user=self.user, image=image)
+            create_thumbnails(image_model.id)
+            create_binary_image(image_model.id, 300)
+            self.images.append(image_model)
+
+    def file_names(self):
+        return set(
+            ThumbnailImage.objects.values_list(
+                'thumbnailed_image', flat=True)
+        ) | set(
+            ExpiredLinkImage.objects.values_list('binary_image', flat=True))
+
+    def test_regenerate(self):
+        names = self.file_names()
+        out = StringIO()
+        call_command('regenerate', stdout=out)
+
+        new_names = self.file_names()
+        self.assertEqual(len(new_names), 6)
+        self.assertFalse(names & new_names)
+        self.assertIn('6 derivatives', out.getvalue())
+        for thumb_image in ThumbnailImage.objects.all():
+            self.assertTrue(thumb_image.thumbnailed_image.storage.exists(
+                thumb_image.thumbnailed_image.name))
+        for name in names:
+            self.assertFalse(
+                ThumbnailImage.thumbnailed_image.field.storage.exists(name))
+
+    def test_regenerate_selected_sizes(self):
+        thumb_200 = ThumbnailImage.objects.filter(
+            size=200)
+        names_200 = set(thumb_200.values_list('thumbnailed_image', flat=True))
+        names = self.file_names()
+        call_command(
+            'regenerate', '--sizes', '100', '--skip-binary',
+            stdout=StringIO())
+
+        self.assertEqual(len(names - self.file_names()), 2)
+        self.assertEqual(
+            set(thumb_200.values_list('thumbnailed_image', flat=True)),
+            names_200)
+
+    def test_regenerate_adds_plan_sizes(self):
+        plan = Plan.objects.create(name='Plan')
+        plan.thumbnails.add(*Thumbnail.objects.all())
+        plan.thumbnails.add(sample_thumbnail(value=50))
+        self.user.plan = plan
+        self.user.save()
+        out = StringIO()
+        call_command(
+            'regenerate', '--sizes', '50', '--skip-binary', stdout=out)
+
+        self.assertIn('2 derivatives', out.getvalue())
+        for image in self.images:
+            self.assertEqual(
+                sorted(image.thumbnails.values_list('size', flat=True)),
+                [50, 100, 200])
+
+    def test_regenerate_reports_broken_images(self):
+        first, second = self.images
+        Image.objects.filter(id=first.id).update(image='uploads/missing.png')
+        out, err = StringIO(), StringIO()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'checkpoint.json')
+            call_command(
+                'regenerate', '--checkpoint', path, stdout=out, stderr=err)
+            with open(path) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+
+        self.assertIn(f'Image {first.id} failed', err.getvalue())
+        self.assertIn('1 images failed', out.getvalue())
+        self.assertIn('3 derivatives', out.getvalue())
+        self.assertEqual(checkpoint['last_image_id'], second.id)
+
+    def test_regenerate_dry_run(self):
+        names = self.file_names()
+        out = StringIO()
+        call_command('regenerate', '--dry-run', stdout=out)
+
+        self.assertEqual(names, self.file_names())
+        self.assertIn(
+            'Would regenerate 4 thumbnails and 2 binary images of 2 images',
+            out.getvalue())
+
+    def test_regenerate_resume_from_checkpoint(self):
+        first, second = self.images
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'checkpoint.json')
+            with open(path, 'w') as checkpoint_file:
+                json.dump({
+                    'selection': {'users': ['other@email.com']},
+                    'last_image_id': first.id,
+                    'processed': 1
+                }, checkpoint_file)
+            with self.assertRaises(CommandError):
+                call_command(
+                    'regenerate', '--checkpoint', path, stdout=StringIO())
+
+            with open(path, 'w') as checkpoint_file:
+                json.dump({
+                    'selection': {
+                        'users': None, 'plans': None, 'sizes': None,
+                        'skip_thumbnails': False, 'skip_binary': False
+                    },
+                    'last_image_id': first.id,
+                    'processed': 1
+                }, checkpoint_file)
+            first_names = set(first.thumbnails.values_list(
+                'thumbnailed_image', flat=True))
+            second_names = set(second.thumbnails.values_list(
+                'thumbnailed_image', flat=True))
+            call_command(
+                'regenerate', '--checkpoint', path, stdout=StringIO())
+
+            self.assertEqual(first_names, set(first.thumbnails.values_list(
+                'thumbnailed_image', flat=True)))
+            self.assertFalse(second_names & set(second.thumbnails.values_list(
+                'thumbnailed_image', flat=True)))
+            with open(path) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+            self.assertEqual(checkpoint['last_image_id'], second.id)
+            self.assertEqual(checkpoint['processed'], 2)
+
+
+@override_settings(
+    SUSPEND_SIGNALS=True
+)
+class ShardMediaCommandTests(TestCase):
+    def setUp(self):
+        self.user = sample_user(
+            email='test@email.com', name='test', password='testpassword')
+
+    def test_shard_media(self):
+        flat_name = default_storage.save(
+            'uploads/legacy.png', ContentFile(b'legacy'))
+        image = Image.objects.create(user=self.user, image=flat_name)
+        missing = Image.objects.create(
+            user=self.user, image='uploads/missing.png')
+        sharded = Image.objects.create(
+            user=self.user, image=ContentFile(b'new', 'new.png'))
+        sharded_name = sharded.image.name
+
+        out = StringIO()
+        call_command('shard_media', '--dry-run', stdout=out)
+        self.assertIn('Would move 2 Image.image files', out.getvalue())
+        self.assertTrue(default_storage.exists(flat_name))
+
+        call_command(
+            'shard_media', '--grace', '0', stdout=StringIO(),
+            stderr=StringIO())
+        image.refresh_from_db()
+        missing.refresh_from_db()
+        sharded.refresh_from_db()
+        self.assertEqual(
+            image.image.name, sharded_path('uploads', 'legacy.png'))
+        self.assertFalse(default_storage.exists(flat_name))
+        with image.image.open('rb') as image_file:
+            self.assertEqual(image_file.read(), b'legacy')
+        self.assertEqual(missing.image.name, 'uploads/missing.png')
+        self.assertEqual(sharded.image.name, sharded_name)
+        default_storage.delete(image.image.name)
+        default_storage.delete(sharded_name)
+
+
+@override_settings(
+    SUSPEND_SIGNALS=True
+)
+class CollectOrphansCommandTests(TestCase):
+    def setUp(self):
+        # Scan an empty media volume
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.user = sample_user(
+            email='test@email.com', name='test', password='testpassword')
+        self.image = Image.objects.create(
+            user=self.user, image=ContentFile(b'image', 'image.png'))
+        self.orphan_name = default_storage.save(
+            sharded_path('uploads', 'orphan.png'), ContentFile(b'orphan'))
+        self.young_orphan_name = default_storage.save(
+            sharded_path('uploads', 'young.png'), ContentFile(b'young'))
+        self.dangling = ThumbnailImage.objects.create(
+            thumbnailed_image=ContentFile(b'dangling', 'dangling.png'))
+        self.missing = Image.objects.create(
+            user=self.user, image=sharded_path('uploads', 'missing.png'))
+        # Make files old enough
+        for name in (
+                self.image.image.name, self.orphan_name,
+                self.dangling.thumbnailed_image.name):
+            os.utime(default_storage.path(name), (0, 0))
+
+    def test_collect_orphans_dry_run(self):
+        out = StringIO()
+        call_command('collect_orphans', '--dry-run', stdout=out)
+
+        self.assertIn(
+            'Would delete 1 dangling thumbnail rows and 1 orphaned files '
+            '(6 bytes), 1 rows have no file.', out.getvalue())
+        self.assertTrue(default_storage.exists(self.orphan_name))
+        self.assertTrue(
+            ThumbnailImage.objects.filter(id=self.dangling.id).exists())
+
+    def test_collect_orphans(self):
+        out = StringIO()
+        call_command('collect_orphans', '--delete-rows', stdout=out)
+
+        self.assertIn(
+            'Deleted 1 dangling thumbnail rows and 2 orphaned files '
+            '(14 bytes), 1 rows have no file.', out.getvalue())
+        self.assertFalse(default_storage.exists(self.orphan_name))
+        self.assertFalse(default_storage.exists(
+            self.dangling.thumbnailed_image.name))
+        self.assertFalse(
+            ThumbnailImage.objects.filter(id=self.dangling.id).exists())
+        self.assertFalse(Image.objects.filter(id=self.missing.id).exists())
+        # Referenced and young files stay
+        self.assertTrue(default_storage.exists(self.image.image.name))
+        self.assertTrue(default_storage.exists(self.young_orphan_name))
@@ -0,0 +1,72 @@
+import threading
+import time
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from core.middleware import Sampler, profile_token
+from .test_models import sample_user, sample_plan
+
+IMAGE_LIST_URL = reverse('thumbnail:list-image')
+
+
+def busy_loop(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+@override_settings(SUSPEND_SIGNALS=True, PROFILING_SAMPLE_RATE=0)
+class ProfilingMiddlewareTests(APITestCase):
+    def setUp(self):
+        self.user = sample_user(
+            email='test@email.com', name='test', password='testpassword',
+            plan=sample_plan(name='Plan'))
+        self.client.force_authenticate(self.user)
+
+    def test_query_budget(self):
+        with override_settings(QUERY_BUDGETS={'thumbnail:list-image': 50}):
+            with self.assertNoLogs('profiling'):
+                self.client.get(IMAGE_LIST_URL)
+        with override_settings(QUERY_BUDGETS={'thumbnail:list-image': 0}):
+            with self.assertLogs('profiling', 'ERROR') as logs:
+                # Another URL, the first page is cached
+                self.client.get(IMAGE_LIST_URL, {'page': 1})
+        self.assertIn('GET thumbnail:list-image made', logs.output[0])
+        self.assertIn('budget is 0', logs.output[0])
+
+    def test_profile_with_signed_header(self):
+        with self.assertLogs('profiling', 'INFO') as logs:
+            self.client.get(IMAGE_LIST_URL, HTTP_X_PROFILE=profile_token())
+        self.assertRegex(
+            logs.output[0], r'GET thumbnail:list-image \d+ queries')
+
+        with self.assertNoLogs('profiling'):
+            self.client.get(IMAGE_LIST_URL, HTTP_X_PROFILE='profile:forged')
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_profile_sampled_requests(self):
+        with self.assertLogs('profiling', 'INFO'):
+            self.client.get(IMAGE_LIST_URL)
+
+    def test_profile_token_command(self):
+        out = StringIO()
+        call_command('profile_token', stdout=out)
+        token = out.getvalue().strip()
+        with self.assertLogs('profiling', 'INFO'):
+            self.client.get(IMAGE_LIST_URL, HTTP_X_PROFILE=token)
+
+
+class SamplerTests(TestCase):
+    def test_folded_stacks(self):
+        sampler = Sampler()
+        stacks = sampler.start(threading.get_ident())
+        busy_loop(0.1)
+        sampler.stop(threading.get_ident())
+        self.assertTrue(stacks)
+        stack = max(stacks, key=stacks.get)
+        self.assertTrue(stack.endswith(
+            'SamplerTests.test_folded_stacks;'
+            'core.tests.test_middleware.busy_loop'))
+        self.assertFalse(sampler.active.is_set())
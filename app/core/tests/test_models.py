@@ -3,6 +3,7 @@ import os
 import shutil
 import tempfile
 from PIL import Image
+from django.conf import settings
 from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
@@ -10,6 +11,15 @@ from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.utils import timezone
 from core import models
 
+# Tests that clear the cache use a local one, never the shared Redis
+LOCAL_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # Read as the Redis URL by core.redis and the notifications
+        'LOCATION': settings.CACHES['default']['LOCATION'],
+    }
+}
+
 
 def sample_user(**params):
     """Creating a user model for testing."""
@@ -142,7 +152,7 @@ class ModelsTests(TestCase):
         uuid = 'test-uuid'
         patched_uuid.return_value = uuid
         file_path = models.image_file_path(None, 'example.png')
-        self.assertEqual(file_path, f'uploads/{uuid}.png')
+        self.assertEqual(file_path, f'uploads/a1/d6/{uuid}.png')
 
     @patch('core.models.uuid.uuid4')
     def test_image_model(self, patched_uuid):
@@ -164,7 +174,7 @@ class ModelsTests(TestCase):
             uuid = 'test-uuid'
             patched_uuid.return_value = uuid
             file_path = models.image_file_path(image_model, image.name)
-            self.assertEqual(file_path, f'uploads/{uuid}.png')
+            self.assertEqual(file_path, f'uploads/a1/d6/{uuid}.png')
             self.assertTrue(image_model.image)
 
     def test_image_model_upload_with_invalid_ext(self):
@@ -199,7 +209,7 @@ class ModelsTests(TestCase):
             uuid = 'test-uuid'
             patched_uuid.return_value = uuid
             file_path = models.image_file_path(thumbnail_model, thumbnail.name)
-            self.assertEqual(file_path, f'uploads/{uuid}.png')
+            self.assertEqual(file_path, f'uploads/a1/d6/{uuid}.png')
             self.assertTrue(thumbnail_model.thumbnailed_image)
 
     def test_thumbnail_image_model_upload_with_invalid_ext(self):
@@ -229,7 +239,7 @@ class ModelsTests(TestCase):
             uuid = 'test-uuid'
             patched_uuid.return_value = uuid
             file_path = models.image_file_path(bimage_model, bimage.name)
-            self.assertEqual(file_path, f'uploads/{uuid}.png')
+            self.assertEqual(file_path, f'uploads/a1/d6/{uuid}.png')
             self.assertTrue(bimage_model.binary_image)
             self.assertEqual(
                 bimage_model.date_created.hour, timezone.now().hour)
@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.test import TestCase
 from django.core.cache import cache
+from core.redis import SharedConnectionPool, get_redis_client
 
 
 class RedisTestCase(TestCase):
@@ -10,3 +12,16 @@ class RedisTestCase(TestCase):
 
         result = cache.get(key)
         self.assertEqual(result, value)
+
+    def test_shared_redis_pool(self):
+        client = get_redis_client()
+        other_client = get_redis_client()
+        self.assertIs(client.connection_pool, other_client.connection_pool)
+        self.assertEqual(
+            client.connection_pool.max_connections,
+            settings.REDIS_MAX_CONNECTIONS)
+
+    def test_cache_pool_class_is_shared(self):
+        pool = SharedConnectionPool.from_url(
+            'redis://localhost:6379/0', max_connections=1000)
+        self.assertIs(pool, get_redis_client().connection_pool)
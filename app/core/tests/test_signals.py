@@ -9,7 +9,7 @@ from .test_models import (
     sample_plan,
     sample_thumbnail
 )
-from core.models import Image
+from core.models import Image, Backfill
 
 IMAGE_UPLOAD_URL = reverse('thumbnail:upload-image')
 
@@ -19,6 +19,14 @@ IMAGE_UPLOAD_URL = reverse('thumbnail:upload-image')
     CELERY_TASK_EAGER_PROPAGATES=True
 )
 class SignalsTests(APITestCase):
+    def upload_image(self):
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            img = pill_image.new('RGB', (200, 200))
+            img.save(image_file, 'png')
+            image_file.seek(0)
+            return self.client.post(
+                IMAGE_UPLOAD_URL, {'image': image_file}, format='multipart')
+
     def setUp(self):
         self.plan = sample_plan(name='test')
         self.plan.thumbnails.add(sample_thumbnail(value=100).id)
@@ -46,3 +54,40 @@ class SignalsTests(APITestCase):
         self.user.plan = plan2
         self.user.save()
         self.assertEqual(Image.objects.first().thumbnails.count(), 10)
+
+    @override_settings(BACKFILL_CHUNK_SIZE=2)
+    def test_plan_thumbnail_added_backfill(self):
+        self.client.force_authenticate(user=self.user)
+        for _ in range(3):
+            self.upload_image()
+        self.assertEqual(Image.objects.first().thumbnails.count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.thumbnails.add(sample_thumbnail(value=300))
+
+        for image in Image.objects.all():
+            self.assertEqual(image.thumbnails.count(), 2)
+        backfill = Backfill.objects.get()
+        self.assertEqual(backfill.thumbnail_values, [300])
+        self.assertEqual(backfill.status, Backfill.Status.DONE)
+        self.assertEqual(backfill.processed, 3)
+        self.assertEqual(backfill.total, 3)
+        self.assertEqual(
+            backfill.last_image_id, Image.objects.order_by('id').last().id)
+
+    def test_plan_without_images_backfill(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.thumbnails.add(sample_thumbnail(value=300))
+
+        self.assertFalse(Backfill.objects.exists())
+
+    def test_image_count_signals(self):
+        self.client.force_authenticate(user=self.user)
+        self.upload_image()
+        self.upload_image()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.image_count, 2)
+
+        Image.objects.first().delete()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.image_count, 1)
@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+from django.conf import settings
+from django.test import SimpleTestCase
+from app.celery import default_settings_module
+
+# Prints which of the heavy modules got imported
+REPORT = (
+    'import json, sys; print(json.dumps({name: name in sys.modules '
+    'for name in ("PIL", "thumbnail.tasks", "django.contrib.admin")}))')
+
+
+def loaded_modules(settings_module: str, code: str) -> dict:
+    """Run code in a new interpreter with the given settings."""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    env.setdefault('SECRET_KEY', 'test')
+    process = subprocess.run(
+        [sys.executable, '-c', f'{code}; {REPORT}'], env=env,
+        cwd=settings.BASE_DIR, capture_output=True, text=True, check=True)
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+class StartupTests(SimpleTestCase):
+    def test_setup_is_lean(self):
+        loaded = loaded_modules(
+            settings.SETTINGS_MODULE, 'import django; django.setup()')
+        self.assertFalse(loaded['PIL'])
+        self.assertFalse(loaded['thumbnail.tasks'])
+
+    def test_web_loads_pillow_on_demand(self):
+        loaded = loaded_modules('app.settings_web', (
+            'import django; django.setup(); '
+            'from django.urls import get_resolver; '
+            'get_resolver().url_patterns'))
+        self.assertFalse(loaded['PIL'])
+        self.assertTrue(loaded['thumbnail.tasks'])
+
+    def test_worker_profile(self):
+        loaded = loaded_modules('app.settings_worker', (
+            'from app.celery import app; '
+            'app.loader.import_default_modules()'))
+        self.assertTrue(loaded['thumbnail.tasks'])
+        self.assertFalse(loaded['django.contrib.admin'])
+
+    def test_default_profiles(self):
+        for argv, profile in (
+                (['/py/bin/celery', '-A', 'app', 'worker'],
+                 'app.settings_worker'),
+                ([os.path.join('celery', '__main__.py'), 'beat'],
+                 'app.settings_worker'),
+                (['/py/bin/gunicorn', 'app.wsgi'], 'app.settings_web'),
+                ([], 'app.settings_web')):
+            with self.subTest(argv=argv), patch.object(sys, 'argv', argv):
+                self.assertEqual(default_settings_module(), profile)
@@ -0,0 +1,24 @@
+from django.test import TestCase, override_settings
+from core.models import Image
+from core.tasks import reconcile_image_counts
+from .test_models import sample_user
+
+
+@override_settings(SUSPEND_SIGNALS=True)
+class ReconcileImageCountsTests(TestCase):
+    def test_reconcile_image_counts(self):
+        user = sample_user(
+            email='test@test.com', name='test', password='testpassword')
+        other = sample_user(
+            email='other@test.com', name='other', password='testpassword')
+        Image.objects.bulk_create(
+            [Image(user=user, image='uploads/image.png')] * 2)
+        # Counter drifted
+        other.__class__.objects.filter(id=other.id).update(image_count=5)
+
+        self.assertEqual(reconcile_image_counts(), 2)
+        user.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(user.image_count, 2)
+        self.assertEqual(other.image_count, 0)
+        self.assertEqual(reconcile_image_counts(), 0)
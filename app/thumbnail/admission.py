@@ -0,0 +1,69 @@
+from celery import current_app
+from kombu.exceptions import ChannelError, OperationalError
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext as _
+from rest_framework.exceptions import Throttled
+from .registry import user_jobs
+
+QUEUE_DEPTH_KEY = 'thumbnail-queue-depth'
+WORKER_LAG_KEY = 'thumbnail-worker-lag'
+
+
+def queue_depth() -> int:
+    """Messages waiting in the broker queue, cached for a moment."""
+    depth = cache.get(QUEUE_DEPTH_KEY)
+    if depth is None:
+        queues = (
+            current_app.conf.task_default_queue,
+            *settings.WORKER_NODE_QUEUES)
+        try:
+            with current_app.connection_for_read() as connection:
+                connection.ensure_connection(max_retries=1)
+                channel = connection.default_channel
+                depth = sum(
+                    channel.queue_declare(
+                        queue=queue, passive=True).message_count
+                    for queue in queues)
+        except (ChannelError, OperationalError, OSError):
+            # Queue not declared yet or broker down, do not block uploads
+            depth = 0
+        cache.set(QUEUE_DEPTH_KEY, depth, settings.ADMISSION_PROBE_TTL)
+    return depth
+
+
+def record_worker_lag(lag: float) -> None:
+    """Remember how long the last job waited in the queue."""
+    cache.set(WORKER_LAG_KEY, lag, settings.ADMISSION_LAG_TTL)
+
+
+def worker_lag() -> float:
+    """Seconds the last job waited in the queue, 0 when none ran lately."""
+    return cache.get(WORKER_LAG_KEY, 0)
+
+
+def is_overloaded() -> bool:
+    """Whether the queue is deeper or slower than configured."""
+    return queue_depth() >= settings.ADMISSION_MAX_QUEUE_DEPTH or \
+        worker_lag() >= settings.ADMISSION_MAX_LAG
+
+
+def admit_upload(user) -> bool:
+    """
+    Decide what to do with an upload.
+
+    Return True to process it now, False to store it and process it later.
+    Raise Throttled (429 with Retry-After) when uploads are rejected.
+    """
+    if not settings.ADMISSION_MAX_QUEUE_DEPTH or not is_overloaded():
+        return True
+    # Fair share, users below their plan's quota still get through
+    quota = getattr(user.plan, 'max_pending_jobs', None) \
+        or settings.ADMISSION_PENDING_JOBS
+    if user_jobs(user.id) < quota:
+        return True
+    if settings.ADMISSION_OVERLOAD_ACTION == 'defer':
+        return False
+    raise Throttled(
+        wait=settings.ADMISSION_RETRY_AFTER,
+        detail=_('Too many images are waiting for thumbnails.'))
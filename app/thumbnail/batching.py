@@ -0,0 +1,20 @@
+import json
+from core.redis import get_redis_client
+
+BATCH_KEY = 'thumbnail-batch'
+
+
+def push_job(job: list) -> int:
+    """Append a thumbnail job to the shared buffer, return its length."""
+    return get_redis_client().rpush(BATCH_KEY, json.dumps(job))
+
+
+def pop_jobs(count: int) -> tuple[list[list], int]:
+    """Take up to count jobs off the buffer, return them and what is left."""
+    with get_redis_client().pipeline() as pipe:
+        # Atomic, works on Redis older than LPOP with a count
+        pipe.lrange(BATCH_KEY, 0, count - 1)
+        pipe.ltrim(BATCH_KEY, count, -1)
+        pipe.llen(BATCH_KEY)
+        jobs, _trimmed, remaining = pipe.execute()
+    return [json.loads(job) for job in jobs], remaining
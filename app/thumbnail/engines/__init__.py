@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from .base import BaseEngine
+
+_engines = {}
+
+
+def get_engine() -> BaseEngine:
+    """Engine configured by THUMBNAIL_ENGINE, one instance per process."""
+    path = settings.THUMBNAIL_ENGINE
+    if path not in _engines:
+        try:
+            engine_class = import_string(path)
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                f'Cannot import THUMBNAIL_ENGINE {path}: {e}')
+        _engines[path] = engine_class()
+    return _engines[path]
@@ -0,0 +1,120 @@
+from io import BytesIO
+from PIL import Image as pill_image
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from .pillow import PillowEngine
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Pixels at or above become white
+THRESHOLD = 128
+BAYER_SIZE = 8
+DIFFUSION_BLOCK = 16
+
+
+def threshold(gray):
+    """Binarize (..., height, width) uint8 arrays at a fixed level."""
+    return gray >= THRESHOLD
+
+
+def bayer_matrix(size: int = BAYER_SIZE):
+    """Ordered dithering thresholds of a size x size Bayer matrix."""
+    matrix = np.zeros((1, 1), dtype=np.int64)
+    while matrix.shape[0] < size:
+        matrix = np.block([
+            [4 * matrix, 4 * matrix + 2],
+            [4 * matrix + 3, 4 * matrix + 1]])
+    # Spread over 0-255 around the cell centres, rounded up so that
+    # comparing integers gives the same result
+    return np.ceil((matrix + 0.5) * 256 / matrix.size).astype(np.uint8)
+
+
+def ordered(gray):
+    """Bayer dither (..., height, width) uint8 arrays."""
+    height, width = gray.shape[-2:]
+    # Tiled over the image, broadcast over leading dimensions
+    thresholds = np.tile(bayer_matrix(), (
+        -(-height // BAYER_SIZE), -(-width // BAYER_SIZE)))
+    return gray >= thresholds[:height, :width]
+
+
+def diffuse(gray, block: int = DIFFUSION_BLOCK):
+    """
+    Floyd-Steinberg dither (..., height, width) uint8 arrays in blocks.
+
+    Errors do not cross block borders, so every block of every image is
+    diffused at once, one pixel position per step.
+    """
+    *lead, height, width = gray.shape
+    padding = [(0, 0)] * len(lead) + [
+        (0, -height % block), (0, -width % block)]
+    work = np.pad(gray, padding, mode='edge')
+    rows, columns = work.shape[-2] // block, work.shape[-1] // block
+    # Pixel position in the block first, (block, block, ..., rows, columns),
+    # so that each step works on contiguous memory
+    blocks = np.moveaxis(
+        work.reshape(*lead, rows, block, columns, block), (-3, -1), (0, 1))
+    # Margins take the errors leaving a block
+    values = np.zeros((block + 1, block + 2) + blocks.shape[2:], np.float32)
+    values[:block, 1:block + 1] = blocks
+    bits = np.empty(blocks.shape, dtype=bool)
+    for y in range(block):
+        for x in range(1, block + 1):
+            white = values[y, x] >= THRESHOLD
+            bits[y, x - 1] = white
+            error = values[y, x] - white * np.float32(255)
+            error *= np.float32(1 / 16)
+            values[y, x + 1] += error * 7
+            values[y + 1, x - 1] += error * 3
+            values[y + 1, x] += error * 5
+            values[y + 1, x + 1] += error
+    bits = np.moveaxis(bits, (0, 1), (-3, -1)).reshape(work.shape)
+    return bits[..., :height, :width]
+
+
+METHODS = {
+    'threshold': threshold,
+    'ordered': ordered,
+    'diffusion': diffuse,
+}
+
+
+def pack(bits):
+    """Rows of 1 bit pixels, most significant bit first, white is 1."""
+    return np.packbits(bits, axis=-1)
+
+
+def bits_image(bits):
+    """Pillow '1' image of a (height, width) boolean array."""
+    height, width = bits.shape
+    return pill_image.frombytes('1', (width, height), pack(bits).tobytes())
+
+
+class NumpyEngine(PillowEngine):
+    """
+    Pillow, with binary images made by NumPy array operations.
+
+    BINARY_METHOD picks threshold, ordered (Bayer) or diffusion, the
+    blocked Floyd-Steinberg. The functions take stacks of images or
+    tiles, see benchmarks.binary.
+    """
+
+    def __init__(self):
+        if np is None:
+            raise ImproperlyConfigured('NumpyEngine needs numpy installed.')
+        if settings.BINARY_METHOD not in METHODS:
+            raise ImproperlyConfigured(
+                f'Unknown BINARY_METHOD {settings.BINARY_METHOD}, '
+                f'use one of {", ".join(METHODS)}.')
+        self.binarize = METHODS[settings.BINARY_METHOD]
+
+    def binary(self, source, max_pixels):
+        with pill_image.open(source) as im:
+            self.fit(im, max_pixels)
+            gray = np.asarray(im.convert('L'))
+        io_img = BytesIO()
+        bits_image(self.binarize(gray)).save(io_img, 'png')
+        return io_img
@@ -0,0 +1,38 @@
+import os
+from io import BytesIO
+
+
+def local_path(source) -> str | None:
+    """Filesystem path of a source file, None when it is not local."""
+    try:
+        path = source.path
+    except (AttributeError, NotImplementedError, ValueError):
+        path = getattr(source, 'name', None)
+    if path and os.path.isfile(path):
+        return path
+    return None
+
+
+class BaseEngine:
+    """
+    Image operations the workers need.
+
+    Sources are file objects (usually a FieldFile), results are PNG or JPEG
+    bytes in a BytesIO positioned at its end.
+    """
+
+    def dimensions(self, source) -> tuple[int, int]:
+        """Width and height read from the header only."""
+        raise NotImplementedError
+
+    def thumbnail(self, source, value: int) -> BytesIO:
+        """PNG fitting into value x value, never upscaled."""
+        raise NotImplementedError
+
+    def binary(self, source, max_pixels: int) -> BytesIO:
+        """Black and white PNG, downscaled to at most max_pixels."""
+        raise NotImplementedError
+
+    def placeholder(self, source, size: int) -> bytes:
+        """Tiny JPEG preview with the longest side of size."""
+        raise NotImplementedError
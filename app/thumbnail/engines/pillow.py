@@ -0,0 +1,44 @@
+from io import BytesIO
+from PIL import Image as pill_image
+from .base import BaseEngine
+
+
+class PillowEngine(BaseEngine):
+    """Pillow, decodes the whole image into memory."""
+
+    def dimensions(self, source):
+        with pill_image.open(source) as im:
+            return im.size
+
+    def thumbnail(self, source, value):
+        with pill_image.open(source) as im:
+            io_img = BytesIO()
+            # Make thumbnail
+            im.thumbnail((value, value))
+            im.save(io_img, 'png')
+            return io_img
+
+    def fit(self, im, max_pixels):
+        """Downscale an opened image in place to at most max_pixels."""
+        # Decode huge images at reduced size, JPEG skips the full decode
+        pixels = im.width * im.height
+        if pixels > max_pixels:
+            scale = (max_pixels / pixels) ** 0.5
+            im.thumbnail((
+                max(1, int(im.width * scale)),
+                max(1, int(im.height * scale))))
+
+    def binary(self, source, max_pixels):
+        with pill_image.open(source) as im:
+            io_img = BytesIO()
+            self.fit(im, max_pixels)
+            im = im.convert('1')
+            im.save(io_img, 'png')
+            return io_img
+
+    def placeholder(self, source, size):
+        with pill_image.open(source) as im:
+            im.thumbnail((size, size))
+            io_img = BytesIO()
+            im.convert('RGB').save(io_img, 'jpeg', quality=60)
+            return io_img.getvalue()
@@ -0,0 +1,256 @@
+import math
+import struct
+import zlib
+from io import BytesIO
+from PIL import Image as pill_image, PngImagePlugin
+from .pillow import PillowEngine
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Bands of the 8 bit PNG colour types decoded without conversion
+PNG_BANDS = {0: 1, 2: 3, 4: 2, 6: 4}
+READ_SIZE = 64 * 1024
+# Same as Image.thumbnail()
+REDUCING_GAP = 2.0
+
+
+def read_chunks(source):
+    """Yield (type, length) of PNG chunks, the data is left to the caller."""
+    source.seek(0)
+    if source.read(8) != PNG_SIGNATURE:
+        return
+    while True:
+        head = source.read(8)
+        if len(head) < 8:
+            return
+        length, chunk_type = struct.unpack('>I4s', head)
+        yield chunk_type, length
+        if chunk_type == b'IEND':
+            return
+
+
+def read_png_header(source) -> tuple[int, int, int] | None:
+    """Width, height and colour type of a PNG readable in strips."""
+    header = None
+    for chunk_type, length in read_chunks(source):
+        if chunk_type == b'IHDR':
+            width, height, depth, colour, _c, _f, interlace = struct.unpack(
+                '>IIBBBBB', source.read(length))
+            source.read(4)
+            if depth != 8 or interlace or colour not in PNG_BANDS:
+                return None
+            header = width, height, colour
+        elif chunk_type == b'tRNS':
+            # Pillow keeps it as info, left to the full-frame path
+            return None
+        elif chunk_type == b'IDAT':
+            return header
+        else:
+            source.seek(length + 4, 1)
+    return None
+
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack(
+        '>I', zlib.crc32(chunk_type + data))
+
+
+def decode_rows(width, colour, data, rows, previous):
+    """
+    Let Pillow unfilter and decode filtered scanlines.
+
+    The rows are wrapped into a PNG of their own, after the previous
+    unfiltered row stored with filter type None, which the first row's
+    filter may refer to.
+    """
+    if previous is not None:
+        data = b'\x00' + previous + data
+        rows += 1
+    ihdr = struct.pack('>IIBBBBB', width, rows, 8, colour, 0, 0, 0)
+    png = PNG_SIGNATURE + png_chunk(b'IHDR', ihdr) + \
+        png_chunk(b'IDAT', zlib.compress(data, 0)) + png_chunk(b'IEND', b'')
+    with pill_image.open(BytesIO(png)) as im:
+        im.load()
+        if previous is not None:
+            return im.crop((0, 1, width, rows))
+        return im.copy()
+
+
+def png_strips(source, rows: int):
+    """Yield (top, image) strips of at most rows rows of a PNG."""
+    width, height, colour = read_png_header(source)
+    row_size = 1 + width * PNG_BANDS[colour]
+    strip_size = rows * row_size
+    decompressor = zlib.decompressobj()
+    buffer = bytearray()
+    previous = None
+    top = 0
+
+    def strips(final=False):
+        nonlocal buffer, previous, top
+        while len(buffer) >= strip_size or (final and buffer):
+            count = min(rows, len(buffer) // row_size, height - top)
+            if count <= 0:
+                return
+            data = bytes(buffer[:count * row_size])
+            del buffer[:count * row_size]
+            strip = decode_rows(width, colour, data, count, previous)
+            # Raw bytes of 8 bit modes equal the unfiltered scanline
+            previous = strip.crop(
+                (0, count - 1, width, count)).tobytes()
+            yield top, strip
+            top += count
+
+    for chunk_type, length in read_chunks(source):
+        if chunk_type != b'IDAT':
+            source.seek(length + 4, 1)
+            continue
+        remaining = length
+        while remaining:
+            data = source.read(min(READ_SIZE, remaining))
+            if not data:
+                raise OSError('Truncated PNG data.')
+            remaining -= len(data)
+            while data:
+                # Bounded output, the rest waits in unconsumed_tail
+                buffer += decompressor.decompress(data, strip_size)
+                data = decompressor.unconsumed_tail
+                yield from strips()
+        source.read(4)
+    buffer += decompressor.flush()
+    yield from strips(final=True)
+    if top != height:
+        raise OSError(f'PNG has {top} of {height} rows.')
+
+
+def thumbnail_size(width, height, size) -> tuple[int, int] | None:
+    """Size Image.thumbnail() picks, None when the image fits already."""
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    x, y = size
+    if x >= width and y >= height:
+        return None
+    aspect = width / height
+    if x / y >= aspect:
+        x = round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
+    else:
+        y = round_aspect(
+            x / aspect, key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return x, y
+
+
+class TiledEngine(PillowEngine):
+    """
+    Pillow, with big PNGs decoded and downscaled strip by strip.
+
+    Memory follows strip_pixels, column_pixels and the size of the
+    result, not the pixel count. Binary images are dithered whole, at
+    most BINARY_MAX_PIXELS. Results are the same as Pillow's, the
+    full-frame path is kept for small images, other formats and modes
+    the strips cannot reproduce exactly.
+    """
+    # Images up to this size are decoded whole
+    min_pixels = 16_000_000
+    # Pixels decoded at a time
+    strip_pixels = 4_000_000
+    # Pixels of resized columns kept for the vertical pass
+    column_pixels = 16_000_000
+
+    def dimensions(self, source):
+        # Image.open() refuses PNGs over twice MAX_IMAGE_PIXELS as
+        # decompression bombs, the strips never decode them whole
+        header = read_png_header(source)
+        source.seek(0)
+        if header is None:
+            return super().dimensions(source)
+        return header[:2]
+
+    def strips_header(self, source) -> tuple[int, int, str] | None:
+        """Width, height and mode of an image worth reading in strips."""
+        header = read_png_header(source)
+        source.seek(0)
+        if header is None or header[0] * header[1] <= self.min_pixels:
+            return None
+        width, height, colour = header
+        return width, height, {0: 'L', 2: 'RGB', 4: 'LA', 6: 'RGBA'}[colour]
+
+    def shrink(self, source, mode, width, height, size):
+        """Image.resize(size) of the whole image the way thumbnail() does."""
+        resample = pill_image.Resampling.BICUBIC
+        factor_x = int(width / size[0] / REDUCING_GAP) or 1
+        factor_y = int(height / size[1] / REDUCING_GAP) or 1
+        rows = max(1, self.strip_pixels // width)
+        if mode in ('L', 'RGB') and (factor_x > 1 or factor_y > 1):
+            # Box reduce is local, strips of whole blocks reduce the same
+            rows = math.ceil(rows / factor_y) * factor_y
+            reduced = pill_image.new(mode, (
+                math.ceil(width / factor_x), math.ceil(height / factor_y)))
+            for top, strip in png_strips(source, rows):
+                reduced.paste(
+                    strip.reduce((factor_x, factor_y)), (0, top // factor_y))
+            return reduced.resize(size, resample, box=(
+                0, 0, width / factor_x, height / factor_y))
+        # Pillow resizes alpha premultiplied and without reducing. Its
+        # horizontal pass is per row and its vertical one per column, so
+        # whole columns are gathered a slice at a time, decoding again
+        # for every slice
+        work_mode = {'LA': 'La', 'RGBA': 'RGBa'}.get(mode, mode)
+        slice_width = max(1, self.column_pixels // height)
+        im = pill_image.new(work_mode, size)
+        for left in range(0, size[0], slice_width):
+            right = min(left + slice_width, size[0])
+            columns = pill_image.new(work_mode, (right - left, height))
+            for top, strip in png_strips(source, rows):
+                strip = strip.convert(work_mode).resize(
+                    (size[0], strip.height), resample,
+                    box=(0, 0, width, strip.height))
+                columns.paste(
+                    strip.crop((left, 0, right, strip.height)), (0, top))
+            im.paste(columns.resize(
+                (right - left, size[1]), resample,
+                box=(0, 0, right - left, height)), (left, 0))
+        return im.convert(mode)
+
+    def shrunk(self, source, size):
+        """Thumbnail into size read in strips, None for the full frame."""
+        header = self.strips_header(source)
+        if header is None:
+            return None
+        width, height, mode = header
+        # Only the chunks before the pixels, without Image.open()'s
+        # decompression bomb check
+        with PngImagePlugin.PngImageFile(source) as original:
+            info = original.info.copy()
+        size = thumbnail_size(width, height, size)
+        if size is None:
+            return None
+        im = self.shrink(source, mode, width, height, size)
+        # thumbnail() keeps the source's info, e.g. its ICC profile
+        im.info = info
+        return im
+
+    def thumbnail(self, source, value):
+        im = self.shrunk(source, (value, value))
+        if im is None:
+            source.seek(0)
+            return super().thumbnail(source, value)
+        io_img = BytesIO()
+        im.save(io_img, 'png')
+        return io_img
+
+    def binary(self, source, max_pixels):
+        width, height = self.dimensions(source)
+        source.seek(0)
+        im = None
+        pixels = width * height
+        if pixels > max_pixels:
+            scale = (max_pixels / pixels) ** 0.5
+            im = self.shrunk(source, (
+                max(1, int(width * scale)), max(1, int(height * scale))))
+        if im is None:
+            source.seek(0)
+            return super().binary(source, max_pixels)
+        # Dithering runs on the downscaled image only
+        io_img = BytesIO()
+        im.convert('1').save(io_img, 'png')
+        return io_img
@@ -0,0 +1,72 @@
+from io import BytesIO
+from django.core.exceptions import ImproperlyConfigured
+from .base import BaseEngine, local_path
+
+try:
+    import pyvips
+except ImportError:
+    pyvips = None
+
+
+class VipsEngine(BaseEngine):
+    """
+    libvips through pyvips, streams local files instead of decoding them
+    whole, so memory stays flat for big images.
+
+    Binary images are thresholded, Pillow dithers them.
+    """
+
+    def __init__(self):
+        if pyvips is None:
+            raise ImproperlyConfigured(
+                'VipsEngine needs pyvips and libvips installed.')
+
+    def load(self, source, **kwargs):
+        """Open a source lazily, from disk when it is a local file."""
+        path = local_path(source)
+        if path:
+            return pyvips.Image.new_from_file(path, **kwargs)
+        source.seek(0)
+        return pyvips.Image.new_from_buffer(source.read(), '', **kwargs)
+
+    def shrink(self, source, width, height):
+        """Demand-driven downscale into width x height."""
+        path = local_path(source)
+        if path:
+            return pyvips.Image.thumbnail(
+                path, width, height=height, size='down')
+        source.seek(0)
+        return pyvips.Image.thumbnail_buffer(
+            source.read(), width, height=height, size='down')
+
+    def dimensions(self, source):
+        im = self.load(source)
+        return im.width, im.height
+
+    def thumbnail(self, source, value):
+        im = self.shrink(source, value, value)
+        io_img = BytesIO(im.pngsave_buffer())
+        io_img.seek(0, 2)
+        return io_img
+
+    def binary(self, source, max_pixels):
+        im = self.load(source, access='sequential')
+        pixels = im.width * im.height
+        if pixels > max_pixels:
+            scale = (max_pixels / pixels) ** 0.5
+            im = self.shrink(
+                source,
+                max(1, int(im.width * scale)),
+                max(1, int(im.height * scale)))
+        if im.hasalpha():
+            im = im.flatten()
+        im = (im.colourspace('b-w') > 127)
+        io_img = BytesIO(im.pngsave_buffer(bitdepth=1))
+        io_img.seek(0, 2)
+        return io_img
+
+    def placeholder(self, source, size):
+        im = self.shrink(source, size, size)
+        if im.hasalpha():
+            im = im.flatten()
+        return im.jpegsave_buffer(Q=60)
@@ -0,0 +1,70 @@
+import os
+import time
+import zipfile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from core.models import Image, ThumbnailImage
+
+
+class ZipStream:
+    """Write-only file object that hands over what ZipFile wrote to it."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Yield and forget everything written since the last call."""
+        if self._chunks:
+            data = b''.join(self._chunks)
+            self._chunks.clear()
+            yield data
+
+
+def archive_entries(user):
+    """Yield (archive name, stored name) pairs the user may export."""
+    plan = user.plan
+    images = Image.objects.filter(user=user).order_by('id')
+    chunk_size = settings.EXPORT_QUERY_CHUNK_SIZE
+    # Names only, few bytes a row, the view reads them all up front
+    if plan.original_image:
+        for uuid, name in images.values_list('uuid', 'image')\
+                .iterator(chunk_size=chunk_size):
+            ext = os.path.splitext(name)[1]
+            yield f'originals/{uuid}{ext}', name
+    thumbnails = ThumbnailImage.objects\
+        .filter(image__in=images, size__in=plan.thumbnails.values('value'))\
+        .order_by('image_id', 'size')\
+        .values_list('image__uuid', 'size', 'thumbnailed_image')
+    for uuid, value, name in thumbnails.iterator(chunk_size=chunk_size):
+        ext = os.path.splitext(name)[1]
+        yield f'thumbnails/{value}/{uuid}{ext}', name
+
+
+def stream_zip(entries):
+    """Build a ZIP archive of the entries and yield it piece by piece."""
+    stream = ZipStream()
+    chunk_size = settings.EXPORT_FILE_CHUNK_SIZE
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as archive:
+        for name, stored_name in entries:
+            try:
+                size = default_storage.size(stored_name)
+                stored_file = default_storage.open(stored_name, 'rb')
+            except FileNotFoundError:
+                # Row without a file, nothing to export
+                continue
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.file_size = size
+            with stored_file, archive.open(info, 'w') as dest:
+                for chunk in stored_file.chunks(chunk_size):
+                    dest.write(chunk)
+                    yield from stream.drain()
+            yield from stream.drain()
+    # Central directory
+    yield from stream.drain()
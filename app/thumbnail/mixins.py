@@ -0,0 +1,40 @@
+import asyncio
+from asgiref.sync import sync_to_async
+
+
+class AsyncAPIViewMixin:
+    """
+    Run DRF's request cycle with coroutine handlers.
+
+    Authentication, permissions and throttling still go through
+    `initial()`, but in a worker thread, so the event loop stays free
+    while the handler awaits storage and Celery.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            # Get handler
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(),
+                    self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            # Await coroutine handlers, call the sync ones (OPTIONS)
+            if asyncio.iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs)
+        return self.response
@@ -0,0 +1,132 @@
+import asyncio
+import contextlib
+import json
+import weakref
+from collections import defaultdict
+import redis
+import redis.asyncio
+from django.conf import settings
+from core.redis import get_redis_client
+
+CHANNEL_PREFIX = 'thumbnails-ready-'
+
+
+def channel_name(user_id: int) -> str:
+    """Pub/sub channel announcing a user's new thumbnails."""
+    return f'{CHANNEL_PREFIX}{user_id}'
+
+
+def events_key(user_id: int) -> str:
+    """List of a user's recent thumbnail events."""
+    return f'thumbnail-events-{user_id}'
+
+
+def publish_ready(user_id: int, image_uuid, sizes: list[int]) -> None:
+    """Record and announce thumbnails that are ready, best effort."""
+    try:
+        client = get_redis_client()
+        event_id = client.incr(f'thumbnail-events-seq-{user_id}')
+        event = json.dumps(
+            {'id': event_id, 'image': str(image_uuid), 'sizes': sizes})
+        key = events_key(user_id)
+        with client.pipeline() as pipe:
+            pipe.rpush(key, event)
+            pipe.ltrim(key, -settings.NOTIFICATIONS_KEPT, -1)
+            pipe.expire(key, settings.NOTIFICATIONS_TTL)
+            pipe.publish(channel_name(user_id), event_id)
+            pipe.execute()
+    except redis.RedisError:
+        # Clients fall back to listing their images
+        pass
+
+
+def read_events(user_id: int, after: int) -> list[dict]:
+    """Recent events of a user newer than the given event id."""
+    events = (
+        json.loads(event)
+        for event in get_redis_client().lrange(events_key(user_id), 0, -1))
+    return [event for event in events if event['id'] > after]
+
+
+class NotificationHub:
+    """
+    One pattern subscription per event loop, shared by all waiting
+    requests, so an idle client costs an asyncio.Event, not a connection.
+    """
+
+    def __init__(self):
+        self.waiters = defaultdict(set)
+        self.reader = None
+        self.subscribed = None
+
+    @contextlib.contextmanager
+    def listen(self, user_id: int):
+        """Register for announcements, yield the event to wait on."""
+        ready = asyncio.Event()
+        self.waiters[user_id].add(ready)
+        try:
+            yield ready
+        finally:
+            self.waiters[user_id].discard(ready)
+            if not self.waiters[user_id]:
+                del self.waiters[user_id]
+
+    async def subscribe(self, timeout: float) -> bool:
+        """Start the shared subscription, False if it is not live."""
+        if self.reader is None or self.reader.done():
+            self.subscribed = asyncio.Event()
+            self.reader = asyncio.create_task(self.read(self.subscribed))
+        subscribed = asyncio.ensure_future(self.subscribed.wait())
+        try:
+            # The reader ends early when Redis is unavailable
+            await asyncio.wait(
+                {subscribed, self.reader}, timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            subscribed.cancel()
+        return self.subscribed.is_set() and not self.reader.done()
+
+    async def wait(self, ready: asyncio.Event, timeout: float) -> bool:
+        """Wait for an announcement, False on timeout."""
+        if timeout <= 0:
+            return False
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def read(self, subscribed: asyncio.Event):
+        """Wake up waiters of every announced user."""
+        client = redis.asyncio.Redis.from_url(
+            settings.CACHES['default']['LOCATION'])
+        try:
+            async with client.pubsub() as pubsub:
+                await pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+                subscribed.set()
+                async for message in pubsub.listen():
+                    if message['type'] != 'pmessage':
+                        continue
+                    user_id = int(
+                        message['channel'].decode()[len(CHANNEL_PREFIX):])
+                    for ready in self.waiters.get(user_id, ()):
+                        ready.set()
+        except redis.RedisError:
+            # Waiters re-read the events, the next request resubscribes
+            pass
+        finally:
+            for waiters in self.waiters.values():
+                for ready in waiters:
+                    ready.set()
+            await client.close()
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub() -> NotificationHub:
+    """Hub of the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _hubs:
+        _hubs[loop] = NotificationHub()
+    return _hubs[loop]
@@ -0,0 +1,120 @@
+import contextlib
+import fcntl
+import hashlib
+import os
+import tempfile
+import time
+from django.conf import settings
+from core.models import Image
+from .engines.base import local_path
+
+CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_PREFIX = '.download-'
+# Downloads older than this were left behind by killed workers
+STALE_DOWNLOAD_AGE = 3600
+
+
+def cache_path(digest: str) -> str:
+    """Cached file of an original with the given SHA-256."""
+    return os.path.join(settings.ORIGINALS_CACHE_DIR, digest[:2], digest)
+
+
+def open_cached(digest: str):
+    """Open a cached original and mark it as recently used, None on miss."""
+    path = cache_path(digest)
+    try:
+        cached_file = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    # Modification time is the LRU clock
+    with contextlib.suppress(FileNotFoundError):
+        os.utime(path)
+    return cached_file
+
+
+def download(image: Image) -> str:
+    """Copy the original into the cache, return its SHA-256."""
+    directory = settings.ORIGINALS_CACHE_DIR
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=DOWNLOAD_PREFIX)
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file, image.image.open('rb') as src:
+            for chunk in src.chunks(CHUNK_SIZE):
+                digest.update(chunk)
+                tmp_file.write(chunk)
+        digest = digest.hexdigest()
+        path = cache_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers see the whole file or none, concurrent downloads of the
+        # same content replace each other with equal bytes
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+    return digest
+
+
+def evict(keep: str | None = None) -> int:
+    """Remove least recently used originals over the size limit."""
+    directory = settings.ORIGINALS_CACHE_DIR
+    # One process evicts at a time, the others skip it
+    with open(os.path.join(directory, '.lock'), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0
+        entries, total = [], 0
+        now = time.time()
+        for entry in os.scandir(directory):
+            if entry.name.startswith(DOWNLOAD_PREFIX):
+                stat = entry.stat()
+                if now - stat.st_mtime > STALE_DOWNLOAD_AGE:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.unlink(entry.path)
+                continue
+            if not entry.is_dir():
+                continue
+            for cached in os.scandir(entry.path):
+                stat = cached.stat()
+                total += stat.st_size
+                if cached.name != keep:
+                    entries.append((stat.st_mtime, stat.st_size, cached.path))
+        removed = 0
+        # Open files stay readable after unlink
+        for _mtime, size, path in sorted(entries):
+            if total <= settings.ORIGINALS_CACHE_SIZE:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+            total -= size
+            removed += 1
+        return removed
+
+
+@contextlib.contextmanager
+def original_file(image: Image):
+    """
+    Readable original of the image.
+
+    Originals on remote storage are downloaded once per worker node and
+    read from the local cache afterwards.
+    """
+    if not settings.ORIGINALS_CACHE_DIR or local_path(image.image):
+        yield image.image
+        return
+    source = open_cached(image.digest) if image.digest else None
+    if source is None:
+        digest = download(image)
+        if digest != image.digest:
+            image.digest = digest
+            Image.objects.filter(id=image.id).update(digest=digest)
+        evict(keep=digest)
+        source = open_cached(digest)
+    if source is None:
+        # Evicted by another process right away, read it remotely
+        yield image.image
+        return
+    with source:
+        yield source
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KnownCountPaginator(Paginator):
+    """Paginator taking the total from the caller instead of counting."""
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.known_count = count
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        return super().count
+
+
+class ImagePagination(PageNumberPagination):
+    """
+    Page number pagination without SELECT COUNT(*).
+
+    The total comes from the user's image counter, with ?count=false
+    it is skipped and the next page is detected by fetching one extra row.
+    """
+    count_query_param = 'count'
+
+    def count_requested(self, request):
+        value = request.query_params.get(self.count_query_param, 'true')
+        return value.lower() not in ('false', '0', 'no')
+
+    def django_paginator_class(self, object_list, per_page):
+        """Paginator with the total taken from the user's counter."""
+        # Primary key lookup, request.user may be older than the counter
+        count = get_user_model().objects.filter(id=self.request.user.id)\
+            .values_list('image_count', flat=True).first()
+        return KnownCountPaginator(object_list, per_page, count=count)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.with_count = self.count_requested(request)
+        if self.with_count:
+            return super().paginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        try:
+            self.page_number = max(1, int(
+                request.query_params.get(self.page_query_param, 1)))
+        except ValueError:
+            self.page_number = 1
+        offset = (self.page_number - 1) * page_size
+        # One extra row tells whether there is a next page
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def get_paginated_response(self, data):
+        if self.with_count:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if self.with_count:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.with_count:
+            return super().get_previous_link()
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.page_query_param, self.page_number - 1)
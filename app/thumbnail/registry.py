@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.cache import cache
+
+
+def thumbnail_job_key(image_id: int, value: int) -> str:
+    """Idempotency key of a thumbnail job."""
+    return f'thumbnail-job-{image_id}-{value}'
+
+
+def binary_job_key(image_id: int, duration: int) -> str:
+    """Idempotency key of a binary image job."""
+    return f'binary-job-{image_id}-{duration}'
+
+
+def claim_thumbnail_jobs(image_id: int, values: list[int]) -> list[int]:
+    """Mark thumbnail jobs as in flight, return values nobody else holds."""
+    return [
+        value for value in values
+        if cache.add(
+            thumbnail_job_key(image_id, value), True,
+            settings.JOB_IN_FLIGHT_TIMEOUT)
+    ]
+
+
+def release_thumbnail_jobs(image_id: int, values: list[int]) -> None:
+    """Remove finished thumbnail jobs from the in-flight registry."""
+    # Redis rejects DEL without keys, jobs without values claimed nothing
+    if not values:
+        return
+    cache.delete_many(
+        [thumbnail_job_key(image_id, value) for value in values])
+
+
+def claim_binary_job(image_id: int, duration: int, task_id: str) -> str:
+    """Register a binary image job, return id of the task doing it."""
+    key = binary_job_key(image_id, duration)
+    if cache.add(key, task_id, settings.JOB_IN_FLIGHT_TIMEOUT):
+        return task_id
+    # Same job is already in flight
+    return cache.get(key, task_id)
+
+
+def release_binary_job(image_id: int, duration: int) -> None:
+    """Remove finished binary image job from the in-flight registry."""
+    cache.delete(binary_job_key(image_id, duration))
+
+
+def user_jobs_key(user_id: int) -> str:
+    """Key counting thumbnail jobs a user has waiting."""
+    return f'user-jobs-{user_id}'
+
+
+def track_user_jobs(user_id: int, count: int = 1) -> None:
+    """Add jobs to the user's waiting count, it expires like job keys."""
+    key = user_jobs_key(user_id)
+    cache.add(key, 0, settings.JOB_IN_FLIGHT_TIMEOUT)
+    try:
+        cache.incr(key, count)
+    except ValueError:
+        # Expired in between
+        cache.set(key, count, settings.JOB_IN_FLIGHT_TIMEOUT)
+
+
+def untrack_user_job(user_id: int) -> None:
+    """Remove a finished job from the user's waiting count."""
+    try:
+        cache.decr(user_jobs_key(user_id))
+    except ValueError:
+        pass
+
+
+def user_jobs(user_id: int) -> int:
+    """Number of thumbnail jobs the user has waiting."""
+    return max(0, cache.get(user_jobs_key(user_id), 0))
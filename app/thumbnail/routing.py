@@ -0,0 +1,19 @@
+from django.conf import settings
+
+# Tasks working on a single image, their first argument is its id
+IMAGE_TASKS = {
+    'thumbnail.tasks.create_thumbnails',
+    'thumbnail.tasks.create_binary_image',
+    'thumbnail.tasks.regenerate_image',
+}
+
+
+def route_by_image(name, args, kwargs, options, task=None, **kw):
+    """Send all jobs of an image to one node queue, where it is cached."""
+    queues = settings.WORKER_NODE_QUEUES
+    if not queues or name not in IMAGE_TASKS:
+        return None
+    image_id = kwargs.get('image_id', args[0] if args else None)
+    if image_id is None:
+        return None
+    return {'queue': queues[image_id % len(queues)]}
@@ -1,37 +1,147 @@
+import time
+from asgiref.sync import sync_to_async
+from celery import group
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers, status
 from rest_framework.reverse import reverse
-from core.models import (Image, ThumbnailImage, ExpiredLinkImage)
-from .tasks import create_thumbnails, create_binary_image
+from core.models import (
+    Image, Thumbnail, ExpiredLinkImage, image_ext_validator)
+from .tasks import (
+    create_thumbnails,
+    create_thumbnails_batch,
+    submit_thumbnails,
+    submit_binary_image,
+    submitted_headers
+)
+from .registry import claim_thumbnail_jobs, track_user_jobs
+from .utils import wait_for_result
+from .validators import validate_image_budget
 
 
 class ImageUploadSerializer(serializers.ModelSerializer):
     class Meta:
         model = Image
-        exclude = ('user', 'uuid', 'id', 'thumbnails')
+        exclude = ('user', 'uuid', 'id', 'placeholder')
         extra_kwargs = {'image': {'write_only': True}}
 
+    def validate_image(self, value):
+        """Check size limits of user's plan."""
+        validate_image_budget(value, self.context['request'].user.plan)
+        return value
+
     def create(self, validated_data):
         """Creating an image and thumbnails."""
-        # Create image
-        image = Image.objects.create(**validated_data)
-        # Create thumbnails
-        create_thumbnails.delay(image.id)
+        # Create image, counted in the same transaction
+        with transaction.atomic():
+            image = Image.objects.create(**validated_data)
+        # Create thumbnails unless the queue is overloaded
+        if not image.deferred:
+            submit_thumbnails(image.id, user_id=image.user_id)
         # Return None
         return object()
 
+    async def asave(self, **kwargs):
+        """Non-blocking counterpart of save() for the async view."""
+        validated_data = {**self.validated_data, **kwargs}
+        image_file = validated_data.pop('image')
+        # Write the file to storage outside of the event loop
+        name = Image.image.field.generate_filename(None, image_file.name)
+        name = await sync_to_async(
+            default_storage.save, thread_sensitive=False)(name, image_file)
+        # Create image, counted in the same transaction
+        image = await sync_to_async(transaction.atomic(
+            Image.objects.create))(image=name, **validated_data)
+        # Create thumbnails unless the queue is overloaded
+        if not image.deferred:
+            await sync_to_async(submit_thumbnails)(
+                image.id, user_id=image.user_id)
+        self.instance = object()
+        return self.instance
 
-class ThumbnailImageSerializer(serializers.HyperlinkedModelSerializer):
-    class Meta:
-        model = ThumbnailImage
-        fields = ('thumbnailed_image',)
+
+class ImageBatchUploadSerializer(serializers.Serializer):
+    images = serializers.ListField(
+        child=serializers.ImageField(validators=[image_ext_validator]),
+        allow_empty=False,
+        max_length=settings.IMAGE_BATCH_MAX_SIZE,
+        write_only=True)
+
+    def validate_images(self, value):
+        """Check size limits of user's plan for every image."""
+        plan = self.context['request'].user.plan
+        for image_file in value:
+            validate_image_budget(image_file, plan)
+        return value
+
+    def create(self, validated_data):
+        """Creating many images and their thumbnails at once."""
+        user = validated_data['user']
+        deferred = validated_data.get('deferred', False)
+        # Stream every file to storage
+        names = [
+            default_storage.save(
+                Image.image.field.generate_filename(None, image_file.name),
+                image_file)
+            for image_file in validated_data['images']
+        ]
+        # Create images in one insert, bulk_create sends no signals
+        with transaction.atomic():
+            images = Image.objects.bulk_create([
+                Image(user=user, image=name, deferred=deferred)
+                for name in names])
+            get_user_model().objects.filter(id=user.id)\
+                .update(image_count=F('image_count') + len(images))
+        # Processed later when the queue has room
+        if deferred:
+            return images
+        # Publish all thumbnail tasks in one go
+        values = list(Thumbnail.objects.values_list('value', flat=True))
+        submitted_at = time.time()
+        jobs = []
+        for image in images:
+            claimed = claim_thumbnail_jobs(image.id, values)
+            if claimed:
+                jobs.append([image.id, claimed, user.id, submitted_at])
+        track_user_jobs(user.id, len(jobs))
+        if settings.THUMBNAIL_BATCH_SIZE > 1:
+            # Several images per task
+            size = settings.THUMBNAIL_BATCH_SIZE
+            signatures = [
+                create_thumbnails_batch.s(jobs[i:i + size])
+                for i in range(0, len(jobs), size)]
+        else:
+            signatures = [
+                create_thumbnails.s(
+                    image_id, thumbnail_values=claimed, user_id=user_id)
+                for image_id, claimed, user_id, _submitted_at in jobs]
+        group(signatures).apply_async(headers=submitted_headers())
+        return images
 
     def to_representation(self, instance):
-        """Change thumbnail_value to value."""
-        ret = super().to_representation(instance)
-        # Replace
-        ret['value'] = instance.thumbnail_value.value
-        return ret
+        """Return number of uploaded images."""
+        return {'count': len(instance)}
+
+
+def file_url(field_file, request=None):
+    """URL of a stored file the way serializer file fields render it."""
+    if not field_file:
+        return None
+    url = field_file.url
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+class ImageListListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        """Resolve plan entitlements once for the whole page."""
+        self.child.entitlements = {}
+        return super().to_representation(data)
 
 
 class ImageListSerializer(serializers.ModelSerializer):
@@ -41,6 +151,23 @@ class ImageListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Image
         exclude = ('uuid', 'user', 'id')
+        list_serializer_class = ImageListListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.entitlements = {}
+
+    def get_entitlement(self, user):
+        """Allowed sizes and plan flags, computed once per user."""
+        entitlements = self.entitlements
+        if user.id not in entitlements:
+            plan = user.plan
+            entitlements[user.id] = (
+                frozenset(thumb.value for thumb in plan.thumbnails.all()),
+                plan.original_image,
+                plan.expired_link,
+            )
+        return entitlements[user.id]
 
     def get_expired_link(self, obj):
         """Create binary_image link."""
@@ -53,35 +180,36 @@ class ImageListSerializer(serializers.ModelSerializer):
 
     def get_thumbnails(self, obj):
         """Shows fields and thumbnails depending on user's plan."""
-        # Get allowed thumbnail values
-        allowed_thumbs_values = [
-            thumb.value
-            for thumb in obj.user.plan.thumbnails.all()
+        request = self.context.get('request')
+        allowed_sizes = self.get_entitlement(obj.user)[0]
+        return [
+            {
+                'thumbnailed_image': file_url(
+                    thumb_image.thumbnailed_image, request),
+                'value': thumb_image.size,
+            }
+            for thumb_image in obj.thumbnails.all()
+            if thumb_image.size in allowed_sizes
         ]
-        # Filter thumbnails with allowed ones
-        query = filter(
-            lambda x: x.thumbnail_value.value in allowed_thumbs_values,
-            obj.thumbnails.all()
-        )
-        return ThumbnailImageSerializer(
-            query, many=True, context=self.context).data
 
     def to_representation(self, instance):
-        """Change reprenstation vie according to the plan."""
-        ret = super().to_representation(instance)
-        # Drop expired link field
-        if not instance.user.plan.expired_link:
-            ret.pop('expired_link')
-        # Drop original image field
-        if not instance.user.plan.original_image:
-            ret.pop('image')
+        """Build the row directly instead of walking the fields."""
+        request = self.context.get('request')
+        _sizes, original_image, expired_link = \
+            self.get_entitlement(instance.user)
+        ret = {'thumbnails': self.get_thumbnails(instance)}
+        if expired_link:
+            ret['expired_link'] = self.get_expired_link(instance)
+        if original_image:
+            ret['image'] = file_url(instance.image, request)
+        ret['placeholder'] = instance.placeholder
         return ret
 
 
 class ExpiredLinkImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ExpiredLinkImage
-        exclude = ('date_created', 'uuid')
+        exclude = ('date_created', 'uuid', 'image')
         extra_kwargs = {
             'binary_image': {'read_only': True},
             'duration': {'write_only': True}
@@ -124,6 +252,26 @@ class ExpiredLinkImageSerializer(serializers.ModelSerializer):
         # Get duration
         duration = validated_data['duration']
         # Create binary image
-        result = create_binary_image.delay(image.id, duration)
+        result = submit_binary_image(image.id, duration)
         # Return binary image
         return ExpiredLinkImage.objects.get(uuid=result.get())
+
+    async def asave(self):
+        """Non-blocking counterpart of save() for the async view."""
+        image = self.validated_data['image']
+        duration = self.validated_data['duration']
+        # Create binary image
+        result = await sync_to_async(submit_binary_image)(
+            image.id, duration)
+        # Wait for the worker without holding a thread
+        binary_uuid = await wait_for_result(result)
+        self.instance = await ExpiredLinkImage.objects.aget(uuid=binary_uuid)
+        return self.instance
+
+
+class NotificationQuerySerializer(serializers.Serializer):
+    """Query parameters of the notifications long-poll."""
+    after = serializers.IntegerField(min_value=0, default=0)
+    timeout = serializers.FloatField(
+        min_value=0, max_value=settings.NOTIFICATIONS_TIMEOUT,
+        default=settings.NOTIFICATIONS_TIMEOUT)
@@ -1,78 +1,414 @@
-from io import BytesIO
+import base64
+import logging
+import time
 import uuid
+from collections import defaultdict
 from celery import shared_task
-from PIL import Image as pill_image
+from celery.result import AsyncResult
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.core.files.uploadedfile import InMemoryUploadedFile
-from core.models import Image, ThumbnailImage, Thumbnail, ExpiredLinkImage
-
-
-def create_thumb(image: Image, thumbnail: Thumbnail) -> int:
-    """Create a thumbnail."""
-    with pill_image.open(image.image) as im:
-        io_img = BytesIO()
-        # Make thumbnail
-        size = thumbnail.value, thumbnail.value
-        im.thumbnail(size)
-        im.save(io_img, 'png')
-        thumb_image = InMemoryUploadedFile(
-            io_img, 'image', 'image.png',
-            'png', io_img.tell(), None)
-        # Create model
-        model = ThumbnailImage.objects.create(
-            thumbnail_value=thumbnail,
-            thumbnailed_image=thumb_image
-        )
-        # Return model's id
-        return model.id
+from django.utils import timezone
+from core.models import (
+    Image, ThumbnailImage, Thumbnail, ExpiredLinkImage, Backfill)
+from .registry import (
+    claim_thumbnail_jobs,
+    release_thumbnail_jobs,
+    claim_binary_job,
+    release_binary_job,
+    track_user_jobs,
+    untrack_user_job
+)
+from .admission import is_overloaded, record_worker_lag
+from .engines import get_engine
+from .batching import push_job, pop_jobs
+from .notifications import publish_ready
+from .originals import original_file
 
+logger = logging.getLogger(__name__)
 
-@shared_task
-def create_thumbnails(image_id: int, thumbnail_values: list[int] = []) -> None:
+
+def check_pixel_budget(image: Image) -> None:
+    """Refuse to decode an image over the worker's budget."""
+    from PIL import Image as pill_image
+    # Only the header is read
+    with original_file(image) as source:
+        width, height = get_engine().dimensions(source)
+    if width * height > settings.WORKER_MAX_PIXELS:
+        raise pill_image.DecompressionBombError(
+            f'Image {image.id} has {width * height} pixels, '
+            f'limit is {settings.WORKER_MAX_PIXELS}.')
+
+
+def make_thumbnail_file(image: Image, value: int) -> InMemoryUploadedFile:
+    """Render a thumbnail of the image as a PNG file."""
+    check_pixel_budget(image)
+    with original_file(image) as source:
+        io_img = get_engine().thumbnail(source, value)
+    return InMemoryUploadedFile(
+        io_img, 'image', 'image.png',
+        'png', io_img.tell(), None)
+
+
+def make_placeholder(thumb_file: InMemoryUploadedFile) -> str:
+    """Encode a tiny preview of a rendered thumbnail as a data URI."""
+    thumb_file.seek(0)
+    preview = get_engine().placeholder(thumb_file, settings.PLACEHOLDER_SIZE)
+    thumb_file.seek(0)
+    data = base64.b64encode(preview).decode('ascii')
+    return f'data:image/jpeg;base64,{data}'
+
+
+def make_binary_file(image: Image) -> InMemoryUploadedFile:
+    """Render a binary version of the image as a PNG file."""
+    check_pixel_budget(image)
+    with original_file(image) as source:
+        io_img = get_engine().binary(source, settings.BINARY_MAX_PIXELS)
+    return InMemoryUploadedFile(
+        io_img, 'image', 'image.png',
+        'png', io_img.tell(), None)
+
+
+def create_thumb(
+        image: Image, thumbnail: Thumbnail,
+        thumb_image: InMemoryUploadedFile) -> int | None:
+    """Create a thumbnail, None when the image already has that size."""
+    # Create model
+    model = ThumbnailImage(
+        image=image, thumbnail_value=thumbnail, size=thumbnail.value)
+    model.thumbnailed_image.save('image.png', thumb_image, save=False)
+    try:
+        with transaction.atomic():
+            model.save()
+    except IntegrityError:
+        # Someone else made this size in the meantime
+        model.thumbnailed_image.delete(save=False)
+        return None
+    # Return model's id
+    return model.id
+
+
+def submitted_headers() -> dict:
+    """Task headers letting the worker measure queue lag."""
+    return {'submitted_at': time.time()}
+
+
+@shared_task(bind=True)
+def create_thumbnails(
+        self, image_id: int, thumbnail_values: list[int] | None = None,
+        user_id: int | None = None) -> None:
     """Create thumbnails for all values."""
-    # Get image
-    image = Image.objects.get(id=image_id)
-    # Create or update thumbnails
-    thumbnail_ids = []
-    # Update
-    if thumbnail_values:
-        # Create thumbnail for each value
-        for thumb_value in thumbnail_values:
-            # Get thumbnail
-            # I had a problem here and couldnt figure it out so do
-            thumbnail = Thumbnail.objects.get(value=thumb_value)
-            # raise ValueError(thumbnail)
-            # Create model
-            model_id = create_thumb(image, thumbnail)
-            # Append model's id
-            thumbnail_ids.append(model_id)
-    # Create
-    else:
-        # Get thumbnails
-        thumbnails = Thumbnail.objects.all()
-        # Create thumbnails for every thumbnail
+    # Workers see custom headers on the request, eager runs in headers
+    submitted_at = self.request.get('submitted_at') or \
+        (self.request.headers or {}).get('submitted_at')
+    if submitted_at:
+        record_worker_lag(time.time() - submitted_at)
+    try:
+        # Get image
+        image = Image.objects.get(id=image_id)
+        # Get thumbnails, smallest first
+        if thumbnail_values:
+            thumbnails = Thumbnail.objects.filter(value__in=thumbnail_values)
+        else:
+            thumbnails = Thumbnail.objects.all()
+        thumbnails = thumbnails.order_by('value')
+        # Sizes the image already has (retries, redelivery)
+        existing_values = set(
+            image.thumbnails.values_list('size', flat=True))
+        # Create missing thumbnails
+        made = []
         for thumbnail in thumbnails:
-            model_id = create_thumb(image, thumbnail)
-            # Append model's id
-            thumbnail_ids.append(model_id)
-    # Add new thumbnails to the image
-    image.thumbnails.add(*thumbnail_ids)
-    image.save()
+            if thumbnail.value in existing_values:
+                continue
+            thumb_image = make_thumbnail_file(image, thumbnail.value)
+            # Placeholder from already downscaled pixels
+            if not image.placeholder:
+                image.placeholder = make_placeholder(thumb_image)
+                Image.objects.filter(id=image.id).update(
+                    placeholder=image.placeholder)
+            if create_thumb(image, thumbnail, thumb_image):
+                made.append(thumbnail.value)
+        if made:
+            publish_ready(image.user_id, image.uuid, made)
+    finally:
+        release_thumbnail_jobs(image_id, thumbnail_values or [])
+        if user_id is not None:
+            untrack_user_job(user_id)
+
+
+def discard_skipped(models: list[ThumbnailImage]) -> list[ThumbnailImage]:
+    """Delete files of rows bulk_create skipped, return the stored rows."""
+    stored = {
+        (image_id, size): name
+        for image_id, size, name in ThumbnailImage.objects.filter(
+            image_id__in={model.image_id for model in models},
+            size__in={model.size for model in models})
+        .values_list('image_id', 'size', 'thumbnailed_image')}
+    kept = []
+    for model in models:
+        if stored.get((model.image_id, model.size)) == \
+                model.thumbnailed_image.name:
+            kept.append(model)
+        else:
+            model.thumbnailed_image.delete(save=False)
+    return kept
 
 
 @shared_task
-def create_binary_image(image_id: int, duration: int) -> uuid.uuid4:
-    """Create an binary image with given duration"""
-    # Get image
-    image = Image.objects.get(id=image_id)
-    # Create a binary image
-    with pill_image.open(image.image) as im:
-        io_img = BytesIO()
-        im = im.convert('1')
-        im.save(io_img, 'png',)
-        b_image = InMemoryUploadedFile(
-            io_img, 'image', 'image.png',
-            'png', io_img.tell(), None)
+def create_thumbnails_batch(jobs: list[list]) -> int:
+    """
+    Create thumbnails of many images at once, return how many were made.
+
+    Jobs are [image_id, thumbnail_values, user_id, submitted_at] lists.
+    """
+    now = time.time()
+    try:
+        for job in jobs:
+            record_worker_lag(now - job[3])
+        # All rows in a few queries
+        image_ids = [job[0] for job in jobs]
+        images = Image.objects.in_bulk(image_ids)
+        thumbnails = Thumbnail.objects.in_bulk(
+            {value for job in jobs for value in job[1]},
+            field_name='value')
+        existing = set(
+            ThumbnailImage.objects.filter(image_id__in=image_ids)
+            .values_list('image_id', 'size'))
+        models, placeholders = [], []
+        for image_id, values, _user_id, _submitted_at in jobs:
+            image = images.get(image_id)
+            if image is None:
+                continue
+            for value in sorted(values):
+                if (image_id, value) in existing or value not in thumbnails:
+                    continue
+                try:
+                    thumb_image = make_thumbnail_file(image, value)
+                except Exception:
+                    # Skip the rest of a broken image, keep the batch
+                    logger.exception(
+                        'Thumbnail %d of image %d failed', value, image_id)
+                    break
+                existing.add((image_id, value))
+                # Placeholder from already downscaled pixels
+                if not image.placeholder:
+                    image.placeholder = make_placeholder(thumb_image)
+                    placeholders.append(image)
+                model = ThumbnailImage(
+                    image=image, thumbnail_value=thumbnails[value],
+                    size=value)
+                model.thumbnailed_image.save(
+                    'image.png', thumb_image, save=False)
+                models.append(model)
+        # Sizes made meanwhile by other jobs are skipped
+        ThumbnailImage.objects.bulk_create(models, ignore_conflicts=True)
+        Image.objects.bulk_update(placeholders, ['placeholder'])
+        if models:
+            models = discard_skipped(models)
+        made = defaultdict(list)
+        for model in models:
+            made[model.image].append(model.size)
+        for image, sizes in made.items():
+            publish_ready(image.user_id, image.uuid, sizes)
+        return len(models)
+    finally:
+        for image_id, values, user_id, _submitted_at in jobs:
+            release_thumbnail_jobs(image_id, values)
+            if user_id is not None:
+                untrack_user_job(user_id)
+
+
+@shared_task
+def flush_thumbnail_batch() -> int:
+    """Process one batch of buffered thumbnail jobs."""
+    if settings.THUMBNAIL_BATCH_SIZE <= 1:
+        return 0
+    jobs, remaining = pop_jobs(settings.THUMBNAIL_BATCH_SIZE)
+    # Let another worker take the rest meanwhile
+    if remaining:
+        flush_thumbnail_batch.delay()
+    if jobs:
+        create_thumbnails_batch(jobs)
+    return len(jobs)
+
+
+@shared_task(ignore_result=False)
+def create_binary_image(image_id: int, duration: int) -> str:
+    """Create an binary image with given duration, callers wait for it."""
+    try:
+        # Get image
+        image = Image.objects.get(id=image_id)
+        # Create a binary image
+        b_image = make_binary_file(image)
         # Create a model
         model = ExpiredLinkImage.objects.create(
-            duration=duration, binary_image=b_image)
-        return model.uuid
+            image=image, duration=duration, binary_image=b_image)
+        return str(model.uuid)
+    finally:
+        release_binary_job(image_id, duration)
+
+
+def replace_file(field_file, content) -> None:
+    """Save new content of a file field and remove the old file."""
+    old_name = field_file.name
+    field_file.save('image.png', content)
+    if old_name:
+        field_file.storage.delete(old_name)
+
+
+@shared_task
+def regenerate_image(
+        image_id: int, thumbnail_values: list[int] | None = None,
+        thumbnails: bool = True, binary: bool = True) -> int:
+    """Render derivatives of an image again, return how many were made."""
+    image = Image.objects.select_related('user__plan').get(id=image_id)
+    count = 0
+    if thumbnails:
+        thumb_images = image.thumbnails.all()
+        # Sizes of the plan the image does not have yet
+        missing = Thumbnail.objects.none()
+        if image.user.plan is not None:
+            missing = image.user.plan.thumbnails.exclude(
+                value__in=image.thumbnails.values('size'))
+        if thumbnail_values is not None:
+            thumb_images = thumb_images.filter(size__in=thumbnail_values)
+            missing = missing.filter(value__in=thumbnail_values)
+        for thumb_image in thumb_images.order_by('size'):
+            thumb_file = make_thumbnail_file(image, thumb_image.size)
+            if count == 0:
+                image.placeholder = make_placeholder(thumb_file)
+                Image.objects.filter(id=image.id).update(
+                    placeholder=image.placeholder)
+            replace_file(thumb_image.thumbnailed_image, thumb_file)
+            count += 1
+        for thumbnail in missing.order_by('value'):
+            thumb_file = make_thumbnail_file(image, thumbnail.value)
+            if create_thumb(image, thumbnail, thumb_file):
+                count += 1
+    if binary:
+        for link in ExpiredLinkImage.objects.filter(image=image):
+            replace_file(link.binary_image, make_binary_file(image))
+            count += 1
+    return count
+
+
+def submit_thumbnails(
+        image_id: int, thumbnail_values: list[int] | None = None,
+        user_id: int | None = None):
+    """
+    Enqueue thumbnail jobs which are not already in flight.
+
+    Jobs submitted with user_id count towards the user's waiting jobs.
+    """
+    if thumbnail_values is None:
+        thumbnail_values = Thumbnail.objects.values_list('value', flat=True)
+    # Drop duplicates at the queue edge
+    values = claim_thumbnail_jobs(image_id, thumbnail_values)
+    if not values:
+        return None
+    if user_id is not None:
+        track_user_jobs(user_id)
+    if settings.THUMBNAIL_BATCH_SIZE > 1:
+        # Buffer the job, the first one waits for the batch to fill up
+        length = push_job([image_id, values, user_id, time.time()])
+        if length >= settings.THUMBNAIL_BATCH_SIZE:
+            return flush_thumbnail_batch.delay()
+        if length == 1:
+            return flush_thumbnail_batch.apply_async(
+                countdown=settings.THUMBNAIL_BATCH_WAIT / 1000)
+        return None
+    return create_thumbnails.apply_async(
+        (image_id,), {'thumbnail_values': values, 'user_id': user_id},
+        headers=submitted_headers())
+
+
+@shared_task
+def submit_deferred_thumbnails() -> int:
+    """Enqueue thumbnails of deferred uploads while the queue has room."""
+    if is_overloaded():
+        return 0
+    images = list(
+        Image.objects.filter(deferred=True).order_by('id')
+        .values_list('id', 'user_id')[:settings.ADMISSION_DRAIN_BATCH])
+    for image_id, user_id in images:
+        submit_thumbnails(image_id, user_id=user_id)
+    Image.objects.filter(id__in=[image_id for image_id, _ in images])\
+        .update(deferred=False)
+    return len(images)
+
+
+def submit_binary_image(image_id: int, duration: int) -> AsyncResult:
+    """Enqueue a binary image job or join the identical one in flight."""
+    task_id = str(uuid.uuid4())
+    claimed_id = claim_binary_job(image_id, duration, task_id)
+    if claimed_id != task_id:
+        return AsyncResult(claimed_id, app=create_binary_image.app)
+    try:
+        return create_binary_image.apply_async(
+            (image_id, duration), task_id=task_id)
+    except Exception:
+        # Not published, nobody must wait for it
+        release_binary_job(image_id, duration)
+        raise
+
+
+@shared_task(rate_limit=settings.BACKFILL_RATE_LIMIT)
+def run_backfill(backfill_id: int, after_id: int = 0) -> None:
+    """Backfill thumbnails for one chunk of images, enqueue the next one."""
+    backfill = Backfill.objects.get(id=backfill_id)
+    # Finished or another run already moved past this checkpoint
+    if backfill.status == Backfill.Status.DONE or \
+            backfill.last_image_id != after_id:
+        return
+    # Next chunk in id order
+    image_ids = list(
+        backfill.images().filter(id__gt=after_id)
+        .order_by('id').values_list('id', flat=True)
+        [:settings.BACKFILL_CHUNK_SIZE])
+    if not image_ids:
+        Backfill.objects.filter(id=backfill_id).update(
+            status=Backfill.Status.DONE, date_updated=timezone.now())
+        return
+    failed = 0
+    for image_id in image_ids:
+        # Leave sizes in flight to their jobs
+        values = claim_thumbnail_jobs(image_id, backfill.thumbnail_values)
+        if not values:
+            continue
+        try:
+            create_thumbnails(image_id, thumbnail_values=values)
+        except Exception:
+            # A broken image must not stop the backfill at its checkpoint
+            logger.exception(
+                'Backfill %d skipped image %d', backfill_id, image_id)
+            failed += 1
+    # Save checkpoint unless somebody else did
+    updated = Backfill.objects.filter(
+        id=backfill_id, last_image_id=after_id).update(
+        status=Backfill.Status.RUNNING,
+        last_image_id=image_ids[-1],
+        processed=F('processed') + len(image_ids),
+        failed=F('failed') + failed,
+        date_updated=timezone.now())
+    if updated:
+        run_backfill.delay(backfill_id, image_ids[-1])
+
+
+def resume_backfill(backfill: Backfill) -> None:
+    """Continue a backfill from its last checkpoint."""
+    transaction.on_commit(
+        lambda: run_backfill.delay(backfill.id, backfill.last_image_id))
+
+
+def start_backfill(
+        plan_id: int, thumbnail_values: list[int]) -> Backfill | None:
+    """Create thumbnails of new plan sizes for every user on the plan."""
+    backfill = Backfill(plan_id=plan_id, thumbnail_values=thumbnail_values)
+    backfill.total = backfill.images().count()
+    # Nothing to do
+    if not backfill.total:
+        return None
+    backfill.save()
+    resume_backfill(backfill)
+    return backfill
@@ -0,0 +1,100 @@
+import tempfile
+from PIL import Image as pill_image
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from core.models import Image, ThumbnailImage
+from core.tests.test_models import (
+    LOCAL_CACHES, sample_user, sample_plan, sample_thumbnail)
+from ..admission import QUEUE_DEPTH_KEY, WORKER_LAG_KEY, admit_upload
+from ..registry import track_user_jobs, user_jobs
+from ..tasks import submit_deferred_thumbnails, submit_thumbnails
+
+IMAGE_UPLOAD_URL = reverse('thumbnail:upload-image')
+
+
+@override_settings(
+    CACHES=LOCAL_CACHES,
+    CELERY_TASK_ALWAYS_EAGER=True,
+    CELERY_TASK_EAGER_PROPAGATES=True,
+    SUSPEND_SIGNALS=True,
+    ADMISSION_MAX_QUEUE_DEPTH=100,
+    ADMISSION_PENDING_JOBS=2
+)
+class AdmissionTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.plan = sample_plan(name='Plan')
+        self.plan.thumbnails.add(sample_thumbnail(value=100))
+        self.user = sample_user(
+            email='test@test.com', name='test',
+            password='testpassword', plan=self.plan)
+        self.client.force_authenticate(user=self.user)
+
+    def overload(self):
+        cache.set(QUEUE_DEPTH_KEY, 1000, 60)
+        track_user_jobs(self.user.id, 2)
+
+    def upload_image(self):
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            pill_image.new('RGB', (200, 200)).save(image_file, 'png')
+            image_file.seek(0)
+            return self.client.post(
+                IMAGE_UPLOAD_URL, {'image': image_file}, format='multipart')
+
+    def test_admit_upload_fair_share(self):
+        cache.set(QUEUE_DEPTH_KEY, 1000, 60)
+        # Below quota
+        self.assertTrue(admit_upload(self.user))
+        track_user_jobs(self.user.id, 2)
+        # Plan quota overrides the default
+        self.plan.max_pending_jobs = 5
+        self.assertTrue(admit_upload(self.user))
+
+    def test_upload_rejected_when_overloaded(self):
+        self.overload()
+        res = self.upload_image()
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+        self.assertFalse(Image.objects.exists())
+
+    def test_upload_rejected_on_worker_lag(self):
+        track_user_jobs(self.user.id, 2)
+        cache.set(WORKER_LAG_KEY, 120, 60)
+        res = self.upload_image()
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(ADMISSION_OVERLOAD_ACTION='defer')
+    def test_upload_deferred_when_overloaded(self):
+        self.overload()
+        res = self.upload_image()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        image = Image.objects.get()
+        self.assertTrue(image.deferred)
+        self.assertFalse(ThumbnailImage.objects.exists())
+
+        # Still overloaded
+        self.assertEqual(submit_deferred_thumbnails(), 0)
+        # Queue drained
+        cache.delete(QUEUE_DEPTH_KEY)
+        self.assertEqual(submit_deferred_thumbnails(), 1)
+        image.refresh_from_db()
+        self.assertFalse(image.deferred)
+        self.assertEqual(image.thumbnails.count(), 1)
+
+    def test_submit_thumbnails_tracks_user_jobs(self):
+        res = self.upload_image()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        # Finished jobs leave the count and record the lag
+        self.assertEqual(user_jobs(self.user.id), 0)
+        self.assertIsNotNone(cache.get(WORKER_LAG_KEY))
+        image = Image.objects.get()
+        track_user_jobs(self.user.id, 3)
+        submit_thumbnails(image.id, [100], user_id=self.user.id)
+        self.assertEqual(user_jobs(self.user.id), 3)
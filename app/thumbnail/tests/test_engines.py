@@ -0,0 +1,192 @@
+import tempfile
+import unittest
+from unittest.mock import patch
+from io import BytesIO
+from PIL import Image as pill_image
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+from ..engines import get_engine
+from ..engines.pillow import PillowEngine
+from ..engines.tiled import TiledEngine, png_strips
+from ..engines import arrays, vips
+
+
+def sample_file(size=(300, 200), fmt='png'):
+    image_file = tempfile.NamedTemporaryFile(suffix=f'.{fmt}')
+    pill_image.new('RGB', size, (200, 100, 50)).save(image_file, fmt)
+    image_file.seek(0)
+    return image_file
+
+
+class EngineTestsMixin:
+    def test_dimensions(self):
+        with sample_file() as source:
+            self.assertEqual(self.engine.dimensions(source), (300, 200))
+
+    def test_thumbnail(self):
+        with sample_file() as source:
+            io_img = self.engine.thumbnail(source, 100)
+        io_img.seek(0)
+        with pill_image.open(io_img) as im:
+            self.assertEqual(im.format, 'PNG')
+            self.assertEqual(im.size, (100, 67))
+
+    def test_thumbnail_not_upscaled(self):
+        with sample_file(size=(50, 40)) as source:
+            io_img = self.engine.thumbnail(source, 100)
+        io_img.seek(0)
+        with pill_image.open(io_img) as im:
+            self.assertEqual(im.size, (50, 40))
+
+    def test_binary(self):
+        with sample_file(size=(40, 20)) as source:
+            io_img = self.engine.binary(source, 100)
+        io_img.seek(0)
+        with pill_image.open(io_img) as im:
+            self.assertEqual(im.mode, '1')
+            self.assertLessEqual(im.width * im.height, 100)
+
+    def test_placeholder(self):
+        with sample_file() as source:
+            preview = self.engine.placeholder(source, 16)
+        with pill_image.open(BytesIO(preview)) as im:
+            self.assertEqual(im.format, 'JPEG')
+            self.assertEqual(max(im.size), 16)
+
+
+class PillowEngineTests(EngineTestsMixin, SimpleTestCase):
+    engine = PillowEngine()
+
+
+@unittest.skipIf(vips.pyvips is None, 'pyvips is not installed')
+class VipsEngineTests(EngineTestsMixin, SimpleTestCase):
+    def setUp(self):
+        self.engine = vips.VipsEngine()
+
+
+class StripsEngine(TiledEngine):
+    """Every PNG in strips of a few rows and slices of a few columns."""
+    min_pixels = 0
+    strip_pixels = 3000
+    column_pixels = 3000
+
+
+def noise_file(mode, size):
+    image_file = tempfile.NamedTemporaryFile(suffix='.png')
+    noise = pill_image.effect_noise(size, 80).convert('L')
+    bands = [noise, noise.rotate(90), noise.transpose(0), noise.rotate(45)]
+    pill_image.merge('RGBA', bands).convert(mode).save(image_file, 'png')
+    image_file.seek(0)
+    return image_file
+
+
+def decoded(io_img):
+    io_img.seek(0)
+    with pill_image.open(io_img) as im:
+        return im.mode, im.size, im.tobytes()
+
+
+class TiledEngineTests(EngineTestsMixin, SimpleTestCase):
+    engine = StripsEngine()
+
+    def test_png_strips(self):
+        with noise_file('RGB', (301, 203)) as source:
+            strips = list(png_strips(source, 10))
+            source.seek(0)
+            with pill_image.open(source) as im:
+                whole = im.tobytes()
+        self.assertEqual([top for top, _ in strips], list(range(0, 203, 10)))
+        self.assertTrue(all(strip.height <= 10 for _, strip in strips))
+        self.assertEqual(b''.join(strip.tobytes() for _, strip in strips),
+                         whole)
+
+    def test_same_as_full_frame(self):
+        full_frame = PillowEngine()
+        for mode in ('L', 'RGB', 'LA', 'RGBA'):
+            for size in ((301, 203), (1000, 37)):
+                with noise_file(mode, size) as source:
+                    for value in (10, 50, 250):
+                        with self.subTest(mode=mode, size=size, value=value):
+                            tiled = self.engine.thumbnail(source, value)
+                            source.seek(0)
+                            self.assertEqual(
+                                decoded(tiled),
+                                decoded(full_frame.thumbnail(source, value)))
+                            source.seek(0)
+                    tiled = self.engine.binary(source, 2000)
+                    source.seek(0)
+                    self.assertEqual(
+                        decoded(tiled),
+                        decoded(full_frame.binary(source, 2000)))
+
+    def test_over_pillow_pixel_limit(self):
+        with noise_file('RGBA', (301, 203)) as source, \
+                patch.object(pill_image, 'MAX_IMAGE_PIXELS', 20000):
+            # Image.open() refuses twice the limit
+            with self.assertRaises(pill_image.DecompressionBombError):
+                PillowEngine().dimensions(source)
+            source.seek(0)
+            self.assertEqual(self.engine.dimensions(source), (301, 203))
+            self.assertEqual(
+                decoded(self.engine.thumbnail(source, 50))[:2],
+                ('RGBA', (50, 34)))
+            source.seek(0)
+            self.assertEqual(
+                decoded(self.engine.binary(source, 2000))[:2],
+                ('1', (53, 36)))
+
+    def test_full_frame_fallback(self):
+        with sample_file(fmt='jpeg') as source:
+            self.assertIsNone(self.engine.strips_header(source))
+        with tempfile.NamedTemporaryFile(suffix='.png') as source:
+            pill_image.new('P', (300, 200)).save(source, 'png')
+            source.seek(0)
+            self.assertIsNone(self.engine.strips_header(source))
+            self.assertEqual(
+                decoded(self.engine.thumbnail(source, 100))[:2],
+                ('P', (100, 67)))
+
+
+@unittest.skipIf(arrays.np is None, 'numpy is not installed')
+class NumpyEngineTests(EngineTestsMixin, SimpleTestCase):
+    def setUp(self):
+        self.engine = arrays.NumpyEngine()
+
+    def test_methods_keep_gray_level(self):
+        np = arrays.np
+        # A stack of two images, uniform gray and a gradient
+        gray = np.stack([
+            np.full((37, 256), 100, np.uint8),
+            np.tile(np.arange(256, dtype=np.uint8), (37, 1))])
+        self.assertFalse(arrays.threshold(gray)[0].any())
+        for method in (arrays.ordered, arrays.diffuse):
+            with self.subTest(method=method.__name__):
+                bits = method(gray)
+                self.assertEqual(bits.shape, gray.shape)
+                self.assertEqual(bits.dtype, bool)
+                self.assertAlmostEqual(bits[0].mean(), 100 / 255, delta=0.02)
+                self.assertAlmostEqual(bits[1].mean(), 0.5, delta=0.02)
+
+    def test_packed_output(self):
+        np = arrays.np
+        bits = arrays.ordered(np.full((3, 20), 128, np.uint8))
+        self.assertEqual(arrays.pack(bits).shape, (3, 3))
+        im = arrays.bits_image(bits)
+        self.assertEqual((im.mode, im.size), ('1', (20, 3)))
+        self.assertTrue((np.asarray(im) == bits).all())
+
+    @override_settings(BINARY_METHOD='halftone')
+    def test_unknown_method(self):
+        with self.assertRaises(ImproperlyConfigured):
+            arrays.NumpyEngine()
+
+
+class GetEngineTests(SimpleTestCase):
+    def test_default_engine(self):
+        self.assertIsInstance(get_engine(), PillowEngine)
+        self.assertIs(get_engine(), get_engine())
+
+    @override_settings(THUMBNAIL_ENGINE='thumbnail.engines.missing.Engine')
+    def test_engine_not_found(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_engine()
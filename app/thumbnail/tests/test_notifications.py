@@ -0,0 +1,90 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+import redis
+from django.test import SimpleTestCase
+from ..notifications import NotificationHub, channel_name
+
+
+class FakePubSub:
+    """Pub/sub that subscribes after a delay and replays queued messages."""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.messages = asyncio.Queue()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def psubscribe(self, pattern):
+        await asyncio.sleep(self.delay)
+
+    async def listen(self):
+        while True:
+            message = await self.messages.get()
+            if isinstance(message, Exception):
+                raise message
+            yield message
+
+
+def fake_client(pubsub):
+    client = MagicMock()
+    client.pubsub.return_value = pubsub
+    client.close = AsyncMock()
+    return client
+
+
+def announcement(user_id):
+    return {'type': 'pmessage', 'channel': channel_name(user_id).encode()}
+
+
+class NotificationHubTests(SimpleTestCase):
+    async def test_subscribe_waits_for_psubscribe(self):
+        pubsub = FakePubSub()
+        hub = NotificationHub()
+        with patch('redis.asyncio.Redis.from_url',
+                   return_value=fake_client(pubsub)):
+            with hub.listen(5) as ready:
+                self.assertTrue(await hub.subscribe(1))
+                # Published right after the backlog was read
+                pubsub.messages.put_nowait(announcement(6))
+                pubsub.messages.put_nowait(announcement(5))
+                self.assertTrue(await hub.wait(ready, 1))
+            # The subscription is shared by the next requests
+            reader = hub.reader
+            self.assertTrue(await hub.subscribe(1))
+            self.assertIs(hub.reader, reader)
+            reader.cancel()
+
+    async def test_subscribe_timeout(self):
+        hub = NotificationHub()
+        with patch('redis.asyncio.Redis.from_url',
+                   return_value=fake_client(FakePubSub(delay=1))):
+            self.assertFalse(await hub.subscribe(0.01))
+        hub.reader.cancel()
+
+    async def test_reader_failure_wakes_waiters(self):
+        pubsub = FakePubSub()
+        hub = NotificationHub()
+        with patch('redis.asyncio.Redis.from_url',
+                   return_value=fake_client(pubsub)):
+            with hub.listen(5) as ready:
+                self.assertTrue(await hub.subscribe(1))
+                pubsub.messages.put_nowait(redis.ConnectionError())
+                self.assertTrue(await hub.wait(ready, 1))
+            reader = hub.reader
+            self.assertTrue(reader.done())
+            # The next request subscribes again
+            self.assertTrue(await hub.subscribe(1))
+            self.assertIsNot(hub.reader, reader)
+            hub.reader.cancel()
+
+    async def test_subscribe_without_redis(self):
+        pubsub = FakePubSub()
+        pubsub.psubscribe = AsyncMock(side_effect=redis.ConnectionError)
+        hub = NotificationHub()
+        with patch('redis.asyncio.Redis.from_url',
+                   return_value=fake_client(pubsub)):
+            self.assertFalse(await hub.subscribe(1))
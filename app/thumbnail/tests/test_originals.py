@@ -0,0 +1,103 @@
+import hashlib
+import os
+import tempfile
+import time
+from PIL import Image as pill_image
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.test import TestCase, override_settings
+from core.models import Image
+from ..originals import cache_path, evict, original_file
+from ..routing import route_by_image
+from ..tasks import make_thumbnail_file
+
+
+class OriginalsCacheTests(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            ORIGINALS_CACHE_DIR=self.cache_dir.name,
+            ORIGINALS_CACHE_SIZE=10 * 1024 ** 2)
+        self.settings.enable()
+        # Pretend the media volume is remote
+        self.local_path = patch(
+            'thumbnail.originals.local_path', return_value=None)
+        self.local_path.start()
+
+    def tearDown(self):
+        self.local_path.stop()
+        self.settings.disable()
+        self.cache_dir.cleanup()
+
+    def sample_image_model(self):
+        user = get_user_model().objects.create(
+            email='test@email.com', name='test', password='testpassword')
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            image = pill_image.new('RGB', (50, 50))
+            image.save(image_file, 'png')
+            image = InMemoryUploadedFile(
+                image_file, 'image', 'image.png',
+                'png', image_file.tell(), None)
+            return Image.objects.create(user=user, image=image)
+
+    def test_original_file_downloads_once(self):
+        image_model = self.sample_image_model()
+        with image_model.image.open('rb') as original:
+            content = original.read()
+        digest = hashlib.sha256(content).hexdigest()
+
+        with original_file(image_model) as source:
+            self.assertEqual(source.name, cache_path(digest))
+            self.assertEqual(source.read(), content)
+        image_model.refresh_from_db()
+        self.assertEqual(image_model.digest, digest)
+
+        with patch('thumbnail.originals.download') as mocked_download:
+            make_thumbnail_file(image_model, 20)
+            mocked_download.assert_not_called()
+
+    def test_original_file_without_cache(self):
+        image_model = self.sample_image_model()
+        with override_settings(ORIGINALS_CACHE_DIR=''):
+            with original_file(image_model) as source:
+                self.assertIs(source, image_model.image)
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+
+    def test_evict_least_recently_used(self):
+        paths = []
+        for i in range(3):
+            path = cache_path(f'{i:02d}' * 32)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as cached_file:
+                cached_file.write(b'x' * 100)
+            os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+            paths.append(path)
+
+        with override_settings(ORIGINALS_CACHE_SIZE=200):
+            self.assertEqual(evict(), 1)
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[1]))
+        self.assertTrue(os.path.exists(paths[2]))
+
+
+class RoutingTests(TestCase):
+    @override_settings(WORKER_NODE_QUEUES=['node-a', 'node-b'])
+    def test_route_by_image(self):
+        name = 'thumbnail.tasks.create_thumbnails'
+        self.assertEqual(
+            route_by_image(name, (3,), {}, {}), {'queue': 'node-b'})
+        self.assertEqual(
+            route_by_image(name, (), {'image_id': 4}, {}),
+            {'queue': 'node-a'})
+        self.assertEqual(
+            route_by_image('thumbnail.tasks.create_binary_image', (3, 300),
+                           {}, {}),
+            {'queue': 'node-b'})
+        # Batches span many images
+        self.assertIsNone(route_by_image(
+            'thumbnail.tasks.create_thumbnails_batch', ([],), {}, {}))
+
+    def test_route_by_image_without_node_queues(self):
+        self.assertIsNone(route_by_image(
+            'thumbnail.tasks.create_thumbnails', (3,), {}, {}))
@@ -0,0 +1,239 @@
+import tempfile
+import time
+from PIL import Image as pill_image
+from unittest.mock import AsyncMock, patch
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from core.tests.test_models import (
+    LOCAL_CACHES, sample_user, sample_plan, sample_thumbnail)
+from core.models import Image, ThumbnailImage, ExpiredLinkImage
+from ..pagination import ImagePagination
+from ..serializers import ImageListSerializer
+from .test_serializers import FieldImageListSerializer
+
+IMAGE_LIST_URL = reverse('thumbnail:list-image')
+IMAGE_UPLOAD_URL = reverse('thumbnail:upload-image')
+ASYNC_IMAGE_UPLOAD_URL = reverse('thumbnail:async-upload-image')
+BATCH_IMAGE_UPLOAD_URL = reverse('thumbnail:batch-upload-image')
+IMAGE_EXPORT_URL = reverse('thumbnail:export-image')
+NOTIFICATIONS_URL = reverse('thumbnail:thumbnail-notifications')
+
+
+def image_file():
+    upload = tempfile.NamedTemporaryFile(suffix='.png')
+    pill_image.new('RGB', (20, 20)).save(upload, 'png')
+    upload.seek(0)
+    return upload
+
+
+@tag('performance')
+@override_settings(CACHES=LOCAL_CACHES, SUSPEND_SIGNALS=True)
+class PerformanceTests(APITestCase):
+    """
+    Queries per request must not grow with the number of rows, and pages
+    serialize faster than with the field based serializer.
+
+    Requests authenticate with a real token, so the permission classes'
+    lookups are counted as well.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.plan = sample_plan(
+            name='Plan', original_image=True, expired_link=True)
+        self.thumbnails = [
+            sample_thumbnail(value=value) for value in (100, 200, 400)]
+        self.plan.thumbnails.add(*self.thumbnails[:2])
+        self.user = sample_user(
+            email='test@email.com', name='test', password='testpassword',
+            plan=self.plan)
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def add_images(self, count):
+        """Rows only, the list view never opens the files."""
+        images = Image.objects.bulk_create(
+            Image(user=self.user, image=f'uploads/{i}.png')
+            for i in range(count))
+        ThumbnailImage.objects.bulk_create(
+            ThumbnailImage(
+                image=image, thumbnail_value=thumbnail, size=thumbnail.value,
+                thumbnailed_image=f'uploads/{image.id}-{thumbnail.value}.png')
+            for image in images for thumbnail in self.thumbnails)
+        self.user.image_count += count
+        self.user.save()
+
+    def count_queries(self, request, *args, **kwargs):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            res = request(*args, **kwargs)
+            # Streamed bodies query while they are read
+            if res.streaming:
+                b''.join(res.streaming_content)
+        self.assertLess(res.status_code, 300)
+        self.queries = [query['sql'] for query in queries]
+        return len(queries)
+
+    def assertPageLimited(self):
+        """The last request read its images one page at a time."""
+        images = [sql for sql in self.queries if 'FROM "core_image" ' in sql]
+        self.assertEqual(len(images), 1, images)
+        self.assertIn('LIMIT', images[0])
+
+    def assertWithinBudget(self, view_name, counts):
+        """Same count for every size, within the production budget."""
+        self.assertEqual(len(set(counts)), 1, counts)
+        self.assertLessEqual(counts[0], settings.QUERY_BUDGETS[view_name])
+
+    def test_image_list(self):
+        for query in ({}, {'count': 'false'}):
+            counts = []
+            for page_size in (1, 20, 100):
+                for image_count in (page_size, 2 * page_size + 1):
+                    Image.objects.all().delete()
+                    self.add_images(image_count)
+                    with patch.object(
+                            ImagePagination, 'page_size', page_size):
+                        counts.append(self.count_queries(
+                            self.client.get, IMAGE_LIST_URL, query))
+                    # Counts alone miss reading the whole library
+                    self.assertPageLimited()
+            with self.subTest(query=query):
+                self.assertWithinBudget('thumbnail:list-image', counts)
+
+    def test_image_list_later_page(self):
+        self.add_images(45)
+        counts = [
+            self.count_queries(self.client.get, IMAGE_LIST_URL, {'page': page})
+            for page in (1, 2, 3)]
+        self.assertWithinBudget('thumbnail:list-image', counts)
+        self.assertPageLimited()
+
+    @patch.object(ImagePagination, 'page_size', 20)
+    def test_image_list_cached_page(self):
+        self.add_images(45)
+        for query in ({}, {'count': 'false'}):
+            self.count_queries(self.client.get, IMAGE_LIST_URL, query)
+            self.assertPageLimited()
+            # The page comes from the cache for a while
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.get(IMAGE_LIST_URL, query)
+            self.assertEqual(len(res.data['results']), 20)
+            self.assertFalse([
+                query for query in queries
+                if 'FROM "core_image" ' in query['sql']])
+
+    @patch('thumbnail.serializers.submit_thumbnails')
+    def test_image_upload(self, mocked_submit):
+        for view_name, url in (
+                ('thumbnail:upload-image', IMAGE_UPLOAD_URL),
+                ('thumbnail:async-upload-image', ASYNC_IMAGE_UPLOAD_URL)):
+            counts = []
+            for image_count in (0, 50):
+                self.add_images(image_count)
+                with image_file() as upload:
+                    counts.append(self.count_queries(
+                        self.client.post, url,
+                        {'image': upload}, format='multipart'))
+            with self.subTest(view_name=view_name):
+                self.assertWithinBudget(view_name, counts)
+
+    @patch('thumbnail.serializers.group')
+    def test_batch_upload(self, mocked_group):
+        counts = []
+        for file_count in (1, 10):
+            uploads = [image_file() for _ in range(file_count)]
+            counts.append(self.count_queries(
+                self.client.post, BATCH_IMAGE_UPLOAD_URL,
+                {'images': uploads}, format='multipart'))
+            for upload in uploads:
+                upload.close()
+        self.assertWithinBudget('thumbnail:batch-upload-image', counts)
+
+    @patch('thumbnail.serializers.submit_binary_image')
+    def test_create_link(self, mocked_submit):
+        async_wait = patch(
+            'thumbnail.serializers.wait_for_result', new_callable=AsyncMock)
+        with async_wait as mocked_wait:
+            for view_name in (
+                    'thumbnail:create-link', 'thumbnail:async-create-link'):
+                counts = []
+                for image_count in (1, 50):
+                    self.add_images(image_count)
+                    image = Image.objects.last()
+                    link = ExpiredLinkImage.objects.create(
+                        image=image, duration=300)
+                    mocked_submit.return_value.get.return_value = link.uuid
+                    mocked_wait.return_value = link.uuid
+                    counts.append(self.count_queries(
+                        self.client.post,
+                        reverse(view_name, args=[image.uuid]),
+                        {'duration': 300}))
+                with self.subTest(view_name=view_name):
+                    self.assertWithinBudget(view_name, counts)
+
+    def test_retrieve_link(self):
+        counts = []
+        for link_count in (1, 50):
+            self.add_images(1)
+            image = Image.objects.last()
+            links = ExpiredLinkImage.objects.bulk_create(
+                ExpiredLinkImage(image=image, duration=300)
+                for _ in range(link_count))
+            counts.append(self.count_queries(
+                self.client.get,
+                reverse('thumbnail:retrieve-link', args=[links[-1].uuid])))
+        self.assertWithinBudget('thumbnail:retrieve-link', counts)
+
+    def test_image_export(self):
+        counts = []
+        for image_count in (1, 50):
+            # Rows without files, every row is read, none is archived
+            self.add_images(image_count)
+            counts.append(
+                self.count_queries(self.client.get, IMAGE_EXPORT_URL))
+        self.assertWithinBudget('thumbnail:export-image', counts)
+        # Chunks come from one cursor
+        with override_settings(EXPORT_QUERY_CHUNK_SIZE=20):
+            self.assertEqual(
+                self.count_queries(self.client.get, IMAGE_EXPORT_URL),
+                counts[0])
+
+    @patch('thumbnail.views.read_events')
+    def test_notifications(self, mocked_read):
+        counts = []
+        for event_count in (1, 50):
+            mocked_read.return_value = [
+                {'id': i, 'image': 'uuid', 'sizes': [100]}
+                for i in range(1, event_count + 1)]
+            counts.append(self.count_queries(
+                self.client.get, NOTIFICATIONS_URL, {'timeout': 0}))
+        self.assertWithinBudget('thumbnail:thumbnail-notifications', counts)
+
+    def test_image_list_serialization_time(self):
+        self.add_images(100)
+        page = list(
+            Image.objects.filter(user=self.user)
+            .select_related('user__plan')
+            .prefetch_related('user__plan__thumbnails', 'thumbnails'))
+        timings = {ImageListSerializer: [], FieldImageListSerializer: []}
+        # Best of a few interleaved runs, load slows both alike
+        for _ in range(5):
+            for serializer_class, runs in timings.items():
+                start = time.perf_counter()
+                serializer_class(page, many=True).data
+                runs.append(time.perf_counter() - start)
+        # Usually about 3x faster
+        self.assertLess(
+            min(timings[ImageListSerializer]),
+            min(timings[FieldImageListSerializer]))
+
+        # Everything is prefetched, serializing is query free
+        with self.assertNumQueries(0):
+            ImageListSerializer(page, many=True).data
@@ -0,0 +1,119 @@
+from django.test import TestCase, override_settings
+from rest_framework import serializers
+from rest_framework.reverse import reverse
+from rest_framework.test import APIRequestFactory
+from core.tests.test_models import sample_user, sample_plan, sample_thumbnail
+from core.models import Image, ThumbnailImage
+from ..serializers import ImageListSerializer
+
+
+class FieldThumbnailSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ThumbnailImage
+        fields = ('thumbnailed_image',)
+
+    def to_representation(self, instance):
+        ret = super().to_representation(instance)
+        ret['value'] = instance.size
+        return ret
+
+
+class FieldImageListSerializer(serializers.ModelSerializer):
+    """Field based serializer the list view had, the reference output."""
+    thumbnails = serializers.SerializerMethodField(read_only=True)
+    expired_link = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = Image
+        fields = ('thumbnails', 'expired_link', 'image', 'placeholder')
+
+    def get_expired_link(self, obj):
+        return reverse(
+            'thumbnail:create-link', args=[obj.uuid],
+            request=self.context.get('request'))
+
+    def get_thumbnails(self, obj):
+        allowed = [thumb.value for thumb in obj.user.plan.thumbnails.all()]
+        query = filter(lambda x: x.size in allowed, obj.thumbnails.all())
+        return FieldThumbnailSerializer(
+            query, many=True, context=self.context).data
+
+    def to_representation(self, instance):
+        ret = super().to_representation(instance)
+        if not instance.user.plan.expired_link:
+            ret.pop('expired_link')
+        if not instance.user.plan.original_image:
+            ret.pop('image')
+        return ret
+
+
+def list_page():
+    """Images the way the list view fetches them."""
+    return list(
+        Image.objects.select_related('user__plan')
+        .prefetch_related('user__plan__thumbnails', 'thumbnails')
+        .order_by('id'))
+
+
+@override_settings(SUSPEND_SIGNALS=True)
+class ImageListSerializerTests(TestCase):
+    def setUp(self):
+        self.thumbnails = {
+            value: sample_thumbnail(value=value) for value in (100, 200, 400)}
+        basic = sample_plan(name='Basic')
+        basic.thumbnails.add(self.thumbnails[200])
+        premium = sample_plan(
+            name='Premium', original_image=True, expired_link=True)
+        premium.thumbnails.add(self.thumbnails[200], self.thumbnails[400])
+        self.users = [
+            sample_user(
+                email=f'{plan.name}@email.com', name=plan.name,
+                password='testpassword', plan=plan)
+            for plan in (basic, premium)]
+        for user in self.users:
+            for i in range(2):
+                image = Image.objects.create(
+                    user=user, image=f'uploads/{user.id}-{i}.png',
+                    placeholder='data:image/jpeg;base64,AA==')
+                # Every size exists, plans decide what is listed
+                for value, thumbnail in self.thumbnails.items():
+                    ThumbnailImage.objects.create(
+                        image=image, thumbnail_value=thumbnail, size=value,
+                        thumbnailed_image=f'uploads/{image.id}-{value}.png')
+        self.context = {'request': APIRequestFactory().get('/')}
+
+    def test_rows_follow_each_users_plan(self):
+        basic_row, _, premium_row, _ = ImageListSerializer(
+            list_page(), many=True, context=self.context).data
+
+        self.assertEqual(
+            list(basic_row), ['thumbnails', 'placeholder'])
+        self.assertEqual(
+            [thumb['value'] for thumb in basic_row['thumbnails']], [200])
+        self.assertEqual(
+            list(premium_row),
+            ['thumbnails', 'expired_link', 'image', 'placeholder'])
+        self.assertEqual(
+            [thumb['value'] for thumb in premium_row['thumbnails']],
+            [200, 400])
+        self.assertTrue(premium_row['image'].startswith('http://testserver/'))
+        self.assertIn('/create-link/', premium_row['expired_link'])
+
+    def test_same_output_as_field_serializer(self):
+        page = list_page()
+        rows = ImageListSerializer(page, many=True, context=self.context).data
+        reference = FieldImageListSerializer(
+            page, many=True, context=self.context).data
+
+        self.assertEqual(
+            [dict(row) for row in rows], [dict(row) for row in reference])
+        for row, reference_row in zip(rows, reference):
+            self.assertEqual(list(row), list(reference_row))
+
+    def test_without_request(self):
+        page = list_page()
+        rows = ImageListSerializer(page, many=True).data
+        reference = FieldImageListSerializer(page, many=True).data
+
+        self.assertEqual(
+            [dict(row) for row in rows], [dict(row) for row in reference])
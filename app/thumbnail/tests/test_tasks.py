@@ -1,19 +1,54 @@
 import tempfile
 import uuid
 from PIL import Image as pill_image
+from unittest.mock import patch
 from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import InMemoryUploadedFile
-from ..tasks import create_thumbnails, create_binary_image
-from core.models import Image, Thumbnail, ExpiredLinkImage
+from django.db import IntegrityError
+from ..tasks import (
+    create_thumbnails,
+    create_thumbnails_batch,
+    make_thumbnail_file,
+    flush_thumbnail_batch,
+    create_binary_image,
+    submit_thumbnails,
+    submit_binary_image,
+    run_backfill
+)
+from ..registry import (
+    thumbnail_job_key,
+    binary_job_key,
+    claim_thumbnail_jobs,
+    release_thumbnail_jobs
+)
+from core.tests.test_models import LOCAL_CACHES
+from core.models import (
+    Image, Thumbnail, ThumbnailImage, ExpiredLinkImage, Plan, Backfill)
 
 
 @override_settings(
+    CACHES=LOCAL_CACHES,
     CELERY_TASK_ALWAYS_EAGER=True,
     CELERY_TASK_EAGER_PROPAGATES=True,
     SUSPEND_SIGNALS=True
 )
 class CeleryTasksTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def sample_image_model(self, size=(1, 1)):
+        user = get_user_model().objects.create(
+            email='test@email.com', name='test', password='testpassword')
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            image = pill_image.new('RGB', size)
+            image.save(image_file, 'png')
+            image = InMemoryUploadedFile(
+                image_file, 'image', 'image.png',
+                'png', image_file.tell(), None)
+            return Image.objects.create(user=user, image=image)
+
     def test_create_thumbnail_task(self):
         params = {
             'email': 'test@email.com',
@@ -36,6 +71,9 @@ class CeleryTasksTest(TestCase):
         result = create_thumbnails.delay(image_id=image_model.id)
         self.assertTrue(result.successful())
         self.assertEqual(image_model.thumbnails.count(), 1)
+        image_model.refresh_from_db()
+        self.assertTrue(
+            image_model.placeholder.startswith('data:image/jpeg;base64,'))
 
         # After changed plan
         thumbnail = Thumbnail.objects.create(value=400)
@@ -65,6 +103,273 @@ class CeleryTasksTest(TestCase):
         result = create_binary_image.delay(
             image_id=image_model.id, duration=400)
         self.assertTrue(result.successful())
-        self.assertEqual(type(result.get()), uuid.UUID)
+        self.assertEqual(type(result.get()), str)
+        self.assertEqual(
+            uuid.UUID(result.get()),
+            ExpiredLinkImage.objects.all().first().uuid)
+
+    @override_settings(WORKER_MAX_PIXELS=100)
+    def test_create_thumbnails_over_pixel_budget(self):
+        image_model = self.sample_image_model(size=(20, 20))
+        Thumbnail.objects.create(value=200)
+
+        with self.assertRaises(pill_image.DecompressionBombError):
+            create_thumbnails.delay(image_id=image_model.id)
+        self.assertEqual(ThumbnailImage.objects.count(), 0)
+
+    @override_settings(BINARY_MAX_PIXELS=100)
+    def test_create_binary_image_reduced_size(self):
+        image_model = self.sample_image_model(size=(40, 20))
+
+        result = create_binary_image.delay(image_model.id, 300)
+        binary = ExpiredLinkImage.objects.get(uuid=result.get())
+        with pill_image.open(binary.binary_image) as im:
+            self.assertLessEqual(im.width * im.height, 100)
+            self.assertEqual(im.size, (14, 7))
+
+    def test_create_binary_image_full_size(self):
+        image_model = self.sample_image_model(size=(40, 20))
+
+        result = create_binary_image.delay(image_model.id, 300)
+        binary = ExpiredLinkImage.objects.get(uuid=result.get())
+        with pill_image.open(binary.binary_image) as im:
+            self.assertEqual(im.size, (40, 20))
+
+    def test_task_result_options(self):
+        # Only tasks somebody waits for keep results
+        self.assertTrue(create_thumbnails.ignore_result)
+        self.assertTrue(create_thumbnails_batch.ignore_result)
+        self.assertTrue(run_backfill.ignore_result)
+        self.assertFalse(create_binary_image.ignore_result)
+
+    def test_create_thumbnails_twice(self):
+        Thumbnail.objects.create(value=200)
+        image_model = self.sample_image_model()
+
+        create_thumbnails.delay(image_id=image_model.id)
+        create_thumbnails.delay(image_id=image_model.id)
+        create_thumbnails.delay(
+            image_id=image_model.id, thumbnail_values=[200])
+        self.assertEqual(image_model.thumbnails.count(), 1)
+        self.assertEqual(ThumbnailImage.objects.count(), 1)
+
+    @patch('thumbnail.tasks.publish_ready')
+    def test_create_thumbnails_publishes_ready(self, mocked_publish):
+        Thumbnail.objects.create(value=200)
+        Thumbnail.objects.create(value=100)
+        image_model = self.sample_image_model()
+
+        create_thumbnails.delay(image_id=image_model.id)
+        mocked_publish.assert_called_once_with(
+            image_model.user_id, image_model.uuid, [100, 200])
+        # Nothing new, nothing announced
+        create_thumbnails.delay(image_id=image_model.id)
+        self.assertEqual(mocked_publish.call_count, 1)
+
+    def test_thumbnail_image_unique_size(self):
+        thumbnail = Thumbnail.objects.create(value=200)
+        image_model = self.sample_image_model()
+        ThumbnailImage.objects.create(
+            image=image_model, thumbnail_value=thumbnail)
+
+        with self.assertRaises(IntegrityError):
+            ThumbnailImage.objects.create(
+                image=image_model, thumbnail_value=thumbnail)
+
+    def test_submit_thumbnails_drops_in_flight_jobs(self):
+        Thumbnail.objects.create(value=200)
+        Thumbnail.objects.create(value=400)
+        image_model = self.sample_image_model()
+        # Job for 200 is in flight
+        self.assertEqual(claim_thumbnail_jobs(image_model.id, [200]), [200])
+
+        with patch('thumbnail.tasks.create_thumbnails.apply_async') as apply:
+            submit_thumbnails(image_model.id)
+            apply.assert_called_once()
+            args, kwargs = apply.call_args
+            self.assertEqual(args, (
+                (image_model.id,),
+                {'thumbnail_values': [400], 'user_id': None}))
+            self.assertIn('submitted_at', kwargs['headers'])
+            apply.reset_mock()
+            # Both are in flight now
+            self.assertIsNone(submit_thumbnails(image_model.id))
+            apply.assert_not_called()
+
+    def test_create_thumbnails_batch(self):
+        Thumbnail.objects.create(value=200)
+        thumbnail = Thumbnail.objects.create(value=400)
+        image_model = self.sample_image_model()
+        user = image_model.user
+        second_image = Image.objects.create(
+            user=user, image=image_model.image.name)
+        ThumbnailImage.objects.create(
+            image=second_image, thumbnail_value=thumbnail)
+        claim_thumbnail_jobs(image_model.id, [200, 400])
+        jobs = [
+            [image_model.id, [200, 400], None, 0],
+            [second_image.id, [200, 400], None, 0],
+            # Deleted meanwhile
+            [0, [200], None, 0],
+        ]
+
+        self.assertEqual(create_thumbnails_batch(jobs), 3)
+        self.assertEqual(image_model.thumbnails.count(), 2)
+        self.assertEqual(second_image.thumbnails.count(), 2)
+        image_model.refresh_from_db()
+        self.assertTrue(image_model.placeholder)
+        self.assertIsNone(cache.get(thumbnail_job_key(image_model.id, 200)))
+        # Nothing left to do
+        self.assertEqual(create_thumbnails_batch(jobs), 0)
+
+    def test_create_thumbnails_batch_skips_broken_images(self):
+        Thumbnail.objects.create(value=200)
+        image_model = self.sample_image_model()
+        broken = Image.objects.create(
+            user=image_model.user, image='uploads/missing.png')
+        jobs = [
+            [broken.id, [200], None, 0],
+            [image_model.id, [200], None, 0],
+        ]
+
+        with self.assertLogs('thumbnail.tasks', 'ERROR'):
+            self.assertEqual(create_thumbnails_batch(jobs), 1)
+        self.assertFalse(broken.thumbnails.exists())
+        self.assertEqual(image_model.thumbnails.count(), 1)
+
+    def test_create_thumbnails_batch_deletes_skipped_files(self):
+        thumbnail = Thumbnail.objects.create(value=200)
+        image_model = self.sample_image_model()
+
+        def made_meanwhile(image, value):
+            # Another job stores the size while this one renders
+            ThumbnailImage.objects.create(
+                image=image, thumbnail_value=thumbnail,
+                thumbnailed_image='uploads/other.png')
+            return make_thumbnail_file(image, value)
+
+        with patch('thumbnail.tasks.make_thumbnail_file', made_meanwhile), \
+                patch('django.core.files.storage.FileSystemStorage.delete') \
+                as delete:
+            self.assertEqual(
+                create_thumbnails_batch([[image_model.id, [200], None, 0]]),
+                0)
+        delete.assert_called_once()
+        self.assertEqual(
+            image_model.thumbnails.get().thumbnailed_image.name,
+            'uploads/other.png')
+
+    @patch('thumbnail.registry.cache.delete_many')
+    def test_release_without_values(self, mocked_delete_many):
+        release_thumbnail_jobs(1, [])
+        mocked_delete_many.assert_not_called()
+        release_thumbnail_jobs(1, [200])
+        mocked_delete_many.assert_called_once_with(
+            [thumbnail_job_key(1, 200)])
+
+    @override_settings(THUMBNAIL_BATCH_SIZE=3, THUMBNAIL_BATCH_WAIT=500)
+    def test_submit_thumbnails_buffers_jobs(self):
+        Thumbnail.objects.create(value=200)
+        image_model = self.sample_image_model()
+
+        with patch('thumbnail.tasks.push_job', return_value=1) as push, \
+                patch('thumbnail.tasks.flush_thumbnail_batch') as flush:
+            submit_thumbnails(image_model.id)
+            job = push.call_args[0][0]
+            self.assertEqual(job[:3], [image_model.id, [200], None])
+            # First job waits for the batch
+            flush.apply_async.assert_called_once_with(countdown=0.5)
+            # Full batch is flushed right away
+            push.return_value = 3
+            cache.clear()
+            submit_thumbnails(image_model.id)
+            flush.delay.assert_called_once_with()
+
+    @override_settings(THUMBNAIL_BATCH_SIZE=3)
+    def test_flush_thumbnail_batch(self):
+        Thumbnail.objects.create(value=200)
+        image_model = self.sample_image_model()
+        jobs = [[image_model.id, [200], None, 0]]
+
+        with patch('thumbnail.tasks.pop_jobs', return_value=(jobs, 0)) as pop:
+            self.assertEqual(flush_thumbnail_batch(), 1)
+            pop.assert_called_once_with(3)
+        self.assertEqual(image_model.thumbnails.count(), 1)
+
+    def test_submit_thumbnails_releases_jobs(self):
+        Thumbnail.objects.create(value=200)
+        image_model = self.sample_image_model()
+
+        submit_thumbnails(image_model.id)
+        self.assertEqual(image_model.thumbnails.count(), 1)
+        self.assertIsNone(cache.get(thumbnail_job_key(image_model.id, 200)))
+
+    def test_submit_binary_image_joins_in_flight_job(self):
+        image_model = self.sample_image_model()
+        cache.add(binary_job_key(image_model.id, 400), 'in-flight-id')
+
+        with patch('thumbnail.tasks.create_binary_image.apply_async') as task:
+            result = submit_binary_image(image_model.id, 400)
+            task.assert_not_called()
+            self.assertEqual(result.id, 'in-flight-id')
+
+        cache.clear()
+        result = submit_binary_image(image_model.id, 400)
         self.assertEqual(
-            result.get(), ExpiredLinkImage.objects.all().first().uuid)
+            result.get(), str(ExpiredLinkImage.objects.all().first().uuid))
+        self.assertIsNone(cache.get(binary_job_key(image_model.id, 400)))
+
+    def test_submit_binary_image_releases_unpublished_job(self):
+        image_model = self.sample_image_model()
+
+        with patch('thumbnail.tasks.create_binary_image.apply_async',
+                   side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                submit_binary_image(image_model.id, 400)
+        self.assertIsNone(cache.get(binary_job_key(image_model.id, 400)))
+
+    def test_run_backfill_resumes_from_checkpoint(self):
+        Thumbnail.objects.create(value=200)
+        image_model = self.sample_image_model()
+        plan = Plan.objects.create(name='test')
+        image_model.user.plan = plan
+        image_model.user.save()
+        second_image = Image.objects.create(
+            user=image_model.user, image=image_model.image.name)
+        # First image was processed before the crash
+        backfill = Backfill.objects.create(
+            plan=plan, thumbnail_values=[200], total=2,
+            status=Backfill.Status.RUNNING,
+            last_image_id=image_model.id, processed=1)
+
+        # Stale run is ignored
+        run_backfill.delay(backfill.id, 0)
+        self.assertEqual(second_image.thumbnails.count(), 0)
+
+        run_backfill.delay(backfill.id, image_model.id)
+        backfill.refresh_from_db()
+        self.assertEqual(image_model.thumbnails.count(), 0)
+        self.assertEqual(second_image.thumbnails.count(), 1)
+        self.assertEqual(backfill.status, Backfill.Status.DONE)
+        self.assertEqual(backfill.processed, 2)
+
+    def test_run_backfill_skips_broken_images(self):
+        Thumbnail.objects.create(value=200)
+        image_model = self.sample_image_model()
+        plan = Plan.objects.create(name='test')
+        image_model.user.plan = plan
+        image_model.user.save()
+        broken_image = Image.objects.create(
+            user=image_model.user, image='uploads/missing.png')
+        backfill = Backfill.objects.create(
+            plan=plan, thumbnail_values=[200], total=2)
+
+        with self.assertLogs('thumbnail.tasks', 'ERROR'):
+            run_backfill.delay(backfill.id, 0)
+        backfill.refresh_from_db()
+        self.assertEqual(backfill.status, Backfill.Status.DONE)
+        self.assertEqual(backfill.processed, 2)
+        self.assertEqual(backfill.failed, 1)
+        self.assertEqual(image_model.thumbnails.count(), 1)
+        self.assertEqual(broken_image.thumbnails.count(), 0)
+        self.assertIsNone(cache.get(thumbnail_job_key(broken_image.id, 200)))
@@ -1,28 +1,61 @@
 import tempfile
 import shutil
 import os
+import zipfile
+from io import BytesIO
 from PIL import Image as pill_image
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.core.asgi import get_asgi_application
 from django.urls import reverse
 from django.core.files.uploadedfile import InMemoryUploadedFile
-from django.test import override_settings
-from rest_framework.test import APITestCase
+from unittest.mock import patch
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
+from rest_framework.authtoken.models import Token
 from core.tests.test_models import sample_user, sample_plan, sample_thumbnail
 from core.models import ThumbnailImage, Image, ExpiredLinkImage
 from ..serializers import ImageListSerializer
+from ..tasks import create_thumbnails_batch
+from ..utils import ResultUnavailable
 
 IMAGE_UPLOAD_URL = reverse('thumbnail:upload-image')
+BATCH_IMAGE_UPLOAD_URL = reverse('thumbnail:batch-upload-image')
+ASYNC_IMAGE_UPLOAD_URL = reverse('thumbnail:async-upload-image')
 IMAGE_LIST_URL = reverse('thumbnail:list-image')
+IMAGE_EXPORT_URL = reverse('thumbnail:export-image')
+NOTIFICATIONS_URL = reverse('thumbnail:thumbnail-notifications')
 
 
 def expired_link_create_url(uuid):
     return reverse('thumbnail:create-link', args=[uuid])
 
 
+def async_expired_link_create_url(uuid):
+    return reverse('thumbnail:async-create-link', args=[uuid])
+
+
 def expired_link_retrieve_url(uuid):
     return reverse('thumbnail:retrieve-link', args=[uuid])
 
 
+async def asgi_get(path, headers):
+    """Status and body of a GET served by the ASGI application."""
+    communicator = ApplicationCommunicator(get_asgi_application(), {
+        'type': 'http', 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'query_string': b'',
+        'headers': headers, 'server': ('testserver', 80)})
+    await communicator.send_input({'type': 'http.request'})
+    start = await communicator.receive_output(5)
+    body = b''
+    while True:
+        message = await communicator.receive_output(5)
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return start['status'], body
+
+
 @override_settings(
     CELERY_TASK_ALWAYS_EAGER=True,
     CELERY_TASK_EAGER_PROPAGATES=True,
@@ -106,6 +139,188 @@ class ImageViewsTests(APITestCase):
             self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
             self.assertEqual(self.user.image_set.count(), 0)
 
+    def test_image_upload_over_plan_limits(self):
+        self.client.force_authenticate(user=self.user)
+        self.plan.max_image_pixels = 100 * 100
+        self.plan.save()
+        self.user.plan = self.plan
+        self.user.save()
+
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            img = pill_image.new('RGB', (200, 200))
+            img.save(image_file, 'png')
+            image_file.seek(0)
+            res = self.client.post(
+                IMAGE_UPLOAD_URL, {'image': image_file}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+        self.assertEqual(self.user.image_set.count(), 0)
+
+        # Dimension limit
+        self.plan.max_image_pixels = None
+        self.plan.max_image_dimension = 150
+        self.plan.save()
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            img = pill_image.new('RGB', (200, 10))
+            img.save(image_file, 'png')
+            image_file.seek(0)
+            res = self.client.post(
+                IMAGE_UPLOAD_URL, {'image': image_file}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.user.image_set.count(), 0)
+
+    def test_batch_image_upload(self):
+        res = self.client.post(BATCH_IMAGE_UPLOAD_URL, {}, format='multipart')
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.force_authenticate(user=self.user)
+        self.user.plan = self.plan
+        self.user.save()
+        image_files = []
+        for _ in range(3):
+            image_file = tempfile.NamedTemporaryFile(suffix='.png')
+            img = pill_image.new('RGB', (200, 200))
+            img.save(image_file, 'png')
+            image_file.seek(0)
+            image_files.append(image_file)
+        res = self.client.post(
+            BATCH_IMAGE_UPLOAD_URL, {'images': image_files},
+            format='multipart')
+        for image_file in image_files:
+            image_file.close()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['count'], 3)
+        self.assertEqual(self.user.image_set.count(), 3)
+        self.assertEqual(ThumbnailImage.objects.all().count(), 3)
+        for image in self.user.image_set.all():
+            self.assertEqual(image.thumbnails.count(), 1)
+
+    @override_settings(THUMBNAIL_BATCH_SIZE=2)
+    def test_batch_image_upload_micro_batches(self):
+        self.client.force_authenticate(user=self.user)
+        self.user.plan = self.plan
+        self.user.save()
+        image_files = []
+        for _ in range(3):
+            image_file = tempfile.NamedTemporaryFile(suffix='.png')
+            pill_image.new('RGB', (200, 200)).save(image_file, 'png')
+            image_file.seek(0)
+            image_files.append(image_file)
+        with patch('thumbnail.tasks.create_thumbnails_batch.run',
+                   wraps=create_thumbnails_batch.run) as run:
+            res = self.client.post(
+                BATCH_IMAGE_UPLOAD_URL, {'images': image_files},
+                format='multipart')
+        for image_file in image_files:
+            image_file.close()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        # Two tasks for three images
+        self.assertEqual(run.call_count, 2)
+        self.assertEqual(ThumbnailImage.objects.count(), 3)
+
+    def test_batch_image_upload_with_wrong_ext(self):
+        self.client.force_authenticate(user=self.user)
+        self.user.plan = self.plan
+        self.user.save()
+
+        with tempfile.NamedTemporaryFile(suffix='.png') as png_file, \
+                tempfile.NamedTemporaryFile(suffix='.gif') as gif_file:
+            pill_image.new('RGB', (200, 200)).save(png_file, 'png')
+            pill_image.new('RGB', (200, 200)).save(gif_file, 'gif')
+            png_file.seek(0)
+            gif_file.seek(0)
+            res = self.client.post(
+                BATCH_IMAGE_UPLOAD_URL, {'images': [png_file, gif_file]},
+                format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.user.image_set.count(), 0)
+
+    def test_async_image_upload(self):
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            img = pill_image.new('RGB', (200, 200))
+            img.save(image_file, 'png')
+            image_file.seek(0)
+            res = self.client.post(
+                ASYNC_IMAGE_UPLOAD_URL, {'image': image_file},
+                format='multipart')
+
+            self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.force_authenticate(user=self.user)
+        self.user.plan = self.plan
+        self.user.save()
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            img = pill_image.new('RGB', (200, 200))
+            img.save(image_file, 'png')
+            image_file.seek(0)
+            res = self.client.post(
+                ASYNC_IMAGE_UPLOAD_URL, {'image': image_file},
+                format='multipart')
+
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(self.user.image_set.count(), 1)
+            self.assertTrue(self.user.image_set.first().image)
+            self.assertEqual(ThumbnailImage.objects.all().count(), 1)
+
+    def test_async_image_upload_with_wrong_ext(self):
+        self.client.force_authenticate(user=self.user)
+        self.user.plan = self.plan
+        self.user.save()
+
+        with tempfile.NamedTemporaryFile(suffix='.gif') as image_file:
+            img = pill_image.new('RGB', (200, 200))
+            img.save(image_file, 'gif')
+            image_file.seek(0)
+            res = self.client.post(
+                ASYNC_IMAGE_UPLOAD_URL, {'image': image_file},
+                format='multipart')
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(self.user.image_set.count(), 0)
+
+    def test_async_expired_link_create(self):
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            image = pill_image.new('RGB', (1, 1))
+            image.save(image_file, 'png')
+            image = InMemoryUploadedFile(
+                image_file, 'image', 'image.png',
+                'png', image_file.tell(), None)
+            image_model = Image.objects.create(user=self.user, image=image)
+
+        payload = {'duration': 300}
+        self.client.force_authenticate(self.user)
+        res = self.client.post(
+            async_expired_link_create_url(image_model.uuid), payload)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.plan.expired_link = True
+        self.plan.save()
+        self.user.plan = self.plan
+        self.user.save()
+        res = self.client.post(
+            async_expired_link_create_url(image_model.uuid), payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertIn('link', res.data)
+        self.assertEqual(ExpiredLinkImage.objects.count(), 1)
+
+        res = self.client.post(
+            async_expired_link_create_url(image_model.uuid),
+            {'duration': 299})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # The worker does not answer in time
+        with patch('thumbnail.serializers.wait_for_result',
+                   side_effect=ResultUnavailable):
+            res = self.client.post(
+                async_expired_link_create_url(image_model.uuid), payload)
+        self.assertEqual(
+            res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
     def test_expired_link_create_permissions(self):
         with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
             image = pill_image.new('RGB', (1, 1))
@@ -248,12 +463,14 @@ class ImageViewsTests(APITestCase):
             res = self.client.post(
                 expired_link_create_url(image_model.uuid), payload)
             self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            # No internal ids
+            self.assertEqual(set(res.data), {'link'})
 
         link = ExpiredLinkImage.objects.all().first()
         res = self.client.get(expired_link_retrieve_url(link.uuid))
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn('binary_image', res.data)
+        self.assertEqual(set(res.data), {'binary_image'})
         self.assertTrue(link.binary_image)
         self.assertEqual(link.duration, payload['duration'])
 
@@ -309,12 +526,66 @@ class ImageViewsTests(APITestCase):
             serializer.data.get('thumbnails')[0]['thumbnailed_image']
         )
         self.assertIn('thumbnails', res.data.get('results')[0])
+        self.assertTrue(res.data.get('results')[0]['placeholder']
+                        .startswith('data:image/jpeg;base64,'))
         self.assertNotIn('expired_link', res.data.get('results')[0])
         self.assertNotIn('image', res.data.get('results')[0])
         self.assertIn('count', res.data)
         self.assertIn('next', res.data)
         self.assertIn('previous', res.data)
 
+    def test_image_list_counts(self):
+        self.client.force_authenticate(self.user)
+        self.user.plan = self.plan
+        self.user.save()
+        for _ in range(3):
+            with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+                img = pill_image.new('RGB', (200, 200))
+                img.save(image_file, 'png')
+                image_file.seek(0)
+                self.client.post(
+                    IMAGE_UPLOAD_URL, {'image': image_file},
+                    format='multipart')
+
+        # Total comes from the counter
+        with override_settings(REST_FRAMEWORK={'PAGE_SIZE': 2}):
+            res = self.client.get(IMAGE_LIST_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 3)
+
+        # Without totals
+        res = self.client.get(IMAGE_LIST_URL, {'count': 'false'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', res.data)
+        self.assertEqual(len(res.data['results']), 3)
+        self.assertIsNone(res.data['next'])
+        self.assertIsNone(res.data['previous'])
+
+    def test_image_list_without_count_pages(self):
+        self.client.force_authenticate(self.user)
+        self.user.plan = self.plan
+        self.user.save()
+        for _ in range(3):
+            with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+                img = pill_image.new('RGB', (200, 200))
+                img.save(image_file, 'png')
+                image_file.seek(0)
+                self.client.post(
+                    IMAGE_UPLOAD_URL, {'image': image_file},
+                    format='multipart')
+
+        with patch('thumbnail.pagination.ImagePagination.page_size', 2):
+            res = self.client.get(IMAGE_LIST_URL, {'count': 'false'})
+            self.assertEqual(len(res.data['results']), 2)
+            self.assertIn('page=2', res.data['next'])
+            self.assertIsNone(res.data['previous'])
+
+            res = self.client.get(
+                IMAGE_LIST_URL, {'count': 'false', 'page': 2})
+            self.assertEqual(len(res.data['results']), 1)
+            self.assertIsNone(res.data['next'])
+            self.assertNotIn('page=', res.data['previous'])
+
     def test_image_list_full_option(self):
         self.client.force_authenticate(self.user)
         self.plan.thumbnails.add(sample_thumbnail(**{'value': 400}))
@@ -355,3 +626,117 @@ class ImageViewsTests(APITestCase):
         self.assertIn('count', res.data)
         self.assertIn('next', res.data)
         self.assertIn('previous', res.data)
+
+    def test_image_export_permissions(self):
+        res = self.client.get(IMAGE_EXPORT_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.force_authenticate(self.user)
+        res = self.client.get(IMAGE_EXPORT_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_image_export(self):
+        self.client.force_authenticate(self.user)
+        self.user.plan = self.plan
+        self.user.save()
+        # Thumbnail size outside of the plan
+        sample_thumbnail(**{'value': 50})
+        for _ in range(2):
+            with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+                img = pill_image.new('RGB', (200, 200))
+                img.save(image_file, 'png')
+                image_file.seek(0)
+                self.client.post(
+                    IMAGE_UPLOAD_URL, {'image': image_file},
+                    format='multipart')
+
+        res = self.client.get(IMAGE_EXPORT_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(BytesIO(b''.join(res.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        names = archive.namelist()
+        self.assertEqual(len(names), 2)
+        for image in Image.objects.all():
+            self.assertIn(f'thumbnails/100/{image.uuid}.png', names)
+
+        self.plan.original_image = True
+        self.plan.save()
+        res = self.client.get(IMAGE_EXPORT_URL)
+        archive = zipfile.ZipFile(BytesIO(b''.join(res.streaming_content)))
+        names = archive.namelist()
+        self.assertEqual(len(names), 4)
+        for image in Image.objects.all():
+            self.assertIn(f'originals/{image.uuid}.png', names)
+            with image.image.open('rb') as original:
+                self.assertEqual(
+                    archive.read(f'originals/{image.uuid}.png'),
+                    original.read())
+
+    def test_notifications_permissions(self):
+        res = self.client.get(NOTIFICATIONS_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.force_authenticate(self.user)
+        res = self.client.get(NOTIFICATIONS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    @patch('thumbnail.views.read_events')
+    def test_notifications(self, mocked_read):
+        self.client.force_authenticate(self.user)
+        self.user.plan = self.plan
+        self.user.save()
+        event = {'id': 3, 'image': 'uuid', 'sizes': [100]}
+        mocked_read.return_value = [event]
+
+        res = self.client.get(NOTIFICATIONS_URL, {'after': 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {'last': 3, 'events': [event]})
+        mocked_read.assert_called_once_with(self.user.id, 2)
+
+        # Nothing new before the timeout
+        mocked_read.return_value = []
+        res = self.client.get(NOTIFICATIONS_URL, {'after': 3, 'timeout': 0})
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        res = self.client.get(NOTIFICATIONS_URL, {'timeout': 3600})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True,
+    CELERY_TASK_EAGER_PROPAGATES=True,
+    SUSPEND_SIGNALS=True
+)
+class ImageExportASGITests(TransactionTestCase):
+    """The ASGI handler runs every request in a thread of its own."""
+
+    def tearDown(self):
+        """Clear media folder."""
+        path = '/vol/web/media/uploads/test@email.com'
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+    def test_image_export(self):
+        plan = sample_plan(name='Plan', original_image=True)
+        plan.thumbnails.add(sample_thumbnail(**{'value': 100}))
+        user = sample_user(
+            email='test@email.com', name='test', password='testpassword',
+            plan=plan)
+        token = Token.objects.create(user=user)
+        client = APIClient()
+        client.force_authenticate(user)
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            pill_image.new('RGB', (200, 200)).save(image_file, 'png')
+            image_file.seek(0)
+            client.post(
+                IMAGE_UPLOAD_URL, {'image': image_file}, format='multipart')
+
+        # The body is iterated in the event loop, no ORM there
+        status_code, body = async_to_sync(asgi_get)(
+            IMAGE_EXPORT_URL,
+            [(b'authorization', f'Token {token.key}'.encode())])
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        archive = zipfile.ZipFile(BytesIO(body))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(len(archive.namelist()), 2)
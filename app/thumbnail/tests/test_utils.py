@@ -0,0 +1,75 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+from celery import states
+from celery.backends.redis import RedisBackend
+from celery.result import AsyncResult
+from django.test import SimpleTestCase, override_settings
+from app.celery import app
+from ..utils import ResultUnavailable, wait_for_result
+
+
+class FakePubSub:
+    """Pub/sub handing out the queued messages."""
+
+    def __init__(self):
+        self.messages = asyncio.Queue()
+        self.channels = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def subscribe(self, channel):
+        self.channels.append(channel)
+
+    async def get_message(self, ignore_subscribe_messages, timeout):
+        try:
+            return await asyncio.wait_for(self.messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class WaitForResultTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = RedisBackend(app=app, url='redis://localhost:6379/1')
+        self.result = AsyncResult('task-id', backend=self.backend, app=app)
+        self.pubsub = FakePubSub()
+        self.client = MagicMock()
+        self.client.pubsub.return_value = self.pubsub
+        self.client.get = AsyncMock(return_value=None)
+        patcher = patch(
+            'redis.asyncio.Redis.from_url', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def payload(self, state, result):
+        return self.backend.encode(self.backend._get_result_meta(
+            result=result, state=state, traceback=None, request=None))
+
+    async def test_published_result(self):
+        self.pubsub.messages.put_nowait(
+            {'data': self.payload(states.STARTED, None)})
+        self.pubsub.messages.put_nowait(
+            {'data': self.payload(states.SUCCESS, 'binary-uuid')})
+        self.assertEqual(await wait_for_result(self.result), 'binary-uuid')
+        self.assertEqual(self.pubsub.channels, [b'celery-task-meta-task-id'])
+
+    async def test_stored_result(self):
+        self.client.get.return_value = self.payload(
+            states.SUCCESS, 'binary-uuid')
+        self.assertEqual(await wait_for_result(self.result), 'binary-uuid')
+
+    async def test_failed_task(self):
+        self.client.get.return_value = self.payload(
+            states.FAILURE,
+            self.backend.prepare_exception(ValueError('broken')))
+        with self.assertRaises(ValueError):
+            await wait_for_result(self.result)
+
+    @override_settings(ASYNC_RESULT_TIMEOUT=0.01)
+    async def test_timeout(self):
+        with self.assertRaises(ResultUnavailable) as raised:
+            await wait_for_result(self.result)
+        self.assertEqual(raised.exception.status_code, 503)
@@ -1,18 +1,33 @@
 from django.urls import path
 from .views import (
      ImageUploadAPIView,
+     ImageBatchUploadAPIView,
+     AsyncImageUploadAPIView,
      ExpiredLinkImageCreateAPIView,
+     AsyncExpiredLinkImageCreateAPIView,
      ExpiredLinkImageRetrieveAPIView,
-     ImageListAPIView
+     ImageListAPIView,
+     ImageExportAPIView,
+     ThumbnailNotificationsAPIView
 )
 
 app_name = 'thumbnail'
 
 urlpatterns = [
     path('', ImageListAPIView.as_view(), name='list-image'),
+    path('export/', ImageExportAPIView.as_view(), name='export-image'),
+    path('notifications/', ThumbnailNotificationsAPIView.as_view(),
+         name='thumbnail-notifications'),
     path('upload/', ImageUploadAPIView.as_view(), name='upload-image'),
+    path('upload/batch/', ImageBatchUploadAPIView.as_view(),
+         name='batch-upload-image'),
+    path('async/upload/', AsyncImageUploadAPIView.as_view(),
+         name='async-upload-image'),
     path('create-link/<uuid:image_pk>/',
          ExpiredLinkImageCreateAPIView.as_view(), name='create-link'),
+    path('async/create-link/<uuid:image_pk>/',
+         AsyncExpiredLinkImageCreateAPIView.as_view(),
+         name='async-create-link'),
     path('retreive-link/<uuid:bimage_pk>/',
          ExpiredLinkImageRetrieveAPIView.as_view(), name='retrieve-link'),
 ]
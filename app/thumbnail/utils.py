@@ -0,0 +1,84 @@
+import asyncio
+import weakref
+import redis
+import redis.asyncio
+from asgiref.sync import sync_to_async
+from celery import states
+from celery.backends.redis import RedisBackend
+from celery.result import EagerResult
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class ResultUnavailable(APIException):
+    """The worker's result did not arrive in time."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('The result is not ready yet, try again later.')
+    default_code = 'result_unavailable'
+
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client(url: str) -> redis.asyncio.Redis:
+    """Client of the running event loop, its pool is shared by waiters."""
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        _clients[loop] = redis.asyncio.Redis.from_url(url)
+    return _clients[loop]
+
+
+async def read_meta(backend: RedisBackend, task_id: str, timeout: float):
+    """Task meta once the task is ready, None on timeout."""
+    key = backend.get_key_for_task(task_id)
+    client = get_client(backend.url)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    async with client.pubsub() as pubsub:
+        # Subscribed first, results stored meanwhile are published to us
+        await pubsub.subscribe(key)
+        payload = await client.get(key)
+        while True:
+            if payload is not None:
+                meta = backend.decode_result(payload)
+                if meta['status'] in states.READY_STATES:
+                    return meta
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=remaining)
+            payload = message['data'] if message else None
+
+
+async def poll_meta(result, timeout: float):
+    """Task meta of backends other than Redis, polled from a thread pool."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not await sync_to_async(result.ready, thread_sensitive=False)():
+        if loop.time() >= deadline:
+            return None
+        await asyncio.sleep(settings.ASYNC_RESULT_POLL_INTERVAL)
+    return {'status': result.state, 'result': result.result}
+
+
+async def wait_for_result(result):
+    """Await a Celery result without blocking the event loop or a thread."""
+    if isinstance(result, EagerResult):
+        return result.get()
+    timeout = settings.ASYNC_RESULT_TIMEOUT
+    backend = result.backend
+    try:
+        if isinstance(backend, RedisBackend):
+            meta = await read_meta(backend, result.id, timeout)
+        else:
+            meta = await poll_meta(result, timeout)
+    except redis.RedisError:
+        raise ResultUnavailable()
+    if meta is None:
+        raise ResultUnavailable()
+    if meta['status'] in states.PROPAGATE_STATES:
+        raise backend.exception_to_python(meta['result'])
+    return meta['result']
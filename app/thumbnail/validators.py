@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+
+
+def validate_image_budget(image_file, plan) -> None:
+    """Check image header against the plan's limits without decoding."""
+    # Pillow is loaded by the first upload, not at start
+    from PIL import Image as pill_image
+    max_pixels = getattr(plan, 'max_image_pixels', None) \
+        or settings.IMAGE_MAX_PIXELS
+    max_dimension = getattr(plan, 'max_image_dimension', None) \
+        or settings.IMAGE_MAX_DIMENSION
+    position = image_file.tell()
+    try:
+        # Opening reads only the header
+        with pill_image.open(image_file) as im:
+            width, height = im.size
+            frames = getattr(im, 'n_frames', 1)
+    except (pill_image.DecompressionBombError, OSError):
+        raise serializers.ValidationError(_('Image is too large.'))
+    finally:
+        image_file.seek(position)
+    if max(width, height) > max_dimension:
+        raise serializers.ValidationError(
+            _('Image sides must not exceed %d pixels.') % max_dimension)
+    if width * height > max_pixels:
+        raise serializers.ValidationError(
+            _('Image must not exceed %d pixels.') % max_pixels)
+    if frames > settings.IMAGE_MAX_FRAMES:
+        raise serializers.ValidationError(
+            _('Image must not exceed %d frames.') % settings.IMAGE_MAX_FRAMES)
@@ -1,15 +1,30 @@
+from asgiref.sync import sync_to_async
 from rest_framework import generics, permissions, status, authentication
 from rest_framework.response import Response
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.cache import cache
+from django.db.models import Prefetch
 from .serializers import (
     ImageUploadSerializer,
+    ImageBatchUploadSerializer,
     ExpiredLinkImageSerializer,
-    ImageListSerializer
+    ImageListSerializer,
+    NotificationQuerySerializer
 )
 from .permissions import DoesUserHaveTier, CanCreateLink
-from core.models import ExpiredLinkImage, Image
+from .mixins import AsyncAPIViewMixin
+from .pagination import ImagePagination
+from .admission import admit_upload
+from .export import archive_entries, stream_zip
+from .notifications import get_hub, read_events
+from core.models import ExpiredLinkImage, Image, ThumbnailImage
+
+
+def list_cache_key(user_id: int) -> str:
+    """Cached list pages of a user, by URL."""
+    return f'image_pages_{user_id}'
 
 
 class ImageUploadAPIView(generics.CreateAPIView):
@@ -20,14 +35,40 @@ class ImageUploadAPIView(generics.CreateAPIView):
 
     def perform_create(self, serializer):
         """Upload an image with authenticated user."""
-        cache_key = f'queryset_{self.request.user.id}'
-        # Get cached queryset
-        queryset = cache.get(cache_key)
+        cache_key = list_cache_key(self.request.user.id)
+        # Get cached pages
+        pages = cache.get(cache_key)
         # Clear cache if exists
-        if queryset:
+        if pages:
             cache.delete(cache_key)
+        # Reject or defer while the thumbnail queue is overloaded
+        deferred = not admit_upload(self.request.user)
+        # Pass authenticated user to the serializer
+        serializer.save(user=self.request.user, deferred=deferred)
+
+
+class ImageBatchUploadAPIView(ImageUploadAPIView):
+    """Upload many images in one multipart request."""
+    serializer_class = ImageBatchUploadSerializer
+
+
+class AsyncImageUploadAPIView(AsyncAPIViewMixin, ImageUploadAPIView):
+    """Upload an image view served without blocking a thread."""
+
+    async def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        await self.perform_create(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    async def perform_create(self, serializer):
+        """Upload an image with authenticated user."""
+        # Clear cached pages
+        await cache.adelete(list_cache_key(self.request.user.id))
+        # Reject or defer while the thumbnail queue is overloaded
+        deferred = not await sync_to_async(admit_upload)(self.request.user)
         # Pass authenticated user to the serializer
-        serializer.save(user=self.request.user)
+        await serializer.asave(user=self.request.user, deferred=deferred)
 
 
 class ImageListAPIView(generics.ListAPIView):
@@ -35,22 +76,50 @@ class ImageListAPIView(generics.ListAPIView):
     serializer_class = ImageListSerializer
     permission_classes = (permissions.IsAuthenticated, DoesUserHaveTier)
     authentication_classes = (authentication.TokenAuthentication,)
+    pagination_class = ImagePagination
 
     def get_queryset(self):
-        """Get authenticated user's images and cache them for 15 minutes."""
-        cache_key = f'queryset_{self.request.user.id}'
-        # Get cached queryset
-        queryset = cache.get(cache_key)
-        # Set cache if not exists
-        if not queryset:
-            queryset = Image.objects.filter(user=self.request.user)\
-                .select_related('user__plan')\
-                .prefetch_related('user__plan__thumbnails')\
-                .prefetch_related('thumbnails')\
-                .prefetch_related('thumbnails__thumbnail_value')\
-                .order_by('-id')
-            cache.set(cache_key, queryset, 10)
-        return queryset
+        """Get authenticated user's images, the page is sliced from it."""
+        return Image.objects.filter(user=self.request.user)\
+            .select_related('user__plan')\
+            .prefetch_related('user__plan__thumbnails')\
+            .prefetch_related(Prefetch(
+                'thumbnails',
+                queryset=ThumbnailImage.objects.filter(
+                    size__in=self.request.user.plan.thumbnails
+                    .values('value'))))\
+            .order_by('-id')
+
+    def list(self, request, *args, **kwargs):
+        """Serialized pages are cached for 10 seconds, not the queryset."""
+        # Pickling a queryset would load every row of the library
+        cache_key = list_cache_key(request.user.id)
+        pages = cache.get(cache_key) or {}
+        url = request.build_absolute_uri()
+        if url in pages:
+            return Response(pages[url])
+        response = super().list(request, *args, **kwargs)
+        pages[url] = response.data
+        cache.set(cache_key, pages, 10)
+        return response
+
+
+class ImageExportAPIView(generics.GenericAPIView):
+    """Download user images and thumbnails as a ZIP archive."""
+    permission_classes = (permissions.IsAuthenticated, DoesUserHaveTier)
+    authentication_classes = (authentication.TokenAuthentication,)
+
+    def get(self, request, *args, **kwargs):
+        """Stream the archive while it is being built."""
+        # Rows are read here, ASGI iterates the body in the event loop
+        # where the ORM is not allowed
+        entries = list(archive_entries(request.user))
+        response = StreamingHttpResponse(
+            stream_zip(entries),
+            content_type='application/zip')
+        response['Content-Disposition'] = \
+            'attachment; filename="images.zip"'
+        return response
 
 
 class ExpiredLinkImageCreateAPIView(generics.CreateAPIView):
@@ -69,6 +138,17 @@ class ExpiredLinkImageCreateAPIView(generics.CreateAPIView):
         }
 
 
+class AsyncExpiredLinkImageCreateAPIView(
+        AsyncAPIViewMixin, ExpiredLinkImageCreateAPIView):
+    """Create en expired link without blocking on the worker."""
+
+    async def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        await serializer.asave()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
 class ExpiredLinkImageRetrieveAPIView(generics.RetrieveAPIView):
     """Retrieve en expired link with a binary image."""
     serializer_class = ExpiredLinkImageSerializer
@@ -90,3 +170,28 @@ class ExpiredLinkImageRetrieveAPIView(generics.RetrieveAPIView):
                 status=status.HTTP_400_BAD_REQUEST)
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
+
+
+class ThumbnailNotificationsAPIView(
+        AsyncAPIViewMixin, generics.GenericAPIView):
+    """Long-poll for thumbnails that became ready."""
+    serializer_class = NotificationQuerySerializer
+    permission_classes = (permissions.IsAuthenticated, DoesUserHaveTier)
+    authentication_classes = (authentication.TokenAuthentication,)
+
+    async def get(self, request, *args, **kwargs):
+        query = self.get_serializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        after = query.validated_data['after']
+        timeout = query.validated_data['timeout']
+        user_id = request.user.id
+        hub = get_hub()
+        # Subscribe before reading, so events published meanwhile wake us up
+        with hub.listen(user_id) as ready:
+            live = timeout > 0 and await hub.subscribe(timeout)
+            events = await sync_to_async(read_events)(user_id, after)
+            if not events and live and await hub.wait(ready, timeout):
+                events = await sync_to_async(read_events)(user_id, after)
+        if not events:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response({'last': events[-1]['id'], 'events': events})